@@ -402,15 +402,12 @@ def resolve_effect_texts(effect_texts: Sequence[str], cfg: Dict[str, Any], cats:
         final_atoms = _cancel_pairwise(final_atoms, a, b, logs)
 
     # 9) простые блокировки "если есть X, то убрать Y"
+    #    и обратная форма "X блокируется любым из Z" (gender_toxin ← cant_sleep / sobriety)
     for br in cfg.get("block_rules", []):
         if "then_block" in br:
             final_atoms = _block_by_presence(final_atoms, br["if_any_of"], br["then_block"], logs, br.get("note", ""))
-
-    # 10) спец-правило: gender_toxin блокируется cant_sleep ИЛИ sobriety (упрощенно)
-    if any(a.kind == "gender_toxin" for a in final_atoms):
-        if any(a.kind in ("cant_sleep", "sobriety") for a in final_atoms):
-            final_atoms = [a for a in final_atoms if a.kind != "gender_toxin"]
-            logs.append(ResolveLog(action="block", details="Ядовито для женщин... подавлено (есть 'невозможно уснуть' или отрезвление)"))
+        elif "then_blocked_by_any_of" in br:
+            final_atoms = _block_by_presence(final_atoms, br["then_blocked_by_any_of"], br["if_any_of"], logs, br.get("note", ""))
 
     # 11) Если мы разворачивали композитные яды:
     # - restore_energy блокирует energy_down
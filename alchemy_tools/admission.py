@@ -0,0 +1,164 @@
+"""
+Admission control for expensive commands (recipe searches).
+
+A search holds a CPU slot for up to its time budget, so searches are admitted
+through one scheduler with a fixed number of slots (by default one per search
+worker) instead of piling onto executor threads:
+
+- each user may have at most `per_user` searches running or queued;
+- at most `max_queue` searches wait; beyond that new ones are refused;
+- a freed slot goes to the waiting search whose user was served least
+  recently (users with nothing running or queued count as never served; ties:
+  oldest first), so one user's burst does not delay the others.
+
+    async with admission.slot(user_id, on_queued=notify):
+        results = await run_search(effect_text)
+
+on_queued(position) is awaited when the search has to wait, so the chat can
+show the queue position. The handlers using it are registered with
+block=False, so cheap commands are dispatched while searches wait or run.
+Runs on the event loop only; no locking.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+DEFAULT_MAX_QUEUE = 20
+DEFAULT_PER_USER = 2
+
+
+class AdmissionRejected(Exception):
+    """The search was refused: the user's limit or the queue is full."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason  # "user_limit" or "queue_full"
+
+
+@dataclass(eq=False)
+class _Ticket:
+    user_id: int
+    seq: int
+    granted: asyncio.Future = field(repr=False)
+
+
+class AdmissionController:
+    def __init__(self, slots: int = 1, max_queue: int = DEFAULT_MAX_QUEUE, per_user: int = DEFAULT_PER_USER) -> None:
+        self.slots = max(1, slots)
+        self.max_queue = max_queue
+        self.per_user = max(1, per_user)
+        self._active = 0
+        self._running: Counter = Counter()
+        self._waiting: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._tick = 0
+        self._last_served: Dict[int, int] = {}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def _order(self) -> List[_Ticket]:
+        """Waiting tickets in the order they will get slots."""
+        last_served = dict(self._last_served)
+        tick = self._tick
+        waiting = list(self._waiting)  # kept in arrival order
+        order = []
+        while waiting:
+            ticket = min(waiting, key=lambda t: (last_served.get(t.user_id, 0), t.seq))
+            waiting.remove(ticket)
+            order.append(ticket)
+            tick += 1
+            last_served[ticket.user_id] = tick
+        return order
+
+    def position(self, ticket: _Ticket) -> int:
+        return self._order().index(ticket) + 1
+
+    def _grant(self, user_id: int) -> None:
+        self._active += 1
+        self._running[user_id] += 1
+        self._tick += 1
+        self._last_served[user_id] = self._tick
+
+    def _forget_if_idle(self, user_id: int) -> None:
+        if not self._running[user_id] and all(t.user_id != user_id for t in self._waiting):
+            self._running.pop(user_id, None)
+            self._last_served.pop(user_id, None)
+
+    def _release(self, user_id: int) -> None:
+        self._active -= 1
+        self._running[user_id] -= 1
+        self._forget_if_idle(user_id)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.slots and self._waiting:
+            ticket = self._order()[0]
+            self._waiting.remove(ticket)
+            if ticket.granted.cancelled():
+                self._forget_if_idle(ticket.user_id)  # its task is unwinding
+                continue
+            self._grant(ticket.user_id)
+            ticket.granted.set_result(None)
+
+    async def _acquire(self, user_id: int, on_queued: Optional[Callable[[int], Awaitable[None]]]) -> None:
+        pending = self._running[user_id] + sum(t.user_id == user_id for t in self._waiting)
+        if pending >= self.per_user:
+            raise AdmissionRejected("user_limit")
+        if self._active < self.slots and not self._waiting:
+            self._grant(user_id)
+            return
+        if len(self._waiting) >= self.max_queue:
+            raise AdmissionRejected("queue_full")
+        ticket = _Ticket(user_id, next(self._seq), asyncio.get_running_loop().create_future())
+        self._waiting.append(ticket)
+        try:
+            if on_queued is not None:
+                await on_queued(self.position(ticket))
+            await ticket.granted
+        except BaseException:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release(user_id)  # granted while being cancelled
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._forget_if_idle(user_id)
+            raise
+
+    @asynccontextmanager
+    async def slot(
+        self, user_id: int, on_queued: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> AsyncIterator[None]:
+        """Hold one slot for the block; raises AdmissionRejected if refused."""
+        await self._acquire(user_id, on_queued)
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+
+_CONTROLLER: Optional[AdmissionController] = None
+
+
+def configure_admission(slots: int) -> AdmissionController:
+    """Create the process-wide controller (ALCHEMY_SEARCH_QUEUE, ALCHEMY_SEARCH_PER_USER)."""
+    global _CONTROLLER
+    _CONTROLLER = AdmissionController(
+        slots=slots,
+        max_queue=int(os.getenv("ALCHEMY_SEARCH_QUEUE", DEFAULT_MAX_QUEUE)),
+        per_user=int(os.getenv("ALCHEMY_SEARCH_PER_USER", DEFAULT_PER_USER)),
+    )
+    return _CONTROLLER
+
+
+def get_admission() -> AdmissionController:
+    if _CONTROLLER is None:
+        return configure_admission(1)
+    return _CONTROLLER
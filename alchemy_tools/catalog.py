@@ -0,0 +1,98 @@
+"""
+Immutable in-memory view of the static catalog tables.
+
+`ingredients`, `properties`, `effects` and `effects_types` are filled from the
+data pack by reset_db.py and only change when it swaps in a new catalog file,
+so they are read once and served from memory; a swapped file is picked up on
+the first lookup after the next check (db_wrapper.CATALOG_CHECK_INTERVAL).
+Only user-scoped tables (user_ingredients, recipes, user_settings) are
+queried at request time.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from alchemy_tools.db_wrapper import connect_db, current_catalog_generation
+
+DB_PATH = "alchemy.db"
+
+# (id, code, ingredient_type, material_analog, name) — same column order as
+# user_ingredients.SQL_SELECT_ALL_INGREDIENTS_BY_USER.
+IngredientRow = Tuple[int, str, str, str, str]
+# (description, effect_type, effect_value, ingredient_order) — same shape as
+# the old get_properties_by_ingredient_id query.
+PropertyRow = Tuple[str, Optional[str], Optional[int], int]
+
+
+@dataclass(frozen=True)
+class Catalog:
+    db_path: str
+    ingredients: Tuple[IngredientRow, ...]
+    id_by_code: Mapping[str, int]
+    code_by_id: Mapping[int, str]
+    name_by_id: Mapping[int, str]
+    properties_by_id: Mapping[int, Tuple[PropertyRow, ...]]
+    generation: object = None  # db_wrapper.current_catalog_generation() when read
+
+
+_CATALOG: Optional[Catalog] = None
+_LOCK = threading.Lock()
+
+
+def _read_catalog(db_path: str, generation) -> Catalog:
+    conn = connect_db(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, code, ingredient_type, material_analog, name FROM ingredients ORDER BY id"
+        )
+        ingredients = tuple(cursor.fetchall())
+        cursor.execute(
+            """
+            SELECT props.ingredient_id, e.description, et."type", et.value, props.ingredient_order
+            FROM properties props
+            join effects e on e.id = props.effect_id
+            left join effects_types et on e.id = et.effect_id
+            ORDER BY props.ingredient_id, props.ingredient_order
+            """
+        )
+        properties: dict[int, list[PropertyRow]] = {}
+        for ingredient_id, description, effect_type, value, order in cursor.fetchall():
+            properties.setdefault(ingredient_id, []).append((description, effect_type, value, order))
+    finally:
+        conn.close()
+
+    return Catalog(
+        db_path=db_path,
+        ingredients=ingredients,
+        id_by_code=MappingProxyType({code: ingredient_id for ingredient_id, code, *_ in ingredients}),
+        code_by_id=MappingProxyType({ingredient_id: code for ingredient_id, code, *_ in ingredients}),
+        name_by_id=MappingProxyType({row[0]: row[4] for row in ingredients}),
+        properties_by_id=MappingProxyType({k: tuple(v) for k, v in properties.items()}),
+        generation=generation,
+    )
+
+
+def get_catalog() -> Catalog:
+    """Return the catalog for the current DB_PATH, loading it on first use or after a swap."""
+    global _CATALOG
+    db_path = str(DB_PATH)
+    generation = current_catalog_generation()
+    catalog = _CATALOG
+    if catalog is not None and catalog.db_path == db_path and catalog.generation == generation:
+        return catalog
+    with _LOCK:
+        if _CATALOG is None or _CATALOG.db_path != db_path or _CATALOG.generation != generation:
+            _CATALOG = _read_catalog(db_path, generation)
+        return _CATALOG
+
+
+def reset_catalog() -> None:
+    """Drop the cached catalog so the next lookup re-reads the database."""
+    global _CATALOG
+    with _LOCK:
+        _CATALOG = None
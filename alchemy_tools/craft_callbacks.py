@@ -0,0 +1,160 @@
+"""
+Stateless callback_data for the /craft flow.
+
+Every /craft button carries the whole partial formula, so any process can
+handle any click without a session lookup and nothing is kept per user:
+
+    cf<op><base64url(args | token ids | checksum)>
+
+- op: "a" ingredient picked (args: page, token id of its CODE1), "e" add
+  effect picked (page, token id), "p" page turned (page), "d" done;
+- page and token ids (indexes into CompiledPack.tokens) are varints of one
+  byte below 128 and two below v5_compile.MAX_TOKEN_IDS, so a full formula
+  fits Telegram's 64-byte limit with plenty to spare;
+- checksum: 4 bytes of blake2b over op and payload, keyed with a digest of the
+  pack's token table, so buttons made for another pack (shifted token ids) or
+  mangled data are rejected instead of decoding to a different formula.
+
+Keyboards encode many buttons at once: take a codec with callback_codec()
+and reuse it, so the pack key is looked up once per keyboard.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from alchemy_tools.v5_compile import MAX_TOKEN_IDS, CompiledPack, get_compiled_pack
+from alchemy_tools.v5_data import derived_table, load_v5_data
+
+CALLBACK_PREFIX = "cf"
+OP_INGREDIENT = "a"
+OP_EFFECT = "e"
+OP_PAGE = "p"
+OP_DONE = "d"
+_ARG_COUNTS = {OP_INGREDIENT: 2, OP_EFFECT: 2, OP_PAGE: 1, OP_DONE: 0}
+CHECKSUM_SIZE = 4
+# Telegram's limit for callback_data, in bytes.
+MAX_CALLBACK_DATA = 64
+
+
+@dataclass(frozen=True)
+class CraftCallback:
+    op: str
+    formula: Tuple[int, ...] = ()  # token ids
+    page: int = 0
+    token: Optional[int] = None  # "a": CODE1 token of the ingredient; "e": the chosen token
+
+
+def _pack_key(compiled: CompiledPack) -> bytes:
+    return hashlib.blake2b("\n".join(compiled.tokens).encode("utf-8"), digest_size=16).digest()
+
+
+def _checksum(key: bytes, op: str, payload: bytes) -> bytes:
+    return hashlib.blake2b(op.encode("ascii") + payload, key=key, digest_size=CHECKSUM_SIZE).digest()
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    if not 0 <= value < MAX_TOKEN_IDS:
+        raise ValueError(f"Значение {value} не помещается в callback_data (максимум {MAX_TOKEN_IDS - 1})")
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(raw: bytes) -> Optional[List[int]]:
+    """Values of a run of varints of at most two bytes, or None if malformed."""
+    values, value, shift = [], 0, 0
+    for byte in raw:
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            values.append(value)
+            value, shift = 0, 0
+            continue
+        shift += 7
+        if shift >= 14:
+            return None
+    return values if shift == 0 else None
+
+
+class CallbackCodec:
+    """Encodes and decodes /craft callback_data for one CompiledPack."""
+
+    def __init__(self, compiled: CompiledPack) -> None:
+        self.compiled = compiled
+        self.key = _pack_key(compiled)
+
+    def encode(self, callback: CraftCallback) -> str:
+        arg_count = _ARG_COUNTS[callback.op]
+        if arg_count == 2 and callback.token is None:
+            raise ValueError(f"Кнопка {callback.op!r} без токена")
+        payload = bytearray()
+        for value in (callback.page, callback.token)[:arg_count] + tuple(callback.formula):
+            _write_varint(payload, value)
+        payload = bytes(payload)
+        blob = base64.urlsafe_b64encode(payload + _checksum(self.key, callback.op, payload)).rstrip(b"=")
+        data = CALLBACK_PREFIX + callback.op + blob.decode("ascii")
+        if len(data) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт")
+        return data
+
+    def decode(self, data: str) -> Optional[CraftCallback]:
+        """The callback a button was encoded with, or None if it is stale or malformed."""
+        if not data.startswith(CALLBACK_PREFIX) or len(data) <= len(CALLBACK_PREFIX):
+            return None
+        op, blob = data[len(CALLBACK_PREFIX)], data[len(CALLBACK_PREFIX) + 1:]
+        arg_count = _ARG_COUNTS.get(op)
+        if arg_count is None:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(blob + "=" * (-len(blob) % 4))
+        except (binascii.Error, ValueError):
+            return None
+        payload, checksum = raw[:-CHECKSUM_SIZE], raw[-CHECKSUM_SIZE:]
+        if len(checksum) < CHECKSUM_SIZE or not hmac.compare_digest(checksum, _checksum(self.key, op, payload)):
+            return None
+        values = _read_varints(payload)
+        if values is None or len(values) < arg_count:
+            return None
+        args, formula = values[:arg_count], tuple(values[arg_count:])
+        if any(token >= len(self.compiled.tokens) for token in formula + tuple(args[1:])):
+            return None
+        return CraftCallback(
+            op=op,
+            formula=formula,
+            page=args[0] if args else 0,
+            token=args[1] if arg_count == 2 else None,
+        )
+
+
+def callback_codec(compiled: Optional[CompiledPack] = None) -> CallbackCodec:
+    """Codec for compiled (default: the current pack's, built once per pack)."""
+    v5 = load_v5_data()
+    current = get_compiled_pack(v5)
+    if compiled is None or compiled is current:
+        return derived_table(v5, "callback_codec", lambda _v5: CallbackCodec(current))
+    return CallbackCodec(compiled)
+
+
+def encode_callback(callback: CraftCallback, compiled: Optional[CompiledPack] = None) -> str:
+    return callback_codec(compiled).encode(callback)
+
+
+def decode_callback(data: str, compiled: Optional[CompiledPack] = None) -> Optional[CraftCallback]:
+    """The callback a button was encoded with, or None if it is stale or malformed."""
+    return callback_codec(compiled).decode(data)
+
+
+def formula_tokens(formula: Sequence[int], compiled: Optional[CompiledPack] = None) -> List[str]:
+    """Token ids -> "CODE1"-style tokens."""
+    compiled = compiled or get_compiled_pack()
+    return [compiled.tokens[token] for token in formula]
+
+
+def token_id(token: str, compiled: Optional[CompiledPack] = None) -> Optional[int]:
+    return (compiled or get_compiled_pack()).token_ids.get(token)
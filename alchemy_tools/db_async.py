@@ -0,0 +1,87 @@
+"""
+Async access to the synchronous SQLite helpers.
+
+All blocking database calls made from bot handlers go through a single
+dedicated thread fed by a queue, so disk I/O never runs on the PTB event loop
+and writes from different users are serialized instead of contending for the
+SQLite file lock.
+
+    rows = await run_db(select_all_ingredients_by_user, user_id)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DBExecutor:
+    """Single worker thread that runs queued callables in submission order."""
+
+    def __init__(self, name: str = "alchemy-db") -> None:
+        self._name = name
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=self._name, daemon=True)
+                self._thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def submit(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> "concurrent.futures.Future[T]":
+        self._ensure_started()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(None)
+        if wait:
+            thread.join()
+
+
+_EXECUTOR = DBExecutor()
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking DB helper on the DB thread and await its result."""
+    return await _EXECUTOR.run(func, *args, **kwargs)
+
+
+def shutdown_db_executor(wait: bool = True) -> None:
+    _EXECUTOR.shutdown(wait=wait)
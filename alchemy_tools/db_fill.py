@@ -3,13 +3,80 @@ import sqlite3
 from pathlib import Path
 import csv
 
+from alchemy_tools.db_setup import migrate
+from alchemy_tools.effects_tools import clear_search_cache, rebuild_effects_fts
+
 DB_PATH = "alchemy.db"
 MATERIAL_TYPES = ["Магические Металлы","Магические Компоненты","Травы"]
 TIER_RANK = {"weak": 1, "medium": 2, "strong": 3, "deadly": 4}
 
+def _write_catalog(conn, ingredients, properties, effect_types) -> None:
+    """
+    Write prepared catalog rows in one transaction.
+
+    - ingredients: [(code, material_analog, ingredient_type, name), ...]
+    - properties: [(code, ingredient_order, effect_text, is_main), ...]
+    - effect_types: {effect_text: (type, value)}
+
+    Rows reference ingredients and effects by code/text; ids are resolved
+    through maps loaded once instead of a SELECT per row. The effects_fts
+    search index is rebuilt in the same transaction.
+    """
+    migrate(conn)
+    with conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO ingredients (code, material_analog, ingredient_type, name) VALUES (?, ?, ?, ?)
+            ON CONFLICT(code) DO UPDATE SET
+                material_analog = excluded.material_analog,
+                ingredient_type = excluded.ingredient_type,
+                name = excluded.name
+            """,
+            ingredients,
+        )
+        cursor.execute("SELECT code, id FROM ingredients")
+        ingredient_ids = dict(cursor.fetchall())
+
+        effect_ids = _load_effect_ids(cursor)
+        wanted = dict.fromkeys(text for _code, _order, text, _is_main in properties)
+        wanted.update(dict.fromkeys(effect_types))
+        missing = [(text,) for text in wanted if text not in effect_ids]
+        if missing:
+            cursor.executemany("INSERT INTO effects (description) VALUES (?)", missing)
+            effect_ids = _load_effect_ids(cursor)
+
+        cursor.executemany(
+            """
+            INSERT INTO effects_types (effect_id, type, value) VALUES (?, ?, ?)
+            ON CONFLICT(effect_id) DO UPDATE SET type = excluded.type, value = excluded.value
+            """,
+            [(effect_ids[text], kind, value) for text, (kind, value) in effect_types.items()],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO properties (ingredient_id, effect_id, ingredient_order, is_main) VALUES (?, ?, ?, ?)
+            ON CONFLICT(ingredient_id, ingredient_order) DO UPDATE SET
+                effect_id = excluded.effect_id,
+                is_main = excluded.is_main
+            """,
+            [
+                (ingredient_ids[code], effect_ids[text], order, bool(is_main))
+                for code, order, text, is_main in properties
+            ],
+        )
+        rebuild_effects_fts(cursor)
+    clear_search_cache()
+
+
+def _load_effect_ids(cursor) -> dict[str, int]:
+    # effects.description is not unique in old databases; the first row wins,
+    # matching the old "SELECT id ... WHERE description = ?" lookups.
+    cursor.execute("SELECT description, MIN(id) FROM effects GROUP BY description")
+    return dict(cursor.fetchall())
+
+
 def fill_ingredients_table(young_alchemy_data):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     old_cols = young_alchemy_data.columns
     rename_map = {}
     _new_cols = ["title","material_analog","main_effect","side_effect","identifier"]
@@ -17,95 +84,41 @@ def fill_ingredients_table(young_alchemy_data):
         rename_map[old_col] = new_col
 
     young_alchemy_data.rename(columns=rename_map,inplace=True)
+    ingredients = {}
+    properties = []
     current_material_type = None
-    current_ingredient = None
-    current_ingredient_id = None
-    for index,row in young_alchemy_data.iterrows():
+    current_code = None
+    ingredient_order = 0
+    for row in young_alchemy_data.to_dict("records"):
         if isinstance(row["material_analog"],str):
             material_analog = row["material_analog"].strip()
             if any(t in material_analog for t in MATERIAL_TYPES):
                 current_material_type = material_analog
-                # young_alchemy_data.at[index,"material_analog"] = None
         if isinstance(row["title"],str):
-            current_ingredient = row["title"].strip()
-            main_effect = row["main_effect"].strip()
-            side_effect = row["side_effect"].strip()
-            identifier = row["identifier"].strip()
+            current_code = row["identifier"].strip()
+            if current_code in ingredients:
+                # The first occurrence of a code wins, as with the old row-by-row loader.
+                current_code = None
+                continue
+            main_effect = row["main_effect"].strip().lower()
+            side_effect = row["side_effect"].strip().lower()
             material_analog = row["material_analog"].strip()
+            ingredients[current_code] = (current_code, material_analog, current_material_type, row["title"].strip())
+            properties.append((current_code, 0, main_effect, True))
+            properties.append((current_code, 1, side_effect, False))
             ingredient_order = 1
-
-            cursor.execute("""
-                SELECT id FROM ingredients WHERE code = ?
-                """,(identifier,))
-            current_ingredient_id = cursor.fetchone()
-            if current_ingredient_id:
-                current_ingredient_id = current_ingredient_id[0]
-                current_ingredient=None
-            else:
-                cursor.execute("""
-                    INSERT INTO ingredients (code,material_analog,ingredient_type,name) VALUES (?,?,?,?)
-                    """,(identifier,material_analog,current_material_type,current_ingredient))
-                conn.commit()
-                current_ingredient_id = cursor.lastrowid
-
-                cursor.execute("""
-                    SELECT id FROM effects WHERE description = ?
-                    """,(main_effect.lower(),))
-                main_effect_id = cursor.fetchone()
-                if main_effect_id:
-                    main_effect_id = main_effect_id[0]
-                else:
-                    cursor.execute("""
-                        INSERT INTO effects (description) VALUES (?)
-                        """,(main_effect.lower(),))
-                    conn.commit()
-                    main_effect_id = cursor.lastrowid
-                
-                cursor.execute("""
-                    SELECT id FROM effects WHERE description = ?
-                    """,(side_effect.lower(),))
-                side_effect_id = cursor.fetchone()
-                if side_effect_id:
-                    side_effect_id = side_effect_id[0]
-                else:
-                    cursor.execute("""
-                        INSERT INTO effects (description) VALUES (?)
-                        """,(side_effect.lower(),))
-                    conn.commit()
-                    side_effect_id = cursor.lastrowid
-                
-                cursor.execute("""
-                    INSERT INTO properties (ingredient_id,effect_id,ingredient_order,is_main) VALUES (?,?,?,?)
-                    """,(current_ingredient_id,main_effect_id,0,True))
-                conn.commit()
-                
-                cursor.execute("""
-                    INSERT INTO properties (ingredient_id,effect_id,ingredient_order,is_main) VALUES (?,?,?,?)
-                    """,(current_ingredient_id,side_effect_id,1,False))
-                conn.commit()
-        elif isinstance(row["side_effect"],str):
-            side_effect = row["side_effect"].strip()
+        elif isinstance(row["side_effect"],str) and current_code is not None:
             ingredient_order = ingredient_order+1
-            cursor.execute("""
-                SELECT id FROM effects WHERE description = ?
-                """,(side_effect.lower(),))
-            side_effect_id = cursor.fetchone()
-            if side_effect_id:
-                side_effect_id = side_effect_id[0]
-            else:
-                cursor.execute("""
-                    INSERT INTO effects (description) VALUES (?)
-                    """,(side_effect.lower(),))
-                conn.commit()
-                side_effect_id = cursor.lastrowid
-                
-            cursor.execute("""
-                INSERT INTO properties (ingredient_id,effect_id,ingredient_order,is_main) VALUES (?,?,?,?)
-                """,(current_ingredient_id,side_effect_id,ingredient_order,False))
-            conn.commit()
-    conn.close()
+            properties.append((current_code, ingredient_order, row["side_effect"].strip().lower(), False))
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        _write_catalog(conn, list(ingredients.values()), properties, {})
+    finally:
+        conn.close()
 
 def user_testing_add_all_ingredients(user_id:int=0):
+    """OBSOLETE: users without user_ingredients rows already get every ingredient (see user_ingredients)."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
@@ -140,6 +153,7 @@ def _load_effect_categories_v4(path: str | Path) -> dict[str, tuple[str, str]]:
 def fill_ingredients_table_v4(
     ingredients_path: str | Path = "ingredients_v4.json",
     categories_path: str | Path = "effect_categories_v4.csv",
+    db_path: str | Path | None = None,
 ):
     """Fill DB from v4 JSON ingredients and effect categories."""
     ingredients_path = Path(ingredients_path)
@@ -149,72 +163,34 @@ def fill_ingredients_table_v4(
     with ingredients_path.open(encoding="utf-8") as handle:
         ingredients = json.load(handle)
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    def get_or_create_effect(effect_text: str) -> int:
-        effect_text = effect_text.strip().lower()
-        cursor.execute("SELECT id FROM effects WHERE description = ?", (effect_text,))
-        row = cursor.fetchone()
-        if row:
-            return row[0]
-        cursor.execute("INSERT INTO effects (description) VALUES (?)", (effect_text,))
-        return cursor.lastrowid
-
+    ingredient_rows = {}
+    properties = []
+    effect_types = {}
     for item in ingredients:
         code = item["code"].strip()
         name = item["name"].strip()
         material = (item.get("material") or "").strip()
-        ingredient_type = ""
-
-        cursor.execute("SELECT id FROM ingredients WHERE code = ?", (code,))
-        row = cursor.fetchone()
-        if row:
-            ingredient_id = row[0]
-        else:
-            cursor.execute(
-                "INSERT INTO ingredients (code, material_analog, ingredient_type, name) VALUES (?, ?, ?, ?)",
-                (code, material, ingredient_type, name),
-            )
-            ingredient_id = cursor.lastrowid
-
-        all_effects = [("main", item["main"])] + [
-            (f"add{idx+1}", eff) for idx, eff in enumerate(item.get("adds", []))
-        ]
+        ingredient_rows.setdefault(code, (code, material, "", name))
 
-        for role, effect_text in all_effects:
-            effect_id = get_or_create_effect(effect_text)
-            kind, tier = categories.get(effect_text.lower(), ("", ""))
+        all_effects = [item["main"]] + list(item.get("adds", []))
+        for ingredient_order, effect_text in enumerate(all_effects):
+            effect_text = effect_text.strip().lower()
+            kind, tier = categories.get(effect_text, ("", ""))
             if kind and kind != "raw":
-                tier_value = TIER_RANK.get(tier)
-                cursor.execute(
-                    "SELECT id FROM effects_types WHERE effect_id = ?",
-                    (effect_id,),
-                )
-                if cursor.fetchone() is None:
-                    cursor.execute(
-                        "INSERT INTO effects_types (effect_id, type, value) VALUES (?, ?, ?)",
-                        (effect_id, kind, tier_value),
-                    )
-
-            ingredient_order = 0 if role == "main" else int(role.replace("add", ""))
-            cursor.execute(
-                "SELECT 1 FROM properties WHERE ingredient_id = ? AND effect_id = ? AND ingredient_order = ?",
-                (ingredient_id, effect_id, ingredient_order),
-            )
-            if cursor.fetchone() is None:
-                cursor.execute(
-                    "INSERT INTO properties (ingredient_id, effect_id, ingredient_order, is_main) VALUES (?, ?, ?, ?)",
-                    (ingredient_id, effect_id, ingredient_order, ingredient_order == 0),
-                )
+                effect_types.setdefault(effect_text, (kind, TIER_RANK.get(tier)))
+            properties.append((code, ingredient_order, effect_text, ingredient_order == 0))
 
-    conn.commit()
-    conn.close()
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        _write_catalog(conn, list(ingredient_rows.values()), properties, effect_types)
+    finally:
+        conn.close()
 
 
 def fill_ingredients_table_v5(
     ingredients_path: str | Path = "alchemy_bot_data_v5/ingredients_v5.json",
     categories_path: str | Path = "alchemy_bot_data_v5/effect_categories_v5.csv",
+    db_path: str | Path | None = None,
 ):
     """
     Fill DB from v5 pack (ingredients_v5.json + effect_categories_v5.csv).
@@ -237,23 +213,11 @@ def fill_ingredients_table_v5(
     if not isinstance(ingredients, dict):
         raise ValueError("v5 ingredients JSON must contain a dict at key 'ingredients'")
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    tier_rank = {"weak": 1, "medium": 2, "strong": 3, "deadly": 4}
-
-    def norm(text: str) -> str:
-        return v5.suppression_mod.normalize_text(text)
-
-    def get_or_create_effect(effect_text: str) -> int:
-        effect_text = norm(effect_text)
-        cursor.execute("SELECT id FROM effects WHERE description = ?", (effect_text,))
-        row = cursor.fetchone()
-        if row:
-            return int(row[0])
-        cursor.execute("INSERT INTO effects (description) VALUES (?)", (effect_text,))
-        return int(cursor.lastrowid)
+    norm = v5.suppression_mod.normalize_text
 
+    ingredient_rows = []
+    properties = []
+    effect_types = {}
     for code, ing in ingredients.items():
         code = (code or "").strip()
         if not code:
@@ -262,21 +226,7 @@ def fill_ingredients_table_v5(
         name = norm(ing.get("name") or "")
         material = norm(ing.get("material") or "")
         ingredient_type = norm(ing.get("ingredient_type") or "")
-
-        cursor.execute("SELECT id FROM ingredients WHERE code = ?", (code,))
-        row = cursor.fetchone()
-        if row:
-            ingredient_id = int(row[0])
-            cursor.execute(
-                "UPDATE ingredients SET name = ?, material_analog = ?, ingredient_type = ? WHERE id = ?",
-                (name, material, ingredient_type, ingredient_id),
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO ingredients (code, material_analog, ingredient_type, name) VALUES (?, ?, ?, ?)",
-                (code, material, ingredient_type, name),
-            )
-            ingredient_id = int(cursor.lastrowid)
+        ingredient_rows.append((code, material, ingredient_type, name))
 
         effects = [
             (0, ing.get("main") or "", True),
@@ -290,30 +240,15 @@ def fill_ingredients_table_v5(
             if not effect_text:
                 continue
 
-            effect_id = get_or_create_effect(effect_text)
-
             cat = cats.get(effect_text) or {}
             kind = (cat.get("kind") or "").strip()
             tier = (cat.get("tier") or "").strip()
-            tier_value = tier_rank.get(tier) if tier else None
-
             if kind and kind != "raw":
-                cursor.execute("SELECT 1 FROM effects_types WHERE effect_id = ?", (effect_id,))
-                if cursor.fetchone() is None:
-                    cursor.execute(
-                        "INSERT INTO effects_types (effect_id, type, value) VALUES (?, ?, ?)",
-                        (effect_id, kind, tier_value),
-                    )
-
-            cursor.execute(
-                "SELECT 1 FROM properties WHERE ingredient_id = ? AND effect_id = ? AND ingredient_order = ?",
-                (ingredient_id, effect_id, ingredient_order),
-            )
-            if cursor.fetchone() is None:
-                cursor.execute(
-                    "INSERT INTO properties (ingredient_id, effect_id, ingredient_order, is_main) VALUES (?, ?, ?, ?)",
-                    (ingredient_id, effect_id, ingredient_order, bool(is_main)),
-                )
-
-    conn.commit()
-    conn.close()
+                effect_types.setdefault(effect_text, (kind, TIER_RANK.get(tier) if tier else None))
+            properties.append((code, ingredient_order, effect_text, is_main))
+
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        _write_catalog(conn, ingredient_rows, properties, effect_types)
+    finally:
+        conn.close()
@@ -1,10 +1,34 @@
+import json
+import os
 import sqlite3
 from pathlib import Path
+from urllib.parse import quote
+
+from alchemy_tools.db_wrapper import refresh_catalog_generation
+
 DB_PATH = Path("./alchemy.db")
 
-def setup_database():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# Static tables rebuilt from the data pack vs. tables holding user state. In
+# the split layout they live in separate files (see db_wrapper.connect_db).
+CATALOG_TABLES = ("effects_fts", "effects_types", "properties", "effects", "ingredients")
+USER_TABLES = ("user_ingredients", "custom_inventories", "recipes", "user_settings", "user_sessions")
+
+
+def _table_columns(cursor, table: str) -> set[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _migration_001_base_schema(cursor) -> None:
+    # Early bot versions (main.ensure_db_tables) created per-user `ingredients`
+    # and `properties` tables with an incompatible layout. Keep their rows
+    # under a *_legacy name instead of silently mixing both schemas.
+    ingredient_cols = _table_columns(cursor, "ingredients")
+    if ingredient_cols and "material_analog" not in ingredient_cols:
+        cursor.execute("ALTER TABLE ingredients RENAME TO ingredients_legacy")
+    property_cols = _table_columns(cursor, "properties")
+    if property_cols and "effect_id" not in property_cols:
+        cursor.execute("ALTER TABLE properties RENAME TO properties_legacy")
 
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS ingredients (
@@ -65,8 +89,340 @@ def setup_database():
             UNIQUE(user_id, ingredient_id)
         )
     """)
-    conn.commit()
-    conn.close()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            max_ingredients INTEGER NOT NULL
+        )
+    """)
+
+
+def _migration_002_lookup_indexes(cursor) -> None:
+    # properties is probed from both sides: by ingredient (code/order lookups,
+    # get_properties_by_ingredient_id) and by effect (effect search joins).
+    # Both indexes carry the remaining join columns so the joins stay index-only.
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_properties_ingredient_order
+        ON properties (ingredient_id, ingredient_order, effect_id, is_main)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_properties_effect
+        ON properties (effect_id, ingredient_id, ingredient_order, is_main)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_effects_types_effect
+        ON effects_types (effect_id, type, value)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_effects_description
+        ON effects (description)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recipes_user
+        ON recipes (user_id, id)
+    """)
+
+
+def _migration_003_catalog_upsert_keys(cursor) -> None:
+    # db_fill writes the catalog with UPSERTs, which need unique conflict
+    # targets. Older fills could leave duplicates behind; keep the first row.
+    cursor.execute("""
+        DELETE FROM properties WHERE id NOT IN (
+            SELECT MIN(id) FROM properties GROUP BY ingredient_id, ingredient_order
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_properties_ingredient_order
+        ON properties (ingredient_id, ingredient_order)
+    """)
+    cursor.execute("""
+        DELETE FROM effects_types WHERE id NOT IN (
+            SELECT MIN(id) FROM effects_types GROUP BY effect_id
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_effects_types_effect
+        ON effects_types (effect_id)
+    """)
+
+
+def _migration_004_default_inventories(cursor) -> None:
+    # Users used to get a row per catalog ingredient on every interaction.
+    # Users holding the full catalog move to the implicit default inventory
+    # (no rows), which also picks up ingredients added to later packs.
+    cursor.execute("""
+        DELETE FROM user_ingredients WHERE user_id IN (
+            SELECT user_id FROM user_ingredients
+            GROUP BY user_id
+            HAVING COUNT(DISTINCT ingredient_id) >= (SELECT COUNT(*) FROM ingredients)
+        )
+        AND (SELECT COUNT(*) FROM ingredients) > 0
+    """)
+
+
+def _migration_005_recipe_keys(cursor) -> None:
+    # Duplicate detection (recipes.recipe_exists) is a single lookup on the
+    # canonical token key plus a digest of the resolved final effects. The
+    # digest depends on the data pack, so it is left NULL here and filled in by
+    # recipes.backfill_recipe_digests at startup.
+    recipe_cols = _table_columns(cursor, "recipes")
+    if "tokens_key" not in recipe_cols:
+        cursor.execute("ALTER TABLE recipes ADD COLUMN tokens_key TEXT")
+    if "effects_digest" not in recipe_cols:
+        cursor.execute("ALTER TABLE recipes ADD COLUMN effects_digest TEXT")
+
+    cursor.execute("SELECT id, ingredient_ids FROM recipes WHERE tokens_key IS NULL")
+    updates = []
+    for recipe_id, ingredient_ids in cursor.fetchall():
+        try:
+            tokens = json.loads(ingredient_ids)
+            # Same canonical form as recipes.recipe_key at this schema version.
+            key = ",".join(sorted(token.strip() for token in tokens))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        updates.append((key, recipe_id))
+    cursor.executemany("UPDATE recipes SET tokens_key = ? WHERE id = ?", updates)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_recipes_user_key_digest
+        ON recipes (user_id, tokens_key, effects_digest)
+    """)
+
+
+def _migration_006_effects_fts(cursor) -> None:
+    # Effect search goes through an FTS5 index (effects_fts) over normalize_key
+    # forms of the pack. Its content depends on the pack, so the index is built
+    # by db_fill and, for older databases, on the first search
+    # (effects_tools._ensure_effects_fts); drop any stale copy here.
+    cursor.execute("DROP TABLE IF EXISTS effects_fts")
+
+
+def _migration_007_user_sessions(cursor) -> None:
+    # Pickled context.user_data per user (see session_store.SQLitePersistence).
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_sessions_updated
+        ON user_sessions (updated_at)
+    """)
+
+
+def _migration_008_session_versions(cursor) -> None:
+    # Sessions carry a row version bumped on every write, so a process can
+    # tell whether its copy is current without trusting wall-clock updated_at
+    # (kept for retention only).
+    if "version" not in _table_columns(cursor, "user_sessions"):
+        cursor.execute("ALTER TABLE user_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+def _migration_009_recipe_digests_in_saved_order(cursor) -> None:
+    # Digests used to be computed from the sorted tokens; they are now computed
+    # in the saved order (the resolver is order-sensitive). Clear them so
+    # recipes.backfill_recipe_digests recomputes them at startup.
+    cursor.execute("UPDATE recipes SET effects_digest = NULL")
+
+
+def _migration_010_custom_inventory_flags(cursor) -> None:
+    # A custom inventory used to be "has user_ingredients rows", so an empty
+    # one could not be told from the default inventory. Users are now flagged
+    # explicitly; everyone with rows today has a custom inventory.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS custom_inventories (
+            user_id INTEGER PRIMARY KEY
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO custom_inventories (user_id)
+        SELECT DISTINCT user_id FROM user_ingredients
+    """)
+
+
+# Ordered list of schema migrations; the position in the list (1-based) is the
+# schema version stored in PRAGMA user_version once the step has been applied.
+MIGRATIONS = [
+    _migration_001_base_schema,
+    _migration_002_lookup_indexes,
+    _migration_003_catalog_upsert_keys,
+    _migration_004_default_inventories,
+    _migration_005_recipe_keys,
+    _migration_006_effects_fts,
+    _migration_007_user_sessions,
+    _migration_008_session_versions,
+    _migration_009_recipe_digests_in_saved_order,
+    _migration_010_custom_inventory_flags,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations to an open connection and return the new schema version."""
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than supported {SCHEMA_VERSION}"
+        )
+    for target_version in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[target_version - 1]
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            # PRAGMA does not accept bound parameters; the value is our own int.
+            cursor.execute(f"PRAGMA user_version = {int(target_version)}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+    return get_schema_version(conn)
+
+
+def drop_tables(conn: sqlite3.Connection, tables) -> None:
+    with conn:
+        for table in tables:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def _attach_read_only(conn: sqlite3.Connection, path, name: str) -> bool:
+    """Attach path as `name` if it is a catalog (has ingredient rows); False otherwise."""
+    if not Path(path).exists():
+        return False
+    uri = "file:" + quote(os.path.abspath(path)) + "?mode=ro"
+    conn.execute(f"ATTACH DATABASE ? AS {name}", (uri,))
+    try:
+        has_rows = conn.execute(f"SELECT 1 FROM {name}.ingredients LIMIT 1").fetchone() is not None
+    except sqlite3.OperationalError:
+        has_rows = False
+    if not has_rows:
+        conn.execute(f"DETACH DATABASE {name}")
+    return has_rows
+
+
+def _hand_over_to_catalog(conn: sqlite3.Connection, catalog_path) -> None:
+    """
+    Drop a user-state database's own catalog tables once catalog_path can
+    replace them. user_ingredients rows are moved to the catalog's ingredient
+    ids by code (a no-op when the catalog kept this file's ids), dropping
+    ingredients the catalog no longer has.
+    """
+    has_own = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'ingredients'"
+    ).fetchone()
+    if has_own is None or not _attach_read_only(conn, catalog_path, "new_catalog"):
+        return
+    try:
+        conn.execute("BEGIN")
+        conn.execute("""
+            CREATE TEMP TABLE moved_user_ingredients AS
+            SELECT ui.user_id, c.id AS ingredient_id
+            FROM user_ingredients ui
+            JOIN main.ingredients m ON m.id = ui.ingredient_id
+            JOIN new_catalog.ingredients c ON c.code = m.code
+        """)
+        conn.execute("DELETE FROM user_ingredients")
+        conn.execute("""
+            INSERT OR IGNORE INTO user_ingredients (user_id, ingredient_id)
+            SELECT user_id, ingredient_id FROM moved_user_ingredients
+        """)
+        conn.execute("DROP TABLE moved_user_ingredients")
+        for table in CATALOG_TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS main.{table}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE new_catalog")
+
+
+def setup_database(db_path=None, catalog_path=None):
+    """
+    Migrate a database to the current schema.
+
+    With catalog_path pointing at a built catalog file, db_path is a
+    user-state database: its own catalog tables are dropped so the attached
+    catalog is used instead.
+    """
+    conn = sqlite3.connect(db_path or DB_PATH, isolation_level=None)
+    try:
+        migrate(conn)
+        if catalog_path is not None:
+            _hand_over_to_catalog(conn, catalog_path)
+    finally:
+        conn.close()
+
+
+def _seed_ingredient_ids(conn: sqlite3.Connection, previous_paths) -> None:
+    # user_ingredients in the user-state file references ingredients by id, so
+    # a rebuilt catalog keeps the id of every code the previous catalog had.
+    # New codes get ids above the previous AUTOINCREMENT sequence, so an id is
+    # never handed to another ingredient. Rows the fill does not touch
+    # (ingredients gone from the pack) are removed by build_catalog_database.
+    for path in previous_paths:
+        if path is not None and _attach_read_only(conn, path, "previous"):
+            break
+    else:
+        return
+    try:
+        conn.execute("BEGIN")
+        conn.execute("""
+            INSERT INTO ingredients (id, code)
+            SELECT id, code FROM previous.ingredients WHERE code IS NOT NULL
+        """)
+        conn.execute("""
+            UPDATE sqlite_sequence SET seq = max(seq, coalesce(
+                (SELECT seq FROM previous.sqlite_sequence WHERE name = 'ingredients'), 0
+            ))
+            WHERE name = 'ingredients'
+        """)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE previous")
+
+
+def build_catalog_database(catalog_path, fill, user_db_path=None) -> None:
+    """
+    Build a catalog file next to catalog_path with fill(db_path) and swap it
+    in atomically. Open immutable readers keep the previous file until they
+    reconnect (see db_wrapper.current_catalog_generation).
+
+    Ingredient ids are kept from the current catalog file or, when there is
+    none yet, from the catalog tables of user_db_path (single-file layout).
+    """
+    catalog_path = Path(catalog_path)
+    tmp_path = catalog_path.with_name(catalog_path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    setup_database(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        _seed_ingredient_ids(conn, (catalog_path, user_db_path))
+    finally:
+        conn.close()
+    fill(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        conn.execute("DELETE FROM ingredients WHERE id NOT IN (SELECT ingredient_id FROM properties)")
+        drop_tables(conn, USER_TABLES)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    tmp_path.replace(catalog_path)
+    refresh_catalog_generation()
+
 
 def add_effects_to_db(effects_df):
     conn = sqlite3.connect(DB_PATH)
@@ -81,4 +437,3 @@ def add_effects_to_db(effects_df):
             """,(effect_id,row["effect_type"],row["effect_value"]))
     conn.commit()
     conn.close()
-
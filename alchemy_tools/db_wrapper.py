@@ -1,17 +1,127 @@
+import functools
+import os
 import sqlite3
+import threading
+import time
 from typing import Callable
+from urllib.parse import quote, urlencode
 
 DB_PATH = "alchemy.db"
+# Static catalog tables (ingredients, properties, effects, effects_types and
+# effects_fts) built by reset_db.py. User-state databases without catalog
+# tables of their own get it attached read-only as the `catalog` schema;
+# unqualified table names resolve to it, so queries need no changes.
+CATALOG_DB_PATH = "catalog.db"
+CATALOG_MMAP_SIZE = 256 * 1024 * 1024
+# Lookups re-check which catalog file is on disk at most this often (seconds);
+# a swap by another process (reset_db.py) is picked up within this delay.
+CATALOG_CHECK_INTERVAL = 1.0
+
+
+def _file_uri(path, **params) -> str:
+    uri = "file:" + quote(os.path.abspath(path))
+    if params:
+        uri += "?" + urlencode(params)
+    return uri
+
+
+def open_catalog_db(path=None) -> sqlite3.Connection:
+    """Open a catalog file read-only and immutable: no locks, no journal, memory-mapped reads."""
+    conn = sqlite3.connect(_file_uri(path or CATALOG_DB_PATH, mode="ro", immutable=1), uri=True)
+    conn.execute(f"PRAGMA mmap_size = {CATALOG_MMAP_SIZE}")
+    return conn
+
+
+def catalog_generation(path=None):
+    """
+    Identity of the catalog file on disk, or None without one. reset_db swaps
+    in a new file, so a change means connections and the in-memory catalog
+    still read the previous one.
+    """
+    try:
+        stat = os.stat(path or CATALOG_DB_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# (path, generation, time.monotonic() of the check)
+_CHECKED_GENERATION = (None, None, 0.0)
+
+
+def current_catalog_generation():
+    """
+    catalog_generation() of CATALOG_DB_PATH as last checked; the file is
+    stat'ed again once CATALOG_CHECK_INTERVAL has passed, not on every lookup.
+    """
+    global _CHECKED_GENERATION
+    path = str(CATALOG_DB_PATH)
+    checked_path, generation, checked_at = _CHECKED_GENERATION
+    now = time.monotonic()
+    if checked_path != path or now - checked_at >= CATALOG_CHECK_INTERVAL:
+        generation = catalog_generation(path)
+        _CHECKED_GENERATION = (path, generation, now)
+    return generation
+
+
+def refresh_catalog_generation() -> None:
+    """Make the next lookup check the catalog file (after swapping it in this process)."""
+    global _CHECKED_GENERATION
+    _CHECKED_GENERATION = (None, None, 0.0)
+
+
+def connect_db(db_path=None, catalog_path=None) -> sqlite3.Connection:
+    """
+    Open the user-state database in WAL mode, attaching the catalog file when
+    the database does not hold the catalog tables itself (split layout).
+    Legacy single-file databases are used as they are.
+    """
+    db_path = str(db_path or DB_PATH)
+    catalog_path = str(catalog_path or CATALOG_DB_PATH)
+    conn = sqlite3.connect(_file_uri(db_path), uri=True)
+    conn.execute("PRAGMA journal_mode = WAL")
+    has_catalog = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingredients'"
+    ).fetchone()
+    if has_catalog is None and os.path.exists(catalog_path):
+        conn.execute("ATTACH DATABASE ? AS catalog", (_file_uri(catalog_path, mode="ro", immutable=1),))
+        conn.execute(f"PRAGMA catalog.mmap_size = {CATALOG_MMAP_SIZE}")
+    return conn
+
+# sqlite3 connections may only be used from the thread that opened them, and
+# decorated functions run both on the event loop thread and on the DB executor
+# thread (see db_async). Keep one lazily opened connection per thread and path,
+# reopened once reset_db has swapped the catalog file it attached.
+_local = threading.local()
+
+
+def thread_connection(db_path=None) -> sqlite3.Connection:
+    """This thread's connection to db_path (default DB_PATH), opened on first use."""
+    db_path = str(db_path or DB_PATH)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    generation = current_catalog_generation()
+    conn, conn_generation = connections.get(db_path, (None, None))
+    if conn is not None and conn_generation != generation:
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = connect_db(db_path)
+        connections[db_path] = (conn, generation)
+    return conn
+
 
 def db_alchemy_wrapper(func) -> Callable:
-    conn = sqlite3.connect(DB_PATH)
-    external_cursor = conn.cursor()
+    @functools.wraps(func)
     def wrapped_func(*args, **kwargs):
-        kwargs["cursor"]=kwargs.get("cursor",external_cursor)
+        cursor = kwargs.get("cursor")
+        if cursor is None:
+            cursor = kwargs["cursor"] = thread_connection().cursor()
         try:
             return func(*args, **kwargs)
         except sqlite3.Error as e:
             print(f"SQLite error: {e}")
-            conn.rollback()
+            cursor.connection.rollback()
             raise e
     return wrapped_func
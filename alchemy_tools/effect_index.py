@@ -0,0 +1,140 @@
+"""
+In-memory n-gram index over effect texts for the selection UI.
+
+Texts are indexed by their normalize_key form with 1-, 2- and 3-grams, so a
+substring query only verifies texts containing all of its grams instead of
+scanning the catalog. Fuzzy lookups use the q-gram lemma to pick candidates
+and Sellers' approximate substring matching to verify them.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+GRAM = 3
+# Shorter queries are within one edit of most texts.
+FUZZY_MIN_LENGTH = 4
+
+
+def _grams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def substring_distance(pattern: str, text: str) -> Tuple[int, int]:
+    """
+    Smallest edit distance between pattern and any substring of text (Sellers).
+
+    Returns (distance, start) where start approximates the matched substring's
+    position in text.
+    """
+    m = len(pattern)
+    if m == 0:
+        return 0, 0
+    # column[i]: distance of pattern[:i] to the best substring ending here.
+    column = list(range(m + 1))
+    best, best_end = column[m], 0
+    for j, char in enumerate(text, start=1):
+        prev_diag, column[0] = column[0], 0
+        for i in range(1, m + 1):
+            cost = 0 if pattern[i - 1] == char else 1
+            prev_diag, column[i] = column[i], min(column[i] + 1, column[i - 1] + 1, prev_diag + cost)
+        if column[m] < best:
+            best, best_end = column[m], j
+    return best, max(best_end - m, 0)
+
+
+class EffectTextIndex:
+    def __init__(self, texts: Iterable[str], normalize_key: Callable[[str], str]) -> None:
+        self.texts: Tuple[str, ...] = tuple(dict.fromkeys(t for t in texts if t))
+        self.keys: Tuple[str, ...] = tuple(normalize_key(t) for t in self.texts)
+        self._normalize_key = normalize_key
+        postings: dict[str, set] = {}
+        for text_id, key in enumerate(self.keys):
+            for n in range(1, GRAM + 1):
+                for gram in _grams(key, n):
+                    postings.setdefault(gram, set()).add(text_id)
+        self._postings = {gram: frozenset(ids) for gram, ids in postings.items()}
+
+    def _candidates(self, query: str) -> frozenset | set:
+        n = min(len(query), GRAM)
+        lists = sorted((self._postings.get(gram, frozenset()) for gram in _grams(query, n)), key=len)
+        if not lists or not lists[0]:
+            return frozenset()
+        return lists[0].intersection(*lists[1:])
+
+    def search(self, query: str, limit: int = 12) -> List[str]:
+        """Texts containing query, ordered by (match position, text length)."""
+        q = self._normalize_key(query)
+        if not q:
+            return []
+        scored = []
+        for text_id in self._candidates(q):
+            pos = self.keys[text_id].find(q)
+            if pos >= 0:
+                text = self.texts[text_id]
+                scored.append(((pos, len(text)), text))
+        scored.sort(key=lambda x: (x[0], x[1].lower()))
+        return [t for _s, t in scored[:limit]]
+
+    def fuzzy_search(self, query: str, limit: int = 12, max_distance: Optional[int] = None) -> List[str]:
+        """
+        Texts containing a substring within max_distance edits of query
+        (default: 1, or 2 for queries of 10+ characters), closest first.
+        """
+        q = self._normalize_key(query)
+        if len(q) < FUZZY_MIN_LENGTH:
+            return []
+        if max_distance is None:
+            max_distance = 1 if len(q) < 10 else 2
+        # q-gram lemma: a match within k edits shares at least len(q) - n + 1 - n*k
+        # of the query's n-grams. Use the longest gram size that still prunes.
+        for n in range(GRAM, 0, -1):
+            threshold = len(q) - n + 1 - n * max_distance
+            if threshold > 0:
+                break
+        else:
+            return []
+        query_grams = {}
+        for offset in range(len(q) - n + 1):
+            query_grams.setdefault(q[offset:offset + n], offset)
+        counts = Counter(text_id for gram in query_grams for text_id in self._postings.get(gram, ()))
+        scored = []
+        for text_id, count in counts.items():
+            if count < threshold:
+                continue
+            best = self._verify(q, self.keys[text_id], query_grams, threshold, max_distance)
+            if best is not None:
+                text = self.texts[text_id]
+                scored.append(((best[0], best[1], len(text)), text))
+        scored.sort(key=lambda x: (x[0], x[1].lower()))
+        return [t for _s, t in scored[:limit]]
+
+    @staticmethod
+    def _verify(q: str, key: str, query_grams: dict, threshold: int, max_distance: int) -> Optional[Tuple[int, int]]:
+        # Each shared gram votes for an alignment (match start); edits spread the
+        # votes of one match over 2*max_distance + 1 alignments. Only clusters
+        # with at least `threshold` votes can hold a match, so the DP runs on a
+        # few short windows around them.
+        votes = Counter()
+        for gram, offset in query_grams.items():
+            pos = key.find(gram)
+            while pos >= 0:
+                votes[pos - offset] += 1
+                pos = key.find(gram, pos + 1)
+        windows = []
+        for start in sorted(votes):
+            support = sum(votes.get(start + d, 0) for d in range(2 * max_distance + 1))
+            if support < threshold:
+                continue
+            lo, hi = max(start - max_distance, 0), start + len(q) + 3 * max_distance
+            if windows and lo <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], hi)
+            else:
+                windows.append([lo, hi])
+        best = None
+        for lo, hi in windows:
+            distance, pos = substring_distance(q, key[lo:hi])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, lo + pos)
+        return best
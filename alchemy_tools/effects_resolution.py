@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Iterable, List, Tuple
 
-from alchemy_tools.effects_tools import get_ingredient_code_by_id
+from alchemy_tools.effects_tools import get_ingredient_codes_and_names
 from alchemy_tools.v5_data import load_v5_data, resolve_tokens
 
 
@@ -33,8 +33,8 @@ def resolve_potion_effects(
     limit = int(max_effects if max_effects is not None else v5.suppression_cfg.get("max_final_effects", 999))
 
     tokens: List[str] = []
-    for ingredient_id, add_index in selections:
-        code = get_ingredient_code_by_id(ingredient_id)
+    resolved = get_ingredient_codes_and_names([ingredient_id for ingredient_id, _ in selections])
+    for (ingredient_id, add_index), (code, _name) in zip(selections, resolved):
         if not code:
             raise ValueError(f"Unknown ingredient_id: {ingredient_id}")
         idx = int(add_index) + 1
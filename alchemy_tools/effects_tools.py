@@ -1,10 +1,28 @@
+import re
 import sqlite3
+import threading
+from collections import OrderedDict
 
-import pandas as pd
-
-from alchemy_tools.db_wrapper import db_alchemy_wrapper
+from alchemy_tools.catalog import get_catalog
+from alchemy_tools.db_wrapper import current_catalog_generation, db_alchemy_wrapper, thread_connection
+from alchemy_tools.user_ingredients import SQL_SELECT_INVENTORY_VERSION, SQL_USER_INVENTORY_FILTER
+from alchemy_tools.v5_data import load_v5_data
 
 DB_PATH = "alchemy.db"
+# Trigram tokens match anywhere inside a word ("ядие" finds "противоядие"),
+# like the LIKE '%q%' scans the index replaced. They need 3+ characters;
+# shorter terms fall back to LIKE over the same normalized columns.
+SQL_CREATE_EFFECTS_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS effects_fts USING fts5(
+    description, type, tokenize = 'trigram'
+)
+"""
+FTS_MIN_TERM = 3
+# Search results keyed by (db, user, query, page, inventory version), so an
+# inventory change simply stops hitting the old entries.
+SEARCH_CACHE_SIZE = 512
+_SEARCH_CACHE: OrderedDict = OrderedDict()
+_SEARCH_CACHE_LOCK = threading.Lock()
 EFFECT_SQL_QUERY = """
 SELECT i.code, e.description, et."type",et.value FROM ingredients AS i
 join properties props on i.id = props.ingredient_id 
@@ -25,154 +43,297 @@ join properties props on i.id = props.ingredient_id
 join effects e on e.id =props.effect_id
 left join effects_types et on e.id =et.effect_id
 """
+EFFECT_ROW_COLUMNS = ["code", "description", "effect_type", "effect_value"]
+
 @db_alchemy_wrapper
 def get_by_code_order(ingredient_code,ingredient_order,cursor):
+    import pandas as pd  # offline tools only; the bot uses the tuple queries
+
     cursor.execute(EFFECT_SQL_QUERY,(ingredient_code,ingredient_order))
     found_effects = cursor.fetchall()
-    found_effects_df =pd.DataFrame(data=found_effects,columns=["code","description","effect_type","effect_value"])
+    found_effects_df =pd.DataFrame(data=found_effects,columns=EFFECT_ROW_COLUMNS)
     return found_effects_df
-def _get_all_effects_for_ingredients(ingredients,ingredients_effects_nums,cursor):
-    all_effects_df=[]
-    for ingredient_code,ingredient_effect_i in zip(ingredients,ingredients_effects_nums):
-        all_effects_df.append(get_by_code_order(ingredient_code=ingredient_code,ingredient_order=ingredient_effect_i,cursor=cursor))
-    for ingredient_code in ingredients:
-        all_effects_df.append(get_by_code_order(ingredient_code=ingredient_code,ingredient_order=0,cursor=cursor))
-    all_effects_df = pd.concat(all_effects_df)
-    return all_effects_df
+
+
+def _formula_lookups(ingredients_with_codes):
+    # Add effects in formula order, then every main effect (one per token,
+    # repeated ingredients included) — the order the suppression engine sees.
+    pairs = [(token[:-1], int(token[-1])) for token in ingredients_with_codes]
+    return pairs + [(code, 0) for code, _order in pairs]
+
+
+@db_alchemy_wrapper
+def get_effect_rows_by_ingredients_with_codes(ingredients_with_codes, cursor):
+    """
+    Effects of a formula such as ["AM1", "KQ2"] in one query.
+
+    Returns (code, description, effect_type, effect_value) tuples, see
+    EFFECT_ROW_COLUMNS.
+    """
+    lookups = _formula_lookups(ingredients_with_codes)
+    if not lookups:
+        return []
+    values = ", ".join(["(?, ?, ?)"] * len(lookups))
+    params = [value for pos, (code, order) in enumerate(lookups) for value in (pos, code, order)]
+    cursor.execute(
+        f"""
+        WITH wanted(pos, code, ingredient_order) AS (VALUES {values})
+        SELECT i.code, e.description, et."type", et.value FROM wanted w
+        join ingredients i on i.code = w.code
+        join properties props on i.id = props.ingredient_id and props.ingredient_order = w.ingredient_order
+        join effects e on e.id = props.effect_id
+        left join effects_types et on e.id = et.effect_id
+        ORDER BY w.pos
+        """,
+        params,
+    )
+    return cursor.fetchall()
+
+
 @db_alchemy_wrapper
 def get_by_ingredients_with_codes(ingredients_with_codes,cursor):
-    ingredients = [x[:-1] for x in ingredients_with_codes]
-    ingredients_effects_nums = [int(x[-1]) for x in ingredients_with_codes]
-    return _get_all_effects_for_ingredients(ingredients,ingredients_effects_nums,cursor)
+    """DataFrame adapter over get_effect_rows_by_ingredients_with_codes."""
+    import pandas as pd
+
+    rows = get_effect_rows_by_ingredients_with_codes(ingredients_with_codes, cursor=cursor)
+    return pd.DataFrame(data=rows, columns=EFFECT_ROW_COLUMNS)
 
 def get_properties_by_ingredient_id(ingredient_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-     SELECT  e.description, et."type",et.value, props.ingredient_order FROM ingredients AS i
-    join properties props on i.id = props.ingredient_id 
-    join effects e on e.id =props.effect_id
-    left join effects_types et on e.id =et.effect_id
-    where i.id =?
-    """, (ingredient_id,))
-    properties = cursor.fetchall()
-    conn.close()
-    return properties
+    return list(get_catalog().properties_by_id.get(ingredient_id, ()))
+
+UNKNOWN_INGREDIENT_NAME = "Неизвестный ингредиент"
+
 
 def get_ingredient_name_by_id(ingredient_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM ingredients WHERE id = ?", (ingredient_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else "Неизвестный ингредиент"
+    return get_catalog().name_by_id.get(ingredient_id, UNKNOWN_INGREDIENT_NAME)
 
 
 def get_ingredient_code_by_id(ingredient_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT code FROM ingredients WHERE id = ?", (ingredient_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    return get_catalog().code_by_id.get(ingredient_id)
+
+
+def get_ingredient_codes_and_names(ingredient_ids):
+    """[(code or None, name), ...] for ingredient_ids, resolved against one catalog."""
+    catalog = get_catalog()
+    code_by_id, name_by_id = catalog.code_by_id, catalog.name_by_id
+    return [(code_by_id.get(i), name_by_id.get(i, UNKNOWN_INGREDIENT_NAME)) for i in ingredient_ids]
 
 def get_all_properties_by_ingredient_id(ingredient_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-       SELECT i.code, e.description, et."type",et.value FROM ingredients AS i
-    join properties props on i.id = props.ingredient_id 
-    join effects e on e.id =props.effect_id
-    left join effects_types et on e.id =et.effect_id
-    where i.id =? and props.ingredient_order =0
-    """, (ingredient_id,))
-    main_property = cursor.fetchone()
-
-    cursor.execute("""
-        SELECT i.code, e.description, et."type",et.value FROM ingredients AS i
-    join properties props on i.id = props.ingredient_id 
-    join effects e on e.id =props.effect_id
-    left join effects_types et on e.id =et.effect_id
-    where i.id =? and props.ingredient_order !=0
-    """, (ingredient_id,))
-    additional_properties = cursor.fetchall()
-
-    conn.close()
+    catalog = get_catalog()
+    code = catalog.code_by_id.get(ingredient_id)
+    main_property = None
+    additional_properties = []
+    for description, effect_type, value, order in catalog.properties_by_id.get(ingredient_id, ()):
+        row = (code, description, effect_type, value)
+        if order == 0:
+            main_property = main_property or row
+        else:
+            additional_properties.append(row)
     return main_property, additional_properties
-@db_alchemy_wrapper
-def get_ingredient_id(ingredient_code,cursor)->int:
-
-    cursor.execute("""
-    SELECT
-	    i.id
-    FROM
-        ingredients AS i
-    where
-        i.code = ?
-	""",(ingredient_code,))
-    ingredient_id=cursor.fetchone()[0]
+
+def get_ingredient_id(ingredient_code)->int:
+    ingredient_id = get_catalog().id_by_code.get(ingredient_code)
+    if ingredient_id is None:
+        raise ValueError(f"Unknown ingredient code: {ingredient_code}")
     return ingredient_id
 
 
-def search_effects_by_description(query: str, user_id: int, limit: int = 1000):
-    """Search effects by partial text and return matching effects with ingredient role details."""
-    query = query.strip().lower()
-    if not query:
-        return []
+def _normalize_search_text(text) -> str:
+    return load_v5_data().suppression_mod.normalize_key(text or "")
+
+
+def rebuild_effects_fts(cursor) -> None:
+    """
+    (Re)build the effects_fts full-text index from effects/effects_types.
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    Rows are indexed by effect id in their normalize_key form (Python
+    lowercasing folds Cyrillic, SQLite's LOWER does not).
+    """
+    cursor.execute(SQL_CREATE_EFFECTS_FTS)
+    cursor.execute("DELETE FROM effects_fts")
     cursor.execute(
         """
-        SELECT e.description, et."type", et.value, i.name, i.code, p.ingredient_order, p.is_main
+        SELECT e.id, e.description, group_concat(et."type", ' ')
         FROM effects e
-        JOIN properties p ON e.id = p.effect_id
-        JOIN ingredients i ON i.id = p.ingredient_id
-        JOIN user_ingredients ui ON ui.ingredient_id = i.id
         LEFT JOIN effects_types et ON e.id = et.effect_id
-        WHERE ui.user_id = ?
-          AND (LOWER(e.description) LIKE ? OR LOWER(et."type") LIKE ?)
-        ORDER BY e.description, i.name
-        LIMIT ?
-        """,
-        (user_id, f"%{query}%", f"%{query}%", limit),
+        GROUP BY e.id
+        """
+    )
+    cursor.executemany(
+        "INSERT INTO effects_fts (rowid, description, type) VALUES (?, ?, ?)",
+        [
+            (effect_id, _normalize_search_text(description), _normalize_search_text(effect_type))
+            for effect_id, description, effect_type in cursor.fetchall()
+        ],
     )
-    rows = cursor.fetchall()
-    conn.close()
+
+
+def _table_sql(conn, schema: str, name: str) -> str | None:
+    try:
+        row = conn.execute(
+            f"SELECT sql FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # no attached catalog
+    return row[0] if row is not None else None
+
+
+def _ensure_effects_fts(conn) -> bool:
+    """
+    Make sure a trigram effects_fts exists next to the effects it indexes;
+    False if only the LIKE fallback can be used.
+
+    Only a legacy single-file database (effects in main) gets the index built
+    here. A split catalog is read-only and is built with its index
+    (build_catalog_database); a copy in the user database would shadow it, as
+    unqualified names resolve to main first, so such a copy is dropped.
+    """
+    if _table_sql(conn, "main", "effects") is None:
+        if _table_sql(conn, "main", "effects_fts") is not None:
+            with conn:
+                conn.execute("DROP TABLE main.effects_fts")
+        sql = _table_sql(conn, "catalog", "effects_fts")
+        # An older catalog without a trigram index only gets LIKE scans.
+        return sql is not None and "trigram" in sql
+    sql = _table_sql(conn, "main", "effects_fts")
+    if sql is not None and "trigram" in sql:
+        return True
+    # Databases filled before the index existed (or with the older word
+    # index) get it (re)built on first search.
+    try:
+        with conn:
+            if sql is not None:
+                conn.execute("DROP TABLE main.effects_fts")
+            rebuild_effects_fts(conn.cursor())
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def _search_terms(query: str) -> list[str]:
+    return re.findall(r"\w+", _normalize_search_text(query))
+
+
+def _fts_match_query(query: str, column: str | None = None) -> str | None:
+    """Trigram MATCH expression requiring every word of the query, e.g. '"сильн" "яд"'."""
+    terms = _search_terms(query)
+    if not terms or min(map(len, terms)) < FTS_MIN_TERM:
+        return None
+    prefix = f"{column} : " if column else ""
+    return " ".join(f'{prefix}"{term}"' for term in terms)
+
+
+def _effects_condition(query: str, use_fts: bool, column: str | None = None):
+    """
+    (where, rank, params) selecting matching effects_fts rows: a trigram MATCH
+    ranked by bm25, or a LIKE scan of the normalized columns ranked by the
+    number of columns each term was found in. None for an empty query.
+
+    Trigrams cannot match terms shorter than FTS_MIN_TERM (3) characters, so
+    a query with any such term (e.g. "яд") scans every effect with LIKE; the
+    effects table is small enough that no prefix index is kept for this.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return None
+    match = _fts_match_query(query, column) if use_fts else None
+    if match is not None:
+        return "effects_fts MATCH ?", "rank", [match]
+    columns = [column] if column else ["description", "type"]
+    where, rank, where_params, rank_params = [], [], [], []
+    for term in terms:
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        checks = [f"coalesce({col}, '') LIKE ? ESCAPE '\\'" for col in columns]
+        where.append("(" + " OR ".join(checks) + ")")
+        rank.extend(f"({check})" for check in checks)
+        where_params.extend([pattern] * len(columns))
+        rank_params.extend([pattern] * len(columns))
+    return " AND ".join(where), "-(" + " + ".join(rank) + ")", rank_params + where_params
+
+
+def clear_search_cache() -> None:
+    with _SEARCH_CACHE_LOCK:
+        _SEARCH_CACHE.clear()
+
+
+def search_effects_by_description(query: str, user_id: int, limit: int = 1000, offset: int = 0):
+    """
+    Full-text search over effect descriptions and types.
+
+    Returns rows (description, type, value, ingredient name, code, order, is_main)
+    for a page of matching effects ordered by rank; limit/offset count effects,
+    not rows. Only effects available in the user's inventory are returned.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+
+    # Runs on the DB thread: reuse its connection instead of reopening one.
+    conn = thread_connection(DB_PATH)
+    inventory_version = conn.execute(SQL_SELECT_INVENTORY_VERSION, (user_id, user_id)).fetchone()
+    key = (DB_PATH, current_catalog_generation(), user_id, tuple(terms), limit, offset, inventory_version)
+    with _SEARCH_CACHE_LOCK:
+        rows = _SEARCH_CACHE.get(key)
+        if rows is not None:
+            _SEARCH_CACHE.move_to_end(key)
+            return list(rows)
+
+    where, rank, params = _effects_condition(query, _ensure_effects_fts(conn))
+    rows = conn.execute(
+        f"""
+            WITH matches AS (
+                SELECT rowid AS effect_id, {rank} AS rank FROM effects_fts WHERE {where}
+            ),
+            page AS (
+                SELECT m.effect_id, m.rank FROM matches m
+                WHERE EXISTS (
+                    SELECT 1 FROM properties p
+                    JOIN ingredients i ON i.id = p.ingredient_id
+                    WHERE p.effect_id = m.effect_id AND """ + SQL_USER_INVENTORY_FILTER + """
+                )
+                ORDER BY m.rank, m.effect_id
+                LIMIT ? OFFSET ?
+            )
+            SELECT e.description, et."type", et.value, i.name, i.code, p.ingredient_order, p.is_main
+            FROM page
+            JOIN effects e ON e.id = page.effect_id
+            JOIN properties p ON e.id = p.effect_id
+            JOIN ingredients i ON i.id = p.ingredient_id
+            LEFT JOIN effects_types et ON e.id = et.effect_id
+            WHERE """ + SQL_USER_INVENTORY_FILTER + """
+            ORDER BY page.rank, page.effect_id, i.name
+            """,
+        (*params, user_id, user_id, limit, offset, user_id, user_id),
+    ).fetchall()
+
+    with _SEARCH_CACHE_LOCK:
+        _SEARCH_CACHE[key] = tuple(rows)
+        if len(_SEARCH_CACHE) > SEARCH_CACHE_SIZE:
+            _SEARCH_CACHE.popitem(last=False)
     return rows
 
 
 def find_tokens_by_effect_query(query: str, user_id: int | None = None):
-    """Return selection tokens (e.g. 'RK1') for effects matching query."""
-    query = query.strip().lower()
-    if not query:
+    """Return selection tokens (e.g. 'RK1') for effects whose description matches query."""
+    conn = thread_connection(DB_PATH)
+    condition = _effects_condition(query, _ensure_effects_fts(conn), column="description")
+    if condition is None:
         return []
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    base_sql = """
-        SELECT i.code, p.ingredient_order, e.description
-        FROM effects e
-        JOIN properties p ON e.id = p.effect_id
+    where, _rank, params = condition
+    sql = f"""
+        SELECT i.code, p.ingredient_order
+        FROM effects_fts
+        JOIN properties p ON p.effect_id = effects_fts.rowid
         JOIN ingredients i ON i.id = p.ingredient_id
+        WHERE {where}
     """
-    if user_id is None:
-        sql = base_sql + " WHERE LOWER(e.description) LIKE ?"
-        params = (f"%{query}%",)
-    else:
-        sql = base_sql + """
-            JOIN user_ingredients ui ON ui.ingredient_id = i.id
-            WHERE ui.user_id = ? AND LOWER(e.description) LIKE ?
-        """
-        params = (user_id, f"%{query}%",)
-
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
-    conn.close()
+    if user_id is not None:
+        sql += " AND " + SQL_USER_INVENTORY_FILTER
+        params = [*params, user_id, user_id]
+    rows = conn.execute(sql, params).fetchall()
 
     tokens = set()
-    for code, ingredient_order, _desc in rows:
+    for code, ingredient_order in rows:
         if ingredient_order == 0:
             tokens.update({f"{code}1", f"{code}2", f"{code}3"})
         else:
@@ -1,14 +1,23 @@
-from effect_suppression import MAX_EFFECTS, suppress_effect_texts
+from effect_suppression import max_effects, suppress_effect_texts
 from .db_wrapper import db_alchemy_wrapper
-from .effects_tools import get_by_ingredients_with_codes
+from .effects_tools import get_effect_rows_by_ingredients_with_codes
 
 
-def evaluate_effects(all_effects_df):
-    effect_texts = all_effects_df["description"].tolist()
-    result = suppress_effect_texts(effect_texts, max_effects=MAX_EFFECTS)
+def _effect_texts(all_effects):
+    # Effect rows as (code, description, ...) tuples or a DataFrame with a
+    # "description" column.
+    if hasattr(all_effects, "columns"):
+        return all_effects["description"].tolist()
+    return [row[1] for row in all_effects]
+
+
+def evaluate_effects(all_effects):
+    effect_texts = _effect_texts(all_effects)
+    limit = max_effects()
+    result = suppress_effect_texts(effect_texts, max_effects=limit)
     if not result.valid:
         return -1000
-    return MAX_EFFECTS - result.effect_count
+    return limit - result.effect_count
 def calculate_score_by_formula(formula,cursor):
-    all_effects_df = get_by_ingredients_with_codes(formula,cursor=cursor)
-    return evaluate_effects(all_effects_df)
+    all_effects = get_effect_rows_by_ingredients_with_codes(formula,cursor=cursor)
+    return evaluate_effects(all_effects)
@@ -1,8 +1,8 @@
-import pandas as pd
 from collections import Counter
 from .db_wrapper import db_alchemy_wrapper
 from .effects_tools import SELECT_ALL_EFFECTS
 from .evaluate_ingredients import calculate_score_by_formula
+from .user_ingredients import has_custom_inventory
 from .utils import split_formula
 
 SELECT_ALL_EFFECTS_BY_USER="""
@@ -26,15 +26,24 @@ where
 	ui.user_id = {user_id}
 """
 ## where et."type" is not Null
+ALL_EFFECTS_COLUMNS = ["code","ingredient_order","description","effect_type","effect_value"]
+
+
+def _effect_rows(all_ingredients_effects):
+    # (code, ingredient_order, description, effect_type, effect_value) tuples;
+    # DataFrames with ALL_EFFECTS_COLUMNS are still accepted from notebooks.
+    if hasattr(all_ingredients_effects, "columns"):
+        return list(all_ingredients_effects[ALL_EFFECTS_COLUMNS].itertuples(index=False, name=None))
+    return all_ingredients_effects
 
 
 def _all_tokens(all_ingredients_effects):
     tokens = set()
-    for _, row in all_ingredients_effects.iterrows():
-        order = int(row["ingredient_order"])
+    for code, order, *_ in _effect_rows(all_ingredients_effects):
+        order = int(order)
         if order == 0:
             continue
-        tokens.add(f"{row['code']}{order}")
+        tokens.add(f"{code}{order}")
     return sorted(tokens)
 
 
@@ -60,31 +69,31 @@ def potential_candidates_codes_generator(all_ingredients_effects, formula, posit
 
 @db_alchemy_wrapper
 def potential_candidates_with_max_score_one_step(all_ingredients_effects,formula,cursor,only_max_score=True):
+    """Score every allowed next token; returns [(token, score), ...] best first."""
     potential_candidates_codes = potential_candidates_codes_generator(all_ingredients_effects,formula)
     if len(potential_candidates_codes)==0:
         potential_candidates_codes=_all_tokens(all_ingredients_effects)
     potential_candidates_scores=[]
     for potential_candidate_code in potential_candidates_codes:
         potential_candidates_scores.append(calculate_score_by_formula(formula+[potential_candidate_code],cursor=cursor))
-    potential_candidates_scores_df = pd.DataFrame(data={"code":potential_candidates_codes,"score":potential_candidates_scores})
-    potential_candidates_scores_df = potential_candidates_scores_df.sort_values(by="score",ascending=False)
-    max_score = potential_candidates_scores_df["score"].max()
-    if only_max_score:
-        potential_candidates_scores_df=potential_candidates_scores_df[potential_candidates_scores_df["score"]==max_score]
-    return potential_candidates_scores_df
+    scored = sorted(zip(potential_candidates_codes,potential_candidates_scores),key=lambda item: item[1],reverse=True)
+    if only_max_score and scored:
+        max_score = scored[0][1]
+        scored = [item for item in scored if item[1]==max_score]
+    return scored
 
 @db_alchemy_wrapper
 def potential_candidates_with_max_score_several_steps(formula,cursor,steps=1,only_max_score=True, all_ingredients_effects=None, user_id=None):
     if all_ingredients_effects is None:
-        if user_id is None:
+        # Default-inventory users own the whole catalog.
+        if user_id is None or not has_custom_inventory(user_id):
             cursor.execute(SELECT_ALL_EFFECTS)
         else:
             cursor.execute(SELECT_ALL_EFFECTS_BY_USER.format(user_id=user_id))
         all_ingredients_effects = cursor.fetchall()
-        all_ingredients_effects = pd.DataFrame(data=all_ingredients_effects, columns=["code","ingredient_order","description","effect_type","effect_value"])
 
     result = set()
-    step_candidates = potential_candidates_with_max_score_one_step(all_ingredients_effects,formula,only_max_score=only_max_score)["code"].values.tolist()
+    step_candidates = [code for code, _score in potential_candidates_with_max_score_one_step(all_ingredients_effects,formula,only_max_score=only_max_score)]
     formulas = [formula+[x] for x in step_candidates]
     formulas = set([frozenset(x) for x in formulas])
     if steps >0:
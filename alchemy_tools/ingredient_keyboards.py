@@ -0,0 +1,189 @@
+"""
+Paginated ingredient keyboards and prebuilt /list_ingredients pages.
+
+A /craft keyboard depends on the user's inventory and on the partial formula
+its buttons carry (see craft_callbacks). The formula changes on every click,
+so only the inventory part is cached: its button list (ingredient id, name,
+CODE1 token id) is built once per (catalog, pack, inventory version) and
+shared by every user in the same state; default-inventory users all share
+version (0, 0, 0). The shown page is rendered from that list on the event loop
+(ingredient_page), encoding the formula into its ~20 buttons only.
+
+The /list_ingredients pages are rendered once per (pack version, inventory
+version). A click costs one inventory-version query on the DB thread.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from alchemy_tools.catalog import get_catalog
+from alchemy_tools.craft_callbacks import (
+    OP_DONE,
+    OP_INGREDIENT,
+    OP_PAGE,
+    CallbackCodec,
+    CraftCallback,
+    callback_codec,
+)
+from alchemy_tools.user_ingredients import get_inventory_version, select_all_ingredients_by_user
+from alchemy_tools.v5_compile import CompiledPack
+from alchemy_tools.v5_data import load_v5_data
+
+INGREDIENTS_PAGE_SIZE = 20
+KEYBOARD_CACHE_SIZE = 256
+LIST_CALLBACK_PREFIX = "inglist_"
+# Telegram rejects messages longer than 4096 characters.
+LIST_PAGE_CHARS = 3800
+
+RESET_CALLBACK = "reset"
+
+_PAGES: OrderedDict = OrderedDict()
+_PAGES_LOCK = threading.Lock()
+
+
+def _actions_row(formula: Tuple[int, ...], codec: CallbackCodec) -> list:
+    return [
+        InlineKeyboardButton("Сбросить всё", callback_data=RESET_CALLBACK),
+        InlineKeyboardButton("Закончить подбор", callback_data=codec.encode(CraftCallback(OP_DONE, formula))),
+    ]
+
+
+def full_formula_keyboard(formula: Tuple[int, ...], compiled: Optional[CompiledPack] = None) -> InlineKeyboardMarkup:
+    """Shown once the formula is full."""
+    return InlineKeyboardMarkup([_actions_row(formula, callback_codec(compiled))])
+
+
+# (ingredient id, name, CODE1 token id)
+IngredientItem = Tuple[int, str, int]
+
+
+def ingredient_items(ingredients: Iterable[tuple], compiled: Optional[CompiledPack] = None) -> Tuple[IngredientItem, ...]:
+    """Button list for (id, code, type, material, name) rows, skipping codes the pack does not know."""
+    token_ids = (compiled or callback_codec().compiled).token_ids
+    return tuple(
+        (ingredient_id, name, token_ids[f"{code}1"])
+        for ingredient_id, code, _type, _material, name in ingredients
+        if f"{code}1" in token_ids
+    )
+
+
+def ingredient_page(items: Sequence[IngredientItem], formula: Tuple[int, ...] = (),
+                    exhausted: FrozenSet[int] = frozenset(), page: int = 0, page_size: int = INGREDIENTS_PAGE_SIZE,
+                    codec: Optional[CallbackCodec] = None) -> InlineKeyboardMarkup:
+    """Page `page` (clamped) of the keyboard over items for a partial formula, skipping exhausted ids."""
+    codec = codec or callback_codec()
+    shown = [item for item in items if item[0] not in exhausted]
+    count = max(1, -(-len(shown) // page_size))
+    number = min(max(page, 0), count - 1)
+
+    def callback(op: str, page: int, token: Optional[int] = None) -> str:
+        return codec.encode(CraftCallback(op, formula, page=page, token=token))
+
+    rows = [
+        [InlineKeyboardButton(name, callback_data=callback(OP_INGREDIENT, number, token))]
+        for _ingredient_id, name, token in shown[number * page_size:(number + 1) * page_size]
+    ]
+    nav = []
+    if number > 0:
+        nav.append(InlineKeyboardButton(f"◀ {number}/{count}", callback_data=callback(OP_PAGE, number - 1)))
+    if number + 1 < count:
+        nav.append(InlineKeyboardButton(f"{number + 2}/{count} ▶", callback_data=callback(OP_PAGE, number + 1)))
+    if nav:
+        rows.append(nav)
+    rows.append(_actions_row(formula, codec))
+    return InlineKeyboardMarkup(rows)
+
+
+def _ingredient_block(row: tuple, ingredient_db: dict) -> str:
+    _ingredient_id, code, ingredient_type, material_analog, name = row
+    text = f"{code}: {name}\n Тип: {ingredient_type}| Материальный аналог {material_analog}\n"
+    ing = ingredient_db.get(code) or {}
+    main_eff = (ing.get("main") or "").strip()
+    adds = [a for a in (ing.get("add1", ""), ing.get("add2", ""), ing.get("add3", "")) if (a or "").strip()]
+    if main_eff or adds:
+        text += "Эффекты:\n"
+        if main_eff:
+            text += f"Основной: {main_eff}\n"
+        for i, eff in enumerate(adds[:3], start=1):
+            text += f"{i}: {eff}\n"
+    return text + "\n"
+
+
+def _list_nav(number: int, count: int) -> InlineKeyboardMarkup | None:
+    nav = []
+    if number > 0:
+        nav.append(InlineKeyboardButton(f"◀ {number}/{count}", callback_data=f"{LIST_CALLBACK_PREFIX}{number - 1}"))
+    if number + 1 < count:
+        nav.append(InlineKeyboardButton(f"{number + 2}/{count} ▶", callback_data=f"{LIST_CALLBACK_PREFIX}{number + 1}"))
+    return InlineKeyboardMarkup([nav]) if nav else None
+
+
+def build_ingredient_list_pages(ingredients: Iterable[tuple], ingredient_db: dict,
+                                page_chars: int = LIST_PAGE_CHARS) -> Tuple[Tuple[str, InlineKeyboardMarkup | None], ...]:
+    """(text, navigation keyboard) pages; ingredients are never split across pages."""
+    header = "Ваши ингредиенты:\n"
+    chunks: list[str] = []
+    current = ""
+    for row in ingredients:
+        block = _ingredient_block(row, ingredient_db)
+        if current and len(header) + len(current) + len(block) > page_chars:
+            chunks.append(current)
+            current = ""
+        current += block[:page_chars - len(header)]
+        if len(header) + len(current) >= page_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    if not chunks:
+        return ()
+    return tuple(
+        ((header if number == 0 else f"Ваши ингредиенты ({number + 1}/{len(chunks)}):\n") + chunk.rstrip("\n"),
+         _list_nav(number, len(chunks)))
+        for number, chunk in enumerate(chunks)
+    )
+
+
+def _cached(key: tuple, catalog, build):
+    with _PAGES_LOCK:
+        entry = _PAGES.get(key)
+        if entry is not None and entry[0] is catalog:
+            _PAGES.move_to_end(key)
+            return entry[1]
+    pages = build()
+    with _PAGES_LOCK:
+        _PAGES[key] = (catalog, pages)
+        if len(_PAGES) > KEYBOARD_CACHE_SIZE:
+            _PAGES.popitem(last=False)
+    return pages
+
+
+def user_ingredient_items(user_id: int) -> Tuple[IngredientItem, ...]:
+    """The user's ingredient button list, shared per inventory version. Blocking: run via run_db."""
+    catalog = get_catalog()
+    codec = callback_codec()
+    key = ("items", catalog.db_path, codec.key, get_inventory_version(user_id))
+    return _cached(key, catalog, lambda: ingredient_items(select_all_ingredients_by_user(user_id), codec.compiled))
+
+
+def ingredient_list_page(user_id: int, page: int = 0) -> Tuple[str, InlineKeyboardMarkup | None] | None:
+    """
+    Page `page` (clamped) of the user's /list_ingredients text with its
+    navigation keyboard, or None for an empty inventory. Blocking: run via run_db.
+    """
+    catalog = get_catalog()
+    v5 = load_v5_data()
+    key = ("list", catalog.db_path, v5.version, get_inventory_version(user_id))
+    pages = _cached(
+        key,
+        catalog,
+        lambda: build_ingredient_list_pages(select_all_ingredients_by_user(user_id), v5.ingredient_db),
+    )
+    if not pages:
+        return None
+    return pages[min(max(page, 0), len(pages) - 1)]
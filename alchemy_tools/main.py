@@ -1,11 +1,10 @@
 import os
+import io
+import json
+import tempfile
 from collections import Counter
 from pathlib import Path
 import asyncio
-from alchemy_tools.find_ingredients import (
-    potential_candidates_with_max_score_several_steps,
-)
-import sqlite3
 import logging
 
 from telegram.error import Conflict, BadRequest, TimedOut, NetworkError
@@ -25,27 +24,57 @@ from telegram.ext import (
     filters
 )
 
-from alchemy_tools.db_fill import user_testing_add_all_ingredients
+from alchemy_tools.catalog import get_catalog
+from alchemy_tools.db_async import run_db, shutdown_db_executor
+from alchemy_tools.db_setup import setup_database
 from alchemy_tools.effects_tools import (
     get_all_properties_by_ingredient_id,
     get_ingredient_code_by_id,
-    get_ingredient_name_by_id,
+    get_ingredient_codes_and_names,
     get_properties_by_ingredient_id,
-    get_by_ingredients_with_codes,
     get_ingredient_id,
     search_effects_by_description,
     find_tokens_by_effect_query,
 )
 from alchemy_tools.effects_resolution import resolve_potion_effects
+from alchemy_tools.session_store import SQLitePersistence, shutdown_session_reader
+from alchemy_tools.webhook_server import WebhookConfig, run_webhook
+from alchemy_tools.recipes import (
+    backfill_recipe_digests,
+    export_recipes_jsonl,
+    import_recipes_jsonl,
+    list_user_recipes,
+)
 from alchemy_tools.v5_data import get_add_effects_for_code, get_main_effect_for_code
-from alchemy_tools.v5_data import load_v5_data
-from alchemy_tools.user_ingredients import select_all_ingredients_by_user
+from alchemy_tools.v5_data import PACK_POLL_INTERVAL, load_v5_data, require_compiled_pack, watch_v5_pack
+from alchemy_tools.ingredient_keyboards import (
+    LIST_CALLBACK_PREFIX,
+    RESET_CALLBACK,
+    full_formula_keyboard,
+    ingredient_list_page,
+    ingredient_page,
+    user_ingredient_items,
+)
+from alchemy_tools.craft_callbacks import (
+    CALLBACK_PREFIX as CRAFT_CALLBACK_PREFIX,
+    OP_DONE,
+    OP_EFFECT,
+    OP_INGREDIENT,
+    OP_PAGE,
+    CraftCallback,
+    callback_codec,
+    decode_callback,
+    formula_tokens,
+    token_id,
+)
 from alchemy_tools.user_settings import get_max_ingredients, set_max_ingredients
-from effect_suppression import MAX_EFFECTS, parse_selection_token, validate_recipe_tokens
-from alchemy_tools.v5_recipe_search import find_best_recipes_for_effect
-from alchemy_tools.v5_data import search_effect_texts
+from effect_suppression import parse_selection_token, validate_recipe_tokens
+from alchemy_tools.admission import AdmissionRejected, configure_admission, get_admission
+from alchemy_tools.search_pool import get_search_pool, run_formula_search, run_search, shutdown_search_pool
+from alchemy_tools.v5_data import get_effect_producers, search_effect_texts
 
 DB_PATH = "alchemy.db"
+CATALOG_DB_PATH = "catalog.db"
 
 ############################
 # НАСТРОЙКА ЛОГИРОВАНИЯ    #
@@ -64,6 +93,8 @@ logging.getLogger("telegram.ext").setLevel(logging.INFO)
 FORMULA_SIZE = 5
 MAX_DUPLICATES_PER_INGREDIENT = 2
 
+_PACK_WATCHER: asyncio.Task | None = None
+
 
 async def _safe_answer_callback_query(query) -> None:
     try:
@@ -96,13 +127,12 @@ def _selection_stats(selections):
 
 
 def _tokens_from_selections(selections):
-    tokens = []
-    for ingredient_id, add_index in selections:
-        code = get_ingredient_code_by_id(ingredient_id)
-        if not code:
-            continue
-        tokens.append(f"{code}{add_index + 1}")
-    return tokens
+    resolved = get_ingredient_codes_and_names([ingredient_id for ingredient_id, _ in selections])
+    return [
+        f"{code}{add_index + 1}"
+        for (_ingredient_id, add_index), (code, _name) in zip(selections, resolved)
+        if code
+    ]
 
 
 def _selections_from_tokens(tokens):
@@ -220,111 +250,9 @@ def _load_env_file() -> None:
 
 
 def ensure_db_tables() -> None:
-    """Create required tables if they are missing."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS ingredients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            code TEXT,
-            name TEXT
-        )
-        """
-    )
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS properties (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            ingredient_id INTEGER,
-            description TEXT,
-            type TEXT,
-            is_positive BOOLEAN,
-            is_main BOOLEAN
-        )
-        """
-    )
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS recipes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            name TEXT,
-            ingredient_ids TEXT,
-            effects TEXT
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
-
-
-def populate_test_data_for_user(user_id: int) -> None:
-    """Insert a small set of ingredients for a new user."""
-    ensure_db_tables()
-    if get_ingredients(user_id):
-        return
-
-    samples = [
-        (
-            "ING01",
-            "Корень мандрагоры",
-            "сила",
-            True,
-            [("сонное зелье", "сон", False)],
-        ),
-        (
-            "ING02",
-            "Крыло летучей мыши",
-            "ночное зрение",
-            True,
-            [("слабость", "сила", False)],
-        ),
-        (
-            "ING03",
-            "Ягода можжевельника",
-            "здоровье",
-            True,
-            [("сон", "сон", False)],
-        ),
-    ]
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    for code, name, main_type, main_pos, extras in samples:
-        cursor.execute(
-            "INSERT INTO ingredients (user_id, code, name) VALUES (?, ?, ?)",
-            (user_id, code, name),
-        )
-        ingredient_id = cursor.lastrowid
-        cursor.execute(
-            """
-            INSERT INTO properties (user_id, ingredient_id, description, type, is_positive, is_main)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (user_id, ingredient_id, main_type, main_type, main_pos, True),
-        )
-        for desc, eff_type, is_pos in extras:
-            cursor.execute(
-                """
-                INSERT INTO properties (user_id, ingredient_id, description, type, is_positive, is_main)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (user_id, ingredient_id, desc, eff_type, is_pos, False),
-            )
-    conn.commit()
-    conn.close()
-
-
-
-
-
-
-
-
-
+    """Bring the SQLite schema up to date (see db_setup.MIGRATIONS)."""
+    setup_database(DB_PATH, catalog_path=CATALOG_DB_PATH)
+    backfill_recipe_digests(DB_PATH)
 
 
 def calculate_potion_effect(selections):
@@ -362,58 +290,52 @@ def main_menu_keyboard():
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ UI #
 ##############################
 
+def _selected_ingredient_lines(selections: list[tuple[int, int]]) -> list[str]:
+    resolved = get_ingredient_codes_and_names([ingredient_id for ingredient_id, _ in selections])
+    return [
+        f"{code or '?'}{add_index + 1}: {name}"
+        for (_ingredient_id, add_index), (code, name) in zip(selections, resolved)
+    ]
+
+
 async def show_selected_ingredients(user_id: int, selections: list[tuple[int, int]]) -> str:
     if not selections:
         return "Выберите ингредиенты для вашего зелья:"
-    lines = []
-    for ingredient_id, add_index in selections:
-        name = get_ingredient_name_by_id(ingredient_id)
-        code = get_ingredient_code_by_id(ingredient_id) or "?"
-        token = f"{code}{add_index + 1}"
-        lines.append(f"{token}: {name}")
+    lines = _selected_ingredient_lines(selections)
     return "Выбранные ингредиенты:\n- " + "\n- ".join(lines) + "\n\nВыберите ещё или закончите подбор."
 
-async def create_ingredients_keyboard(user_id: int, context: ContextTypes.DEFAULT_TYPE):
-    # Ensure users always have access to all ingredients.
-    user_testing_add_all_ingredients(user_id)
-    ingredients = select_all_ingredients_by_user(user_id)
-    keyboard = []
-    selections = context.user_data.get("selected_tokens", [])
-    counts, used_indices = _selection_stats(selections)
-
-    if len(selections) >= FORMULA_SIZE:
-        keyboard.append([
-            InlineKeyboardButton("Сбросить всё", callback_data="reset"),
-            InlineKeyboardButton("Закончить подбор", callback_data="done")
-        ])
-        return InlineKeyboardMarkup(keyboard)
-
-    for ingredient_id, code, ingredient_type, material_analog, name in ingredients:
-        if counts.get(ingredient_id, 0) >= MAX_DUPLICATES_PER_INGREDIENT:
-            continue
-        keyboard.append([InlineKeyboardButton(name, callback_data=f"add_{ingredient_id}")])
-
-    keyboard.append([
-        InlineKeyboardButton("Сбросить всё", callback_data="reset"),
-        InlineKeyboardButton("Закончить подбор", callback_data="done")
-    ])
-    return InlineKeyboardMarkup(keyboard)
-
-async def create_effects_keyboard(ingredient_id: int, used_indices: set[int] | None = None):
+async def create_ingredients_keyboard(user_id: int, formula: tuple[int, ...] = (), page: int = 0):
+    # The partial formula travels in the buttons' callback_data (craft_callbacks).
+    if len(formula) >= FORMULA_SIZE:
+        return full_formula_keyboard(formula)
+    counts, _used = _selection_stats(_selections_from_tokens(formula_tokens(formula)))
+    exhausted = frozenset(i for i, n in counts.items() if n >= MAX_DUPLICATES_PER_INGREDIENT)
+    # Only the cached inventory lookup goes to the DB thread; the page for
+    # this formula is rendered here.
+    items = await run_db(user_ingredient_items, user_id)
+    return ingredient_page(items, formula, exhausted, page)
+
+async def create_effects_keyboard(ingredient_id: int, used_indices: set[int] | None = None,
+                                  formula: tuple[int, ...] = (), page: int = 0):
     code = get_ingredient_code_by_id(ingredient_id) or ""
     add_effects = get_add_effects_for_code(code) if code else []
     keyboard = []
     used_indices = used_indices or set()
 
+    codec = callback_codec()
+
     # Доп. эффекты (add1..add3)
     for idx, desc in enumerate(add_effects[:3]):
         if idx in used_indices:
             continue
         desc = (desc or "").strip()
-        if not desc:
+        token = token_id(f"{code}{idx + 1}", codec.compiled)
+        if not desc or token is None:
+            # Not in the compiled pack (added to the catalog since): no button.
             continue
         text_btn = desc if len(desc) <= 80 else (desc[:77] + "...")
-        keyboard.append([InlineKeyboardButton(text_btn, callback_data=f"chooseeff_{ingredient_id}_{idx}")])
+        callback = CraftCallback(OP_EFFECT, formula, page=page, token=token)
+        keyboard.append([InlineKeyboardButton(text_btn, callback_data=codec.encode(callback))])
 
     return InlineKeyboardMarkup(keyboard)
 
@@ -427,34 +349,35 @@ async def list_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE, m
     if message is None:
         message = update.message
     user_id = get_user_id(update)
-    user_testing_add_all_ingredients(user_id)
-    ingredients = select_all_ingredients_by_user(user_id)
-    if not ingredients:
+    page = await run_db(ingredient_list_page, user_id, 0)
+    if page is None:
         await message.reply_text("У вас нет ингредиентов.", reply_markup=main_menu_keyboard())
         return
+    text, keyboard = page
+    await message.reply_text(text, reply_markup=keyboard or main_menu_keyboard())
 
-    text = "Ваши ингредиенты:\n"
-    for ing_id, code, ingredient_type, material_analog, name in ingredients:
-        text += f"{code}: {name}\n"
-        text += f" Тип: {ingredient_type}| Материальный аналог {material_analog}\n"
-        main_eff = (get_main_effect_for_code(code) or "").strip()
-        adds = [a for a in get_add_effects_for_code(code) if (a or "").strip()]
-        if main_eff or adds:
-            text += "Эффекты:\n"
-            if main_eff:
-                text += f"Основной: {main_eff}\n"
-            for i, eff in enumerate(adds[:3], start=1):
-                text += f"{i}: {eff}\n"
-        text += "\n"
 
-    await message.reply_text(text[:4000], reply_markup=main_menu_keyboard())
+async def list_ingredients_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await _safe_answer_callback_query(query)
+    user_id = get_user_id(update)
+    try:
+        number = int((query.data or "")[len(LIST_CALLBACK_PREFIX):])
+    except ValueError:
+        return
+    page = await run_db(ingredient_list_page, user_id, number)
+    if page is None:
+        await _safe_edit_message_text(query, "У вас нет ингредиентов.")
+        return
+    text, keyboard = page
+    await _safe_edit_message_text(query, text, reply_markup=keyboard)
 
 
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
     if message is None:
         message = update.message
     user_id = get_user_id(update)
-    current_max = get_max_ingredients(user_id, default=3)
+    current_max = await run_db(get_max_ingredients, user_id, default=3)
     keyboard = InlineKeyboardMarkup(
         [
             [
@@ -475,52 +398,122 @@ async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = get_user_id(update)
     data = query.data or ""
     if data == "setmax_3":
-        set_max_ingredients(user_id, 3)
+        await run_db(set_max_ingredients, user_id, 3)
         await _safe_edit_message_text(query, "Лимит подбора установлен: до 3 ингредиентов.")
         return
     if data == "setmax_5":
-        set_max_ingredients(user_id, 5)
+        await run_db(set_max_ingredients, user_id, 5)
         await _safe_edit_message_text(query, "Лимит подбора установлен: до 5 ингредиентов.")
         return
 
 
-async def search_effects(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
+RECIPES_PAGE_SIZE = 10
+
+
+def _format_recipes_page(rows) -> str:
+    lines = ["Ваши рецепты:"]
+    for recipe_id, name, ingredient_ids, effects in rows:
+        try:
+            tokens = ",".join(json.loads(ingredient_ids))
+        except (TypeError, ValueError):
+            tokens = "?"
+        lines.append(f"\n#{recipe_id} {name or 'Без названия'}\nФормула: {tokens}")
+        if effects:
+            lines.append(_shorten_text(effects, limit=250))
+    return "\n".join(lines)
+
+
+async def list_recipes(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
     if message is None:
         message = update.message
     user_id = get_user_id(update)
-    user_testing_add_all_ingredients(user_id)
-
-    if len(context.args) == 0:
-        await message.reply_text(
-            "Укажите часть названия эффекта, например: /search_effects яд",
-            reply_markup=main_menu_keyboard(),
-        )
+    rows, next_after_id = await run_db(list_user_recipes, user_id, limit=RECIPES_PAGE_SIZE)
+    if not rows:
+        await message.reply_text("У вас нет сохранённых рецептов.", reply_markup=main_menu_keyboard())
         return
+    await message.reply_text(_format_recipes_page(rows), reply_markup=_recipes_page_keyboard(next_after_id))
 
-    query = " ".join(context.args).strip().lower()
-    if len(query) < 2:
-        await message.reply_text(
-            "Запрос слишком короткий. Укажите минимум 2 символа.",
-            reply_markup=main_menu_keyboard(),
-        )
-        return
 
-    rows = search_effects_by_description(query, user_id=user_id)
+def _recipes_page_keyboard(next_after_id):
+    if next_after_id is None:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Далее", callback_data=f"recipes_after_{next_after_id}")]])
+
+
+async def recipes_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await _safe_answer_callback_query(query)
+    user_id = get_user_id(update)
+    try:
+        after_id = int((query.data or "").replace("recipes_after_", ""))
+    except ValueError:
+        return
+    rows, next_after_id = await run_db(list_user_recipes, user_id, after_id=after_id, limit=RECIPES_PAGE_SIZE)
     if not rows:
-        await message.reply_text(
-            f"Эффекты по запросу '{query}' не найдены.",
-            reply_markup=main_menu_keyboard(),
-        )
+        await _safe_edit_message_text(query, "Больше рецептов нет.")
         return
+    await _safe_edit_message_text(query, _format_recipes_page(rows), reply_markup=_recipes_page_keyboard(next_after_id))
+
+
+def _export_recipes_to_file(user_id):
+    handle = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode="w+b")
+    text = io.TextIOWrapper(handle, encoding="utf-8")
+    count = export_recipes_jsonl(user_id, text)
+    text.flush()
+    text.detach()
+    handle.seek(0)
+    return handle, count
+
+
+async def export_recipes(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
+    if message is None:
+        message = update.message
+    user_id = get_user_id(update)
+    handle, count = await run_db(_export_recipes_to_file, user_id)
+    try:
+        if count == 0:
+            await message.reply_text("У вас нет сохранённых рецептов.", reply_markup=main_menu_keyboard())
+            return
+        await message.reply_document(
+            document=handle,
+            filename="recipes.jsonl",
+            caption=f"Рецептов: {count}. Отправьте этот файл боту, чтобы импортировать рецепты.",
+        )
+    finally:
+        handle.close()
+
+
+def _import_recipes_from_file(user_id, path):
+    with open(path, encoding="utf-8") as lines:
+        return import_recipes_jsonl(user_id, lines)
+
 
-    max_effects = 15
-    max_ingredients = 6
+async def import_recipes_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    user_id = get_user_id(update)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "recipes.jsonl"
+        tg_file = await message.document.get_file()
+        await tg_file.download_to_drive(custom_path=path)
+        try:
+            imported, skipped = await run_db(_import_recipes_from_file, user_id, path)
+        except (ValueError, UnicodeDecodeError) as exc:
+            await message.reply_text(f"Импорт не выполнен: {exc}", reply_markup=main_menu_keyboard())
+            return
+    await message.reply_text(
+        f"Импортировано рецептов: {imported}. Пропущено дубликатов: {skipped}.",
+        reply_markup=main_menu_keyboard(),
+    )
+
+
+EFFECT_SEARCH_PAGE_SIZE = 15
+
+
+def _format_effect_search_page(query, rows, max_ingredients=6):
     effects = {}
     for desc, eff_type, value, ing_name, ing_code, ing_order, is_main in rows:
         key = (desc, eff_type, value)
         if key not in effects:
-            if len(effects) >= max_effects:
-                continue
             effects[key] = {"ingredients": [], "total": 0}
         effects[key]["total"] += 1
         if len(effects[key]["ingredients"]) < max_ingredients:
@@ -541,13 +534,101 @@ async def search_effects(update: Update, context: ContextTypes.DEFAULT_TYPE, mes
         if len(text) > 3500:
             text += "\nПоказаны не все результаты из-за ограничения длины сообщения."
             break
+    return text
+
+
+def _effect_search_keyboard(offset, has_more):
+    if not has_more:
+        return None
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton("Ещё эффекты", callback_data=f"effects_page_{offset + EFFECT_SEARCH_PAGE_SIZE}")]]
+    )
+
+
+def _effect_suggestions(query, limit=5, max_tokens=6):
+    """Close effect texts (typos, other word forms) with the tokens producing them."""
+    lines = []
+    for text in search_effect_texts(query, limit=limit, producible_only=True):
+        tokens = get_effect_producers(text).tokens()
+        more = f" и ещё {len(tokens) - max_tokens}" if len(tokens) > max_tokens else ""
+        lines.append(f"- {text} ({', '.join(tokens[:max_tokens])}{more})")
+    if not lines:
+        return ""
+    return "\n\nВозможно, вы искали:\n" + "\n".join(lines)
+
+
+async def _search_effects_page(user_id, query, offset):
+    # One extra effect tells whether a next page exists.
+    rows = await run_db(
+        search_effects_by_description, query, user_id=user_id, limit=EFFECT_SEARCH_PAGE_SIZE + 1, offset=offset
+    )
+    effect_keys = list(dict.fromkeys(row[:3] for row in rows))
+    has_more = len(effect_keys) > EFFECT_SEARCH_PAGE_SIZE
+    if has_more:
+        shown = set(effect_keys[:EFFECT_SEARCH_PAGE_SIZE])
+        rows = [row for row in rows if row[:3] in shown]
+    return rows, has_more
 
-    await message.reply_text(text, reply_markup=main_menu_keyboard())
+
+async def search_effects(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
+    if message is None:
+        message = update.message
+    user_id = get_user_id(update)
+
+    if len(context.args) == 0:
+        await message.reply_text(
+            "Укажите часть названия эффекта, например: /search_effects яд",
+            reply_markup=main_menu_keyboard(),
+        )
+        return
+
+    query = " ".join(context.args).strip().lower()
+    if len(query) < 2:
+        await message.reply_text(
+            "Запрос слишком короткий. Укажите минимум 2 символа.",
+            reply_markup=main_menu_keyboard(),
+        )
+        return
+
+    rows, has_more = await _search_effects_page(user_id, query, 0)
+    if not rows:
+        await message.reply_text(
+            f"Эффекты по запросу '{query}' не найдены." + _effect_suggestions(query),
+            reply_markup=main_menu_keyboard(),
+        )
+        return
+
+    context.user_data["effect_search_query"] = query
+    await message.reply_text(
+        _format_effect_search_page(query, rows),
+        reply_markup=_effect_search_keyboard(0, has_more) or main_menu_keyboard(),
+    )
+
+
+async def effects_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await _safe_answer_callback_query(query)
+    user_id = get_user_id(update)
+    search_query = context.user_data.get("effect_search_query")
+    try:
+        offset = int((query.data or "").replace("effects_page_", ""))
+    except ValueError:
+        return
+    if not search_query:
+        await _safe_edit_message_text(query, "Повторите поиск: /search_effects <запрос>")
+        return
+    rows, has_more = await _search_effects_page(user_id, search_query, offset)
+    if not rows:
+        await _safe_edit_message_text(query, "Больше эффектов нет.")
+        return
+    await _safe_edit_message_text(
+        query,
+        _format_effect_search_page(search_query, rows),
+        reply_markup=_effect_search_keyboard(offset, has_more),
+    )
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = get_user_id(update)
-    user_testing_add_all_ingredients(user_id)
-    context.user_data["selected_tokens"] = []
     await update.message.reply_text(
         "Добро пожаловать в алхимический помощник!\n"
         "Вы можете использовать кнопки меню или команды.\n"
@@ -574,6 +655,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/craft_optimal <формула> - Синоним команды /craft_optimal_from_formula\n"
         "/settings - Настройки подбора ингредиентов\n"
         "/search_effects <текст> - Поиск эффектов по части слова\n"
+        "/recipes - Сохранённые рецепты\n"
+        "/export_recipes - Выгрузить рецепты в файл (JSONL)\n"
         "/list_ingredients - Показать список ваших ингредиентов\n"
         "/add_ingredient - Добавить новый ингредиент\n",
         reply_markup=reply_markup
@@ -610,10 +693,8 @@ async def craft(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None
     if message is None:
         message = update.message
     user_id = get_user_id(update)
-    user_testing_add_all_ingredients(user_id)
-    context.user_data["selected_tokens"] = []
 
-    reply_markup = await create_ingredients_keyboard(user_id, context)
+    reply_markup = await create_ingredients_keyboard(user_id)
     message_text = await show_selected_ingredients(user_id, [])
     await message.reply_text(message_text, reply_markup=reply_markup)
 
@@ -624,22 +705,47 @@ async def ingredient_selection(update: Update, context: ContextTypes.DEFAULT_TYP
     data = query.data
     user_id = get_user_id(update)
 
-    if data == "reset":
-        context.user_data["selected_tokens"] = []
-        reply_markup = await create_ingredients_keyboard(user_id, context)
+    if data == RESET_CALLBACK:
+        reply_markup = await create_ingredients_keyboard(user_id)
         message_text = await show_selected_ingredients(user_id, [])
         await _safe_edit_message_text(query, message_text, reply_markup=reply_markup)
         return
 
-    if data.startswith("add_"):
-        ingredient_id = int(data.replace("add_", ""))
-        selections = context.user_data.get("selected_tokens", [])
+    # No session state: the callback carries the whole partial formula.
+    callback = decode_callback(data)
+    if callback is None:
+        await _safe_edit_message_text(query, "Эта кнопка устарела. Начните подбор заново: /craft")
+        return
+    formula = callback.formula
+    try:
+        selections = _selections_from_tokens(formula_tokens(formula))
+        if callback.token is not None:
+            _selections_from_tokens(formula_tokens([callback.token]))
+    except ValueError:
+        # A pack token without a catalog row: a forged button, or a catalog
+        # that lags behind the compiled pack.
+        reply_markup = await create_ingredients_keyboard(user_id)
+        await _safe_edit_message_text(query, "Эта кнопка устарела. Начните подбор заново:", reply_markup=reply_markup)
+        return
+
+    if callback.op == OP_PAGE:
+        reply_markup = await create_ingredients_keyboard(user_id, formula, callback.page)
+        try:
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        except BadRequest as exc:
+            # Double clicks re-send the same page.
+            if "not modified" not in str(exc):
+                raise
+        return
+
+    if callback.op == OP_INGREDIENT:
+        code, _idx = parse_selection_token(formula_tokens([callback.token])[0])
+        ingredient_id = get_ingredient_id(code)
         counts, used_indices = _selection_stats(selections)
         if counts.get(ingredient_id, 0) >= MAX_DUPLICATES_PER_INGREDIENT:
             await query.message.reply_text("Этот ингредиент уже использован дважды.", reply_markup=main_menu_keyboard())
             return
-        code = get_ingredient_code_by_id(ingredient_id) or ""
-        add_effects = get_add_effects_for_code(code) if code else []
+        add_effects = get_add_effects_for_code(code)
         available = [
             idx
             for idx, txt in enumerate(add_effects[:3])
@@ -648,13 +754,13 @@ async def ingredient_selection(update: Update, context: ContextTypes.DEFAULT_TYP
         if not available:
             await query.message.reply_text("Для этого ингредиента нет доступных доп. эффектов.", reply_markup=main_menu_keyboard())
             return
-        reply_markup = await create_effects_keyboard(ingredient_id, used_indices=used_indices.get(ingredient_id, set()))
+        reply_markup = await create_effects_keyboard(
+            ingredient_id, used_indices=used_indices.get(ingredient_id, set()), formula=formula, page=callback.page
+        )
         await _safe_edit_message_text(query, "Выберите дополнительный эффект для ингредиента:", reply_markup=reply_markup)
-        context.user_data["current_ingredient"] = ingredient_id
         return
 
-    if data == "done":
-        selections = context.user_data.get("selected_tokens", [])
+    if callback.op == OP_DONE:
         if len(selections) < FORMULA_SIZE:
             await query.message.reply_text(
                 f"В формуле должно быть {FORMULA_SIZE} ингредиентов!",
@@ -670,23 +776,21 @@ async def ingredient_selection(update: Update, context: ContextTypes.DEFAULT_TYP
 
         resolution = resolve_potion_effects(selections)
         effects_result_text = resolution["text"]
-        tokens = _tokens_from_selections(selections)
         recipe_text = _format_recipe_breakdown(tokens)
         await _safe_edit_message_text(query, f"{recipe_text}\n\nРассчитанные эффекты:\n{effects_result_text}")
         # ReplyKeyboardMarkup can't be attached to editMessageText (only InlineKeyboardMarkup is allowed).
         # Send a small message to (re)show the persistent main menu.
         await query.message.reply_text("Готово.", reply_markup=main_menu_keyboard())
+        return
 
-    if data.startswith("chooseeff_"):
-        parts = data.split("_")
-        ingredient_id = int(parts[1])
-        eff_choice = parts[2]
-        selections = context.user_data.get("selected_tokens", [])
+    if callback.op == OP_EFFECT:
+        code, idx = parse_selection_token(formula_tokens([callback.token])[0])
+        ingredient_id = get_ingredient_id(code)
+        add_index = idx - 1
         counts, used_indices = _selection_stats(selections)
         if counts.get(ingredient_id, 0) >= MAX_DUPLICATES_PER_INGREDIENT:
             await query.message.reply_text("Этот ингредиент уже использован дважды.", reply_markup=main_menu_keyboard())
             return
-        add_index = int(eff_choice)
         if add_index in used_indices.get(ingredient_id, set()):
             await query.message.reply_text("Этот доп. эффект уже выбран для данного ингредиента.", reply_markup=main_menu_keyboard())
             return
@@ -694,10 +798,10 @@ async def ingredient_selection(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.message.reply_text("Формула уже заполнена.", reply_markup=main_menu_keyboard())
             return
 
+        formula = formula + (callback.token,)
         selections.append((ingredient_id, add_index))
-        context.user_data["selected_tokens"] = selections
 
-        reply_markup = await create_ingredients_keyboard(user_id, context)
+        reply_markup = await create_ingredients_keyboard(user_id, formula, callback.page)
         message_text = await show_selected_ingredients(user_id, selections)
         await _safe_edit_message_text(query, message_text, reply_markup=reply_markup)
         # Добавляем сообщение с обновленной клавиатурой
@@ -731,7 +835,7 @@ async def log_callback_updates(update: Update, context: ContextTypes.DEFAULT_TYP
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     # If another instance is polling with the same token, PTB will raise Conflict
     # in the updater loop. Stop quickly with a clear log line instead of spamming
-    # stack traces.
+    # stack traces. (Polling only: replicas should run in webhook mode, WEBHOOK_URL.)
     if isinstance(getattr(context, "error", None), Conflict):
         logger.error("Bot stopped: another instance is already polling (Telegram getUpdates conflict).")
         os._exit(1)
@@ -751,6 +855,28 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 # ОПТИМАЛЬНОЕ ЗЕЛЬЕ     #
 #########################
 
+_ADMISSION_REFUSALS = {
+    "user_limit": "У вас уже есть запросы на подбор в работе. Дождитесь результата и повторите.",
+    "queue_full": "Сейчас слишком много запросов на подбор. Попробуйте через минуту.",
+}
+
+
+async def _run_admitted(user_id: int, message, job):
+    """
+    Run an expensive job (a coroutine factory) through admission control.
+    Returns None if it was refused; the user is told why or their queue position.
+    """
+    async def notify(position: int) -> None:
+        await message.reply_text(f"Запрос в очереди: позиция {position}. Подбор начнётся автоматически.")
+
+    try:
+        async with get_admission().slot(user_id, on_queued=notify):
+            return await job()
+    except AdmissionRejected as exc:
+        await message.reply_text(_ADMISSION_REFUSALS[exc.reason], reply_markup=main_menu_keyboard())
+        return None
+
+
 async def craft_optimal_with_effect(update: Update, context: ContextTypes.DEFAULT_TYPE, message=None) -> None:
     if message is None:
         message = update.message
@@ -764,7 +890,8 @@ async def craft_optimal_with_effect(update: Update, context: ContextTypes.DEFAUL
         return
 
     query = " ".join(context.args).strip()
-    candidates = search_effect_texts(query, limit=12)
+    # Only effects some ingredient produces: the others have no recipe.
+    candidates = search_effect_texts(query, limit=12, producible_only=True)
     if not candidates:
         await message.reply_text(
             f"Не удалось найти эффект по запросу '{query}'.",
@@ -776,7 +903,9 @@ async def craft_optimal_with_effect(update: Update, context: ContextTypes.DEFAUL
     if len(candidates) == 1:
         effect_text = candidates[0]
         await message.reply_text("Подбираю рецепт...", reply_markup=main_menu_keyboard())
-        results = await asyncio.to_thread(find_best_recipes_for_effect, effect_text)
+        results = await _run_admitted(user_id, message, lambda: run_search(effect_text))
+        if results is None:
+            return
         if not results:
             await message.reply_text(
                 f"Не удалось подобрать рецепт под эффект:\n{effect_text}",
@@ -825,7 +954,9 @@ async def choose_target_effect_callback(update: Update, context: ContextTypes.DE
     effect_text = candidates[idx]
     await _safe_edit_message_text(query, f"Цель выбрана:\n{effect_text}\n\nПодбираю рецепт...")
 
-    results = await asyncio.to_thread(find_best_recipes_for_effect, effect_text)
+    results = await _run_admitted(get_user_id(update), query.message, lambda: run_search(effect_text))
+    if results is None:
+        return
     if not results:
         await query.message.reply_text(
             f"Не удалось подобрать рецепт под эффект:\n{effect_text}",
@@ -891,13 +1022,16 @@ async def craft_optimal_from_formula(update: Update, context: ContextTypes.DEFAU
 
     try:
         _validate_partial_tokens(formula)
-        result_formulas = potential_candidates_with_max_score_several_steps(
-            formula=formula, 
-            steps=steps, 
-            only_max_score=True, 
-            user_id=user_id
+        # CPU-bound and read-only: runs in the search pool (with its own
+        # connection), like the effect searches it shares the slots with.
+        result_formulas = await _run_admitted(
+            user_id,
+            message,
+            lambda: run_formula_search(formula, steps=steps, only_max_score=True, user_id=user_id),
         )
-        
+        if result_formulas is None:
+            return
+
         if not result_formulas:
             await message.reply_text(
                 f"Не удалось найти оптимальные варианты для формулы '{formula_text}'",
@@ -947,11 +1081,39 @@ async def craft_optimal_from_formula(update: Update, context: ContextTypes.DEFAU
 # ОСНОВНАЯ ФУНКЦИЯ MAIN     #
 #############################
 
+async def _post_init(application) -> None:
+    global _PACK_WATCHER
+    application.persistence.start_eviction(application)
+    # Pick up edits of alchemy_bot_data_v5 without a restart; 0 disables.
+    interval = float(os.getenv("ALCHEMY_PACK_RELOAD_INTERVAL", PACK_POLL_INTERVAL))
+    if interval > 0:
+        _PACK_WATCHER = asyncio.get_running_loop().create_task(watch_v5_pack(interval))
+    # Recipe searches run in worker processes (ALCHEMY_SEARCH_WORKERS), off the I/O loop.
+    await get_search_pool().start()
+    # One admission slot per search worker; see alchemy_tools/admission.py.
+    configure_admission(max(1, get_search_pool().workers))
+
+
+async def _post_shutdown(application) -> None:
+    if _PACK_WATCHER is not None:
+        _PACK_WATCHER.cancel()
+    shutdown_search_pool()
+    shutdown_session_reader()
+    shutdown_db_executor()
+
+
 def main():
     _load_env_file()
     token = os.getenv("API_TOKEN") or os.getenv("TELEGRAM_TOKEN")
     if not token:
         raise RuntimeError("API_TOKEN или TELEGRAM_TOKEN не задан в окружении/.env")
+    # The bot runs on the compiled pack (python -m alchemy_tools.v5_compile);
+    # load it up front so a missing artifact fails here, not on a request.
+    require_compiled_pack()
+    load_v5_data()
+    ensure_db_tables()
+    # Static catalog lookups are served from memory; load it before polling starts.
+    get_catalog()
     # PTB defaults are quite aggressive (5s connect/read/write). On flaky networks
     # this produces frequent TimedOut exceptions on send_message/getUpdates.
     builder = (
@@ -973,6 +1135,14 @@ def main():
         logger.info("Using Telegram proxy from env (TELEGRAM_PROXY/HTTPS_PROXY/HTTP_PROXY).")
         builder = builder.proxy_url(proxy_url).get_updates_proxy_url(proxy_url)
 
+    # Webhook mode (WEBHOOK_URL): updates arrive via the embedded HTTP server,
+    # so several replicas can run at once; no getUpdates updater is needed.
+    webhook = WebhookConfig.from_env()
+    if webhook is not None:
+        builder = builder.updater(None)
+
+    # context.user_data is kept in SQLite (user_sessions) and loaded per user on demand.
+    builder = builder.persistence(SQLitePersistence()).post_init(_post_init).post_shutdown(_post_shutdown)
     application = builder.build()
 
     # Команды
@@ -981,18 +1151,28 @@ def main():
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("craft", craft))
-    application.add_handler(CommandHandler("craft_optimal_with_effect", craft_optimal_with_effect))
-    application.add_handler(CommandHandler("craft_optimal_from_formula", craft_optimal_from_formula))
-    application.add_handler(CommandHandler("craft_optimal", craft_optimal_from_formula))
+    # Searches may wait for an admission slot; block=False keeps other updates flowing meanwhile.
+    application.add_handler(CommandHandler("craft_optimal_with_effect", craft_optimal_with_effect, block=False))
+    application.add_handler(CommandHandler("craft_optimal_from_formula", craft_optimal_from_formula, block=False))
+    application.add_handler(CommandHandler("craft_optimal", craft_optimal_from_formula, block=False))
     application.add_handler(CommandHandler("list_ingredients", list_ingredients))
     application.add_handler(CommandHandler("search_effects", search_effects))
     application.add_handler(CommandHandler("settings", settings_command))
+    application.add_handler(CommandHandler("recipes", list_recipes))
+    application.add_handler(CommandHandler("export_recipes", export_recipes))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("jsonl"), import_recipes_document))
 
     # Callback
     application.add_handler(CallbackQueryHandler(handle_help_buttons, pattern="^help_"))
     application.add_handler(CallbackQueryHandler(settings_callback, pattern="^setmax_"))
-    application.add_handler(CallbackQueryHandler(choose_target_effect_callback, pattern="^choose_target_effect:"))
-    application.add_handler(CallbackQueryHandler(ingredient_selection, pattern="^(reset|add_|done|chooseeff_)"))
+    application.add_handler(CallbackQueryHandler(recipes_page_callback, pattern="^recipes_after_"))
+    application.add_handler(CallbackQueryHandler(effects_page_callback, pattern="^effects_page_"))
+    application.add_handler(CallbackQueryHandler(list_ingredients_page_callback, pattern="^inglist_"))
+    application.add_handler(
+        CallbackQueryHandler(choose_target_effect_callback, pattern="^choose_target_effect:", block=False)
+    )
+    # add_/done/chooseeff_/ingpage_: buttons sent before callbacks became stateless, answered as stale.
+    application.add_handler(CallbackQueryHandler(ingredient_selection, pattern=f"^({RESET_CALLBACK}|{CRAFT_CALLBACK_PREFIX}|add_|done|chooseeff_|ingpage_)"))
 
     # Текстовые сообщения
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
@@ -1001,6 +1181,9 @@ def main():
     application.add_handler(MessageHandler(filters.COMMAND, handle_help_buttons))
 
     application.add_error_handler(error_handler)
+    if webhook is not None:
+        run_webhook(application, webhook)
+        return
     # Avoid processing stale callback queries and messages after restart.
     application.run_polling(drop_pending_updates=True)
 
@@ -1,34 +1,230 @@
+import hashlib
 import json
+import logging
 import sqlite3
 
-from alchemy_tools.effects_resolution import resolve_potion_effects
-from alchemy_tools.effects_tools import get_ingredient_id
-from effect_suppression import parse_selection_token
+from alchemy_tools.db_wrapper import connect_db
+from alchemy_tools.v5_compile import get_compiled_pack
+from alchemy_tools.v5_data import load_v5_data, resolve_tokens
 
 DB_PATH = "alchemy.db"
+RECIPE_SIZE = 5
+# Import errors listed in the reply; the rest are only counted.
+MAX_IMPORT_ERRORS = 10
 
-def _selections_from_tokens(tokens):
-    selections = []
-    for token in tokens:
-        code, idx = parse_selection_token(token)
-        ingredient_id = get_ingredient_id(code)
-        selections.append((ingredient_id, idx - 1))
-    return selections
+logger = logging.getLogger(__name__)
 
 
-def save_recipe(user_id, name, selection_tokens, effects):
-    conn = sqlite3.connect(DB_PATH)
+def recipe_key(selection_tokens) -> str:
+    """Canonical, order-independent key of a formula, e.g. 'AM1,KQ2,KQ3'."""
+    return ",".join(sorted(token.strip() for token in selection_tokens))
+
+
+def effects_digest(final_effects) -> str:
+    """Compact digest of the resolved final effects (order and case insensitive)."""
+    normalize_key = load_v5_data().suppression_mod.normalize_key
+    canonical = "\x1f".join(sorted(normalize_key(effect) for effect in final_effects))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def recipe_digest(selection_tokens) -> str:
+    # The resolver is order-sensitive (e.g. which poison survives a collapse),
+    # so resolve the tokens in their saved order: two orderings of the same
+    # tokens are the same recipe only if they give the same final effects.
+    return effects_digest(resolve_tokens([token.strip() for token in selection_tokens]).final_effects)
+
+
+def _recipe_row(user_id, name, selection_tokens, effects):
+    return (
+        user_id,
+        name,
+        json.dumps(selection_tokens),
+        effects,
+        recipe_key(selection_tokens),
+        recipe_digest(selection_tokens),
+    )
+
+
+def backfill_recipe_digests(db_path=None) -> int:
+    """
+    Fill in effects_digest for recipes saved before it existed (left NULL by
+    migration 005, which must not depend on the pack). A recipe that turns out
+    to duplicate one saved earlier is removed. Returns the number of digests
+    written; tokens invalid in the current pack are left NULL.
+    """
+    conn = connect_db(db_path or DB_PATH)
+    try:
+        rows = conn.execute(
+            "SELECT id, ingredient_ids FROM recipes WHERE effects_digest IS NULL AND tokens_key IS NOT NULL ORDER BY id"
+        ).fetchall()
+        written = 0
+        with conn:
+            for recipe_id, ingredient_ids in rows:
+                try:
+                    digest = recipe_digest(json.loads(ingredient_ids))
+                except Exception:
+                    continue
+                try:
+                    conn.execute("UPDATE recipes SET effects_digest = ? WHERE id = ?", (digest, recipe_id))
+                    written += 1
+                except sqlite3.IntegrityError:
+                    conn.execute("DELETE FROM recipes WHERE id = ?", (recipe_id,))
+        return written
+    finally:
+        conn.close()
+
+
+def save_recipe(user_id, name, selection_tokens, effects) -> bool:
+    """Store a recipe; returns False if the same recipe is already saved for the user."""
+    conn = connect_db(DB_PATH)
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO recipes (user_id, name, ingredient_ids, effects) VALUES (?, ?, ?, ?)",
-        (user_id, name, json.dumps(selection_tokens), effects)
+        """
+        INSERT INTO recipes (user_id, name, ingredient_ids, effects, tokens_key, effects_digest)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, tokens_key, effects_digest) DO NOTHING
+        """,
+        _recipe_row(user_id, name, selection_tokens, effects),
     )
+    inserted = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    return inserted
+
+
+def list_user_recipes(user_id, after_id: int = 0, limit: int = 10):
+    """
+    Keyset-paginated recipes of a user ordered by id.
+
+    Returns (rows, next_after_id); next_after_id is None on the last page.
+    """
+    conn = connect_db(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT id, name, ingredient_ids, effects FROM recipes
+        WHERE user_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (user_id, after_id, limit + 1),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][0]
+    return rows, None
+
+
+def export_recipes_jsonl(user_id, out, batch_size: int = 500) -> int:
+    """Stream a user's recipes to a text file object as JSON lines; returns the count."""
+    conn = connect_db(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT name, ingredient_ids, effects FROM recipes WHERE user_id = ? ORDER BY id",
+        (user_id,),
+    )
+    count = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for name, ingredient_ids, effects in rows:
+            try:
+                tokens = json.loads(ingredient_ids)
+            except (TypeError, ValueError):
+                logger.warning("Skipping recipe %r of user %s with unreadable tokens", name, user_id)
+                continue
+            record = {"name": name, "tokens": tokens, "effects": effects}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    conn.close()
+    return count
+
+
+def _import_record(line: str) -> tuple[str, list, str]:
+    """(name, tokens, effects) of one exported line; ValueError if it is not a valid recipe."""
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        raise ValueError(f"не JSON ({exc})") from exc
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом JSON")
+    tokens = record.get("tokens")
+    if not isinstance(tokens, list) or len(tokens) != RECIPE_SIZE or not all(isinstance(t, str) for t in tokens):
+        raise ValueError(f"tokens должен быть списком из {RECIPE_SIZE} строк")
+    token_ids = get_compiled_pack().token_ids
+    unknown = [token for token in tokens if token.strip() not in token_ids]
+    if unknown:
+        raise ValueError(f"неизвестные токены {unknown}")
+    name, effects = record.get("name") or "", record.get("effects") or ""
+    if not isinstance(name, str) or not isinstance(effects, str):
+        raise ValueError("name и effects должны быть строками")
+    return name, tokens, effects
+
+
+def import_recipes_jsonl(user_id, lines, batch_size: int = 500) -> tuple[int, int]:
+    """
+    Import JSON lines produced by export_recipes_jsonl in one transaction.
+
+    Returns (imported, skipped_duplicates). Every line is checked; if any is
+    malformed, nothing is imported and ValueError lists the bad lines.
+    """
+    conn = connect_db(DB_PATH)
+    cursor = conn.cursor()
+    total = 0
+    inserted = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted
+        before = conn.total_changes
+        cursor.executemany(
+            """
+            INSERT INTO recipes (user_id, name, ingredient_ids, effects, tokens_key, effects_digest)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, tokens_key, effects_digest) DO NOTHING
+            """,
+            batch,
+        )
+        inserted += conn.total_changes - before
+        batch.clear()
+
+    errors = []
+    try:
+        with conn:
+            for line_no, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    name, tokens, effects = _import_record(line)
+                    # Duplicate tokens and the like are caught by the resolver.
+                    row = _recipe_row(user_id, name, tokens, effects)
+                except ValueError as exc:
+                    errors.append(f"Строка {line_no}: некорректная запись рецепта ({exc})")
+                    continue
+                total += 1
+                if errors:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    flush()
+            if errors:
+                shown = errors[:MAX_IMPORT_ERRORS]
+                if len(errors) > len(shown):
+                    shown.append(f"… и ещё {len(errors) - len(shown)} строк(и) с ошибками")
+                raise ValueError("\n".join(shown))
+            if batch:
+                flush()
+    finally:
+        conn.close()
+    return inserted, total - inserted
 
 
 def get_user_recipes(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("SELECT id, name, ingredient_ids, effects FROM recipes WHERE user_id = ?", (user_id,))
     recipes = cursor.fetchall()
@@ -37,17 +233,14 @@ def get_user_recipes(user_id):
 
 def recipe_exists(selection_tokens, user_id):
     """Проверяем, не существует ли такого же точного рецепта (ингредиенты + эффекты)."""
-    conn = sqlite3.connect(DB_PATH)
+    key = recipe_key(selection_tokens)
+    digest = recipe_digest(selection_tokens)
+    conn = connect_db(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("SELECT id, ingredient_ids, effects FROM recipes WHERE user_id = ?", (user_id,))
-    existing_recipes = cursor.fetchall()
+    cursor.execute(
+        "SELECT 1 FROM recipes WHERE user_id = ? AND tokens_key = ? AND effects_digest = ? LIMIT 1",
+        (user_id, key, digest),
+    )
+    row = cursor.fetchone()
     conn.close()
-
-    for recipe_id, ingredient_ids_json, effects_text in existing_recipes:
-        existing_tokens = json.loads(ingredient_ids_json)
-        if sorted(existing_tokens) == sorted(selection_tokens):
-            selections = _selections_from_tokens(selection_tokens)
-            resolution = resolve_potion_effects(selections)
-            if resolution["text"] == effects_text:
-                return True
-    return False
+    return row is not None
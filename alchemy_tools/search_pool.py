@@ -0,0 +1,157 @@
+"""
+Worker processes for CPU-heavy recipe searches.
+
+find_best_recipes_for_effect is pure Python: run on a thread of the bot
+process it holds the GIL the Telegram I/O loop needs, so a few concurrent
+searches slow down every other user's button presses. The searches run
+instead in a pool of worker processes fed through the executor's job queue;
+each worker loads the v5 pack and its derived tables once when it starts, and
+the bot process only submits jobs and awaits their results.
+
+    results = await run_search(effect_text)
+    formulas = await run_formula_search(["AM1"], steps=1, user_id=user_id)
+
+run_formula_search (/craft_optimal_from_formula) scores candidates against the
+user-state database; workers open their own read-only connections to it, so
+the searches hold neither the GIL of the bot process nor its DB thread.
+
+Before each job a worker checks the pack fingerprint (a few stat calls) and
+reloads the pack if it was recompiled, so workers follow the bot's hot reload.
+The pool size is ALCHEMY_SEARCH_WORKERS (default: one per core but one, for
+the I/O loop); 0 runs searches on a thread of the bot process as before.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, TypeVar
+
+from alchemy_tools import v5_data
+from alchemy_tools.find_ingredients import potential_candidates_with_max_score_several_steps
+from alchemy_tools.v5_data import load_v5_data, reload_v5_data, require_compiled_pack
+from alchemy_tools.v5_recipe_search import RecipeCandidate, find_best_recipes_for_effect, get_token_table
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def default_worker_count() -> int:
+    value = os.getenv("ALCHEMY_SEARCH_WORKERS")
+    if value is not None:
+        return max(0, int(value))
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_worker(compiled_only: bool) -> None:
+    require_compiled_pack(compiled_only)
+    get_token_table(load_v5_data())
+
+
+def _warm_up() -> int:
+    return load_v5_data().version
+
+
+def _search_job(effect_text: str, kwargs: dict) -> List[RecipeCandidate]:
+    reload_v5_data()
+    return find_best_recipes_for_effect(effect_text, **kwargs)
+
+
+def _formula_job(formula: List[str], kwargs: dict) -> List[List[str]]:
+    reload_v5_data()
+    return potential_candidates_with_max_score_several_steps(formula, **kwargs)
+
+
+class SearchPool:
+    """Process pool running recipe searches; workers start on first use."""
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = default_worker_count() if workers is None else workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs the bot's threads
+                # (DB thread, HTTP client) is unsafe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(v5_data._COMPILED_ONLY,),
+                )
+            return self._executor
+
+    async def start(self) -> None:
+        """Start every worker and wait until each has loaded the pack."""
+        if self.workers <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)))
+        logger.info("Started %d recipe search worker(s)", self.workers)
+
+    async def _run(self, inline: Callable[[], T], job: Callable[..., T], *args: Any) -> T:
+        """inline() on a thread without workers, else job(*args) in a worker."""
+        if self.workers <= 0:
+            return await asyncio.to_thread(inline)
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, job, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer); start a fresh pool
+            # for the next search.
+            logger.exception("Recipe search worker died, restarting the pool")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def run(self, effect_text: str, **kwargs: Any) -> List[RecipeCandidate]:
+        return await self._run(
+            lambda: find_best_recipes_for_effect(effect_text, **kwargs), _search_job, effect_text, kwargs
+        )
+
+    async def run_formula(self, formula: List[str], **kwargs: Any) -> List[List[str]]:
+        return await self._run(
+            lambda: potential_candidates_with_max_score_several_steps(formula, **kwargs), _formula_job, formula, kwargs
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_POOL: Optional[SearchPool] = None
+
+
+def get_search_pool() -> SearchPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = SearchPool()
+    return _POOL
+
+
+async def run_search(effect_text: str, **kwargs: Any) -> List[RecipeCandidate]:
+    """Run find_best_recipes_for_effect in the search pool and await its result."""
+    return await get_search_pool().run(effect_text, **kwargs)
+
+
+async def run_formula_search(formula: List[str], **kwargs: Any) -> List[List[str]]:
+    """Run potential_candidates_with_max_score_several_steps in the search pool."""
+    return await get_search_pool().run_formula(formula, **kwargs)
+
+
+def shutdown_search_pool(wait: bool = True) -> None:
+    if _POOL is not None:
+        _POOL.shutdown(wait=wait)
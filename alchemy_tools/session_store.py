@@ -0,0 +1,291 @@
+"""
+SQLite-backed persistence for context.user_data.
+
+Sessions (target_effect_candidates, the effect search query, ...)
+are stored pickled in the `user_sessions` table of the user-state database:
+
+- nothing is loaded at startup; a user's session is read on their next update
+  (refresh_user_data), also picking up a newer copy written by another process.
+  Rows carry a version bumped on every write; the check runs on a reader
+  thread with its own connection, off the DB thread, and the row is only
+  unpickled when its version is newer than the copy in memory;
+- changed sessions handed over by PTB are written in one batch per loop
+  iteration through the DB thread, unchanged ones are skipped;
+- sessions idle for longer than idle_ttl are dropped from memory (they stay in
+  SQLite), and rows older than retention are deleted.
+
+Concurrent writers follow "last write wins" per user.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import pickle
+import time
+from typing import Any, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from alchemy_tools.db_async import DBExecutor, run_db
+from alchemy_tools.db_wrapper import connect_db, thread_connection
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "alchemy.db"
+SESSION_IDLE_TTL = 30 * 60
+SESSION_RETENTION = 30 * 24 * 60 * 60
+EVICTION_INTERVAL = 5 * 60
+
+# Session reads run here, on a persistent connection of their own, so a
+# refresh on every update does not queue behind writes on the DB thread.
+_READER = DBExecutor("alchemy-session-reader")
+
+
+def load_session(user_id: int, newer_than: Optional[int] = None) -> Optional[tuple[dict, int]]:
+    """Return (user_data, version), or None if missing or not newer than newer_than."""
+    row = thread_connection(DB_PATH).execute(
+        "SELECT data, version FROM user_sessions WHERE user_id = ? AND version > ?",
+        (user_id, -1 if newer_than is None else newer_than),
+    ).fetchone()
+    if row is None:
+        return None
+    return pickle.loads(row[0]), row[1]
+
+
+def save_sessions(rows) -> dict[int, int]:
+    """
+    Upsert [(user_id, pickled_data, updated_at), ...] in one transaction and
+    return the version written for each user.
+    """
+    conn = connect_db(DB_PATH)
+    try:
+        with conn:
+            return {
+                user_id: conn.execute(
+                    """
+                    INSERT INTO user_sessions (user_id, data, updated_at, version) VALUES (?, ?, ?, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        data = excluded.data,
+                        updated_at = excluded.updated_at,
+                        version = user_sessions.version + 1
+                    RETURNING version
+                    """,
+                    (user_id, blob, updated_at),
+                ).fetchone()[0]
+                for user_id, blob, updated_at in rows
+            }
+    finally:
+        conn.close()
+
+
+def delete_session(user_id: int) -> None:
+    conn = connect_db(DB_PATH)
+    try:
+        with conn:
+            conn.execute("DELETE FROM user_sessions WHERE user_id = ?", (user_id,))
+    finally:
+        conn.close()
+
+
+def expire_sessions(older_than: float) -> int:
+    """Delete sessions last written before older_than (unix time); returns the count."""
+    conn = connect_db(DB_PATH)
+    try:
+        with conn:
+            return conn.execute("DELETE FROM user_sessions WHERE updated_at < ?", (older_than,)).rowcount
+    finally:
+        conn.close()
+
+
+class SQLitePersistence(BasePersistence):
+    """PTB persistence storing only user_data, see the module docstring."""
+
+    def __init__(
+        self,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        retention: float = SESSION_RETENTION,
+        update_interval: float = 5,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.idle_ttl = idle_ttl
+        self.retention = retention
+        # Per-user bookkeeping; only for users seen within idle_ttl.
+        self._last_seen: dict[int, float] = {}
+        self._versions: dict[int, int] = {}
+        self._digests: dict[int, bytes] = {}
+        self._pending: dict[int, bytes] = {}
+        self._writing: set[int] = set()
+        self._evicted: set[int] = set()
+        self._write_handle: Optional[asyncio.Handle] = None
+        self._write_task: Optional[asyncio.Task] = None
+        self._eviction_task: Optional[asyncio.Task] = None
+        self._application: Any = None
+
+    # -- user_data -----------------------------------------------------------
+
+    async def get_user_data(self) -> dict[int, dict]:
+        # Sessions are rehydrated lazily in refresh_user_data.
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        self._last_seen[user_id] = time.monotonic()
+        if user_id in self._pending or user_id in self._writing:
+            # Our copy is at least as new as anything stored.
+            return
+        row = await _READER.run(load_session, user_id, self._versions.get(user_id))
+        if row is not None and user_id not in self._pending and user_id not in self._writing:
+            data, version = row
+            user_data.clear()
+            user_data.update(data)
+            self._versions[user_id] = version
+            self._digests[user_id] = _digest(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = _digest(blob)
+        if self._digests.get(user_id) == digest:
+            return
+        self._digests[user_id] = digest
+        self._pending[user_id] = blob
+        if self._write_handle is None:
+            # Coalesce every update handed over in this loop iteration.
+            self._write_handle = asyncio.get_running_loop().call_soon(self._start_write)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._evicted:
+            # Deferred drop of an evicted session: memory only, keep the row.
+            self._evicted.discard(user_id)
+            if user_id in self._last_seen and self._application is not None:
+                # The user came back before PTB ran the drop; PTB skipped
+                # their update in favour of the drop, so queue it again.
+                self._application.mark_data_for_update_persistence(user_ids=user_id)
+            return
+        self._forget(user_id)
+        self._pending.pop(user_id, None)
+        await run_db(delete_session, user_id)
+
+    # -- batched writes --------------------------------------------------------
+
+    def _start_write(self) -> None:
+        self._write_handle = None
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            self._writing.update(batch)
+            updated_at = time.time()
+            try:
+                versions = await run_db(save_sessions, [(user_id, blob, updated_at) for user_id, blob in batch.items()])
+            except Exception:
+                logger.exception("Failed to write %d sessions", len(batch))
+                for user_id, blob in batch.items():
+                    self._pending.setdefault(user_id, blob)
+                return
+            finally:
+                self._writing.difference_update(batch)
+            self._versions.update(versions)
+
+    async def _drain_writes(self) -> None:
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+
+    async def flush(self) -> None:
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+        await self._drain_writes()
+
+    # -- eviction ----------------------------------------------------------------
+
+    def start_eviction(self, application, interval: float = EVICTION_INTERVAL) -> None:
+        """Start the idle-session eviction task (call from Application.post_init)."""
+        self._application = application
+        self._eviction_task = asyncio.get_running_loop().create_task(self._eviction_loop(interval))
+
+    async def _eviction_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception:
+                logger.exception("Session eviction failed")
+
+    async def evict_idle(self) -> int:
+        """Drop sessions idle longer than idle_ttl from memory; returns how many."""
+        application = self._application
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [user_id for user_id, seen in self._last_seen.items() if seen < cutoff]
+        if idle and application is not None:
+            # Make sure the latest state of every idle user is on disk first.
+            await application.update_persistence()
+            await self._drain_writes()
+        evicted = 0
+        for user_id in idle:
+            if self._last_seen.get(user_id, cutoff) >= cutoff or user_id in self._pending or user_id in self._writing:
+                continue
+            self._forget(user_id)
+            if application is not None:
+                self._evicted.add(user_id)
+                application.drop_user_data(user_id)
+            evicted += 1
+        await run_db(expire_sessions, time.time() - self.retention)
+        return evicted
+
+    def _forget(self, user_id: int) -> None:
+        self._last_seen.pop(user_id, None)
+        self._versions.pop(user_id, None)
+        self._digests.pop(user_id, None)
+
+    # -- unused stores -------------------------------------------------------------
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        return None
+
+    async def update_bot_data(self, data: dict) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        return None
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        return None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        return None
+
+
+def shutdown_session_reader(wait: bool = True) -> None:
+    _READER.shutdown(wait=wait)
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
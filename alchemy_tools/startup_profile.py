@@ -0,0 +1,165 @@
+"""
+Startup-time profile of the bot entry point.
+
+Reports where a bot restart spends its time:
+
+- imports: `python -X importtime` of alchemy_tools.main in a fresh interpreter,
+  aggregated per top-level package and listed per module (self / cumulative);
+- initialisation: the steps main() runs before polling (schema migrations,
+  catalog load) and the lazily loaded resources the first requests pay for
+  (v5 pack, effect text index, recipe token table). They run on temporary
+  copies of alchemy.db and catalog.db, so the migrations never touch the
+  real databases.
+
+    python -m alchemy_tools.startup_profile [--top N] [--no-init]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ENTRY_MODULE = "alchemy_tools.main"
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """Parse `-X importtime` output ("import time: self | cumulative | name")."""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        timings.append(ImportTiming(fields[2].strip(), int(fields[0]), int(fields[1])))
+    return timings
+
+
+def profile_imports(module: str = ENTRY_MODULE) -> List[ImportTiming]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def _init_steps() -> List[Tuple[str, Callable[[], object]]]:
+    from alchemy_tools import main
+    from alchemy_tools.catalog import get_catalog
+    from alchemy_tools.v5_data import get_effect_text_index, load_v5_data
+    from alchemy_tools.v5_recipe_search import get_token_table
+
+    return [
+        ("ensure_db_tables", main.ensure_db_tables),
+        ("get_catalog", get_catalog),
+        ("load_v5_data (lazy)", load_v5_data),
+        ("effect text index (lazy)", get_effect_text_index),
+        ("recipe token table (lazy)", get_token_table),
+    ]
+
+
+@contextlib.contextmanager
+def _database_copies() -> Iterator[Path]:
+    """
+    Work in a temporary directory holding copies of the databases in the
+    current one (the bot opens them by relative path), keeping the data pack
+    the bot would load from here.
+    """
+    cwd = Path.cwd()
+    data_dir = os.environ.get("ALCHEMY_DATA_DIR")
+    with tempfile.TemporaryDirectory(prefix="startup-profile-") as tmp:
+        tmp_dir = Path(tmp)
+        if (cwd / "alchemy.db").exists():
+            # The backup API gives a consistent copy of a WAL database; a
+            # read-write connection (no writes) removes its -wal/-shm on close.
+            source = sqlite3.connect(cwd / "alchemy.db")
+            target = sqlite3.connect(tmp_dir / "alchemy.db")
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        if (cwd / "catalog.db").exists():
+            shutil.copy2(cwd / "catalog.db", tmp_dir / "catalog.db")
+        if data_dir is None and (cwd / "alchemy_bot_data_v5").is_dir():
+            os.environ["ALCHEMY_DATA_DIR"] = str(cwd / "alchemy_bot_data_v5")
+        os.chdir(tmp_dir)
+        try:
+            yield tmp_dir
+        finally:
+            os.chdir(cwd)
+            if data_dir is None:
+                os.environ.pop("ALCHEMY_DATA_DIR", None)
+
+
+def profile_init() -> List[Tuple[str, float]]:
+    """
+    Run the initialisation steps in this process, on copies of the databases
+    (see _database_copies); returns (step, seconds).
+    """
+    with _database_copies():
+        started = time.perf_counter()
+        steps = _init_steps()
+        results = [(f"import {ENTRY_MODULE}", time.perf_counter() - started)]
+        for name, step in steps:
+            started = time.perf_counter()
+            step()
+            results.append((name, time.perf_counter() - started))
+    return results
+
+
+def format_report(imports: List[ImportTiming], init: List[Tuple[str, float]], top: int = 15) -> str:
+    lines = []
+    if imports:
+        total = max(t.cumulative_us for t in imports)
+        by_package = defaultdict(int)
+        for t in imports:
+            by_package[t.module.split(".")[0]] += t.self_us
+        lines.append(f"Imports: {total / 1000:.1f} ms total")
+        lines.append("  by package (self time):")
+        for package, us in sorted(by_package.items(), key=lambda x: -x[1])[:top]:
+            lines.append(f"    {us / 1000:8.1f} ms  {package}")
+        lines.append("  slowest modules (self / cumulative):")
+        for t in sorted(imports, key=lambda t: -t.self_us)[:top]:
+            lines.append(f"    {t.self_us / 1000:8.1f} / {t.cumulative_us / 1000:8.1f} ms  {t.module}")
+    if init:
+        lines.append(
+            f"Initialisation: {sum(s for _n, s in init) * 1000:.1f} ms total (on copies of alchemy.db and catalog.db)"
+        )
+        for name, seconds in init:
+            lines.append(f"    {seconds * 1000:8.1f} ms  {name}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report import and initialisation time of the bot.")
+    parser.add_argument("--top", type=int, default=15, help="rows per section (default: 15)")
+    parser.add_argument("--no-init", action="store_true", help="only profile imports")
+    args = parser.parse_args()
+    imports = profile_imports()
+    init = [] if args.no_init else profile_init()
+    print(format_report(imports, init, args.top))
+
+
+if __name__ == "__main__":
+    main()
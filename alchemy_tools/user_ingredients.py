@@ -1,53 +1,109 @@
+"""
+Per-user ingredient inventories.
+
+Users start in the default inventory mode: every catalog ingredient is
+available and nothing is stored for them. Users with a custom inventory have
+a row in `custom_inventories`, and their `user_ingredients` rows list exactly
+what they own (possibly nothing).
+"""
+from alchemy_tools.catalog import get_catalog
 from alchemy_tools.db_wrapper import db_alchemy_wrapper
-SQL_CHECK_INGREDIENT_EXISTS="""
+
+SQL_SELECT_USER_INGREDIENT_IDS="""
 select
-    1
+	ui.ingredient_id
 from
-    ingredients i
+	user_ingredients ui
 where
-    i.code = '{ingredient_code}'
+	ui.user_id = ?
 """
 
-SQL_CHECK_IS_ALREADY_ADDED="""
+SQL_SELECT_CUSTOM_INVENTORY="""
 select
 	1
 from
-	user_ingredients ui
-join ingredients i on
-	i.id = ui.ingredient_id
+	custom_inventories ci
 where
-	ui.user_id = {user_id}
-	and i.code = '{ingredient_code}'
+	ci.user_id = ?
 """
 
-SQL_SELECT_ALL_INGREDIENTS_BY_USER="""
+# (custom flag, row count, max row id) of a user's inventory. Ids are
+# AUTOINCREMENT, so any replacement changes it; (0, 0, 0) is the default
+# inventory. Bind the user id twice.
+SQL_SELECT_INVENTORY_VERSION="""
 select
-	i.id,
-	i.code,
-	i.ingredient_type,
-	i.material_analog,
-	i.name
+	exists (select 1 from custom_inventories ci where ci.user_id = ?), count(*), coalesce(max(ui.id), 0)
 from
-	ingredients i
-join user_ingredients ui on
-	ui.ingredient_id = i.id
+	user_ingredients ui
 where
-	ui.user_id = {user_id}
+	ui.user_id = ?
+"""
+
+# SQL fragment for queries joined against the catalog as `i`: keeps every
+# ingredient for default-inventory users and only owned ones otherwise.
+# Bind the user id twice.
+SQL_USER_INVENTORY_FILTER="""
+(
+    not exists (select 1 from custom_inventories ci0 where ci0.user_id = ?)
+    or i.id in (select ui1.ingredient_id from user_ingredients ui1 where ui1.user_id = ?)
+)
 """
+
+
+def check_ingredient_exists(ingredient_code)->bool:
+    return ingredient_code in get_catalog().id_by_code
+
+@db_alchemy_wrapper
+def get_user_ingredient_ids(user_id,cursor)->set[int] | None:
+    """Return owned ingredient ids, or None for the default (all ingredients) inventory."""
+    cursor.execute(SQL_SELECT_CUSTOM_INVENTORY,(user_id,))
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(SQL_SELECT_USER_INGREDIENT_IDS,(user_id,))
+    return {row[0] for row in cursor.fetchall()}
+
 @db_alchemy_wrapper
-def check_ingredient_exists(ingredient_code,cursor)->bool:
-    cursor.execute(SQL_CHECK_INGREDIENT_EXISTS.format(ingredient_code=ingredient_code))
-    result = cursor.fetchall()
-    return len(result)>0
+def get_inventory_version(user_id,cursor)->tuple[int, int]:
+    """Changes whenever the user's inventory does; (0, 0, 0) is the default inventory."""
+    cursor.execute(SQL_SELECT_INVENTORY_VERSION,(user_id,user_id))
+    return tuple(cursor.fetchone())
+
+def has_custom_inventory(user_id)->bool:
+    return get_user_ingredient_ids(user_id) is not None
+
+def check_is_already_added(user_id, ingredient_code)->bool:
+    ingredient_id = get_catalog().id_by_code.get(ingredient_code)
+    if ingredient_id is None:
+        return False
+    owned = get_user_ingredient_ids(user_id)
+    return owned is None or ingredient_id in owned
+
+def select_all_ingredients_by_user(user_id):
+    owned = get_user_ingredient_ids(user_id)
+    ingredients = get_catalog().ingredients
+    if owned is None:
+        return list(ingredients)
+    return [row for row in ingredients if row[0] in owned]
 
 @db_alchemy_wrapper
-def check_is_already_added(user_id, ingredient_code,cursor)->bool:
-    cursor.execute(SQL_CHECK_IS_ALREADY_ADDED.format(user_id=user_id, ingredient_code=ingredient_code))
-    result = cursor.fetchall()
-    return len(result)>0
+def set_custom_inventory(user_id, ingredient_codes, cursor)->None:
+    """Replace the user's inventory with exactly these ingredients (possibly none)."""
+    id_by_code = get_catalog().id_by_code
+    unknown = [code for code in ingredient_codes if code not in id_by_code]
+    if unknown:
+        raise ValueError(f"Unknown ingredient codes: {unknown}")
+    conn = cursor.connection
+    with conn:
+        cursor.execute("INSERT OR IGNORE INTO custom_inventories (user_id) VALUES (?)",(user_id,))
+        cursor.execute("DELETE FROM user_ingredients WHERE user_id = ?",(user_id,))
+        cursor.executemany(
+            "INSERT INTO user_ingredients (user_id, ingredient_id) VALUES (?, ?)",
+            [(user_id, id_by_code[code]) for code in dict.fromkeys(ingredient_codes)],
+        )
 
 @db_alchemy_wrapper
-def select_all_ingredients_by_user(user_id,cursor):
-    cursor.execute(SQL_SELECT_ALL_INGREDIENTS_BY_USER.format(user_id=user_id))
-    result = cursor.fetchall()
-    return result
\ No newline at end of file
+def reset_inventory(user_id, cursor)->None:
+    """Return the user to the default (all ingredients) inventory."""
+    with cursor.connection:
+        cursor.execute("DELETE FROM user_ingredients WHERE user_id = ?",(user_id,))
+        cursor.execute("DELETE FROM custom_inventories WHERE user_id = ?",(user_id,))
@@ -1,4 +1,4 @@
-import sqlite3
+from alchemy_tools.db_wrapper import connect_db
 
 DB_PATH = "alchemy.db"
 
@@ -15,7 +15,7 @@ def _ensure_table(cursor) -> None:
 
 
 def get_max_ingredients(user_id: int, default: int = 5) -> int:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(DB_PATH)
     cursor = conn.cursor()
     _ensure_table(cursor)
     cursor.execute("SELECT max_ingredients FROM user_settings WHERE user_id = ?", (user_id,))
@@ -32,7 +32,7 @@ def get_max_ingredients(user_id: int, default: int = 5) -> int:
 def set_max_ingredients(user_id: int, value: int) -> None:
     if value not in (3, 5):
         raise ValueError("max_ingredients must be 3 or 5")
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(DB_PATH)
     cursor = conn.cursor()
     _ensure_table(cursor)
     cursor.execute(
@@ -7,9 +7,9 @@ import csv
 import time
 
 from effect_suppression_v4 import (
-    EFFECT_CATALOG,
     MAX_EFFECTS,
     categorize_effect_text,
+    get_effect_catalog,
     resolve_tokens,
     validate_recipe_tokens,
 )
@@ -162,7 +162,7 @@ def find_seed_tokens_for_effect(effect_text: str) -> List[str]:
 
 
 def _effect_kind(effect_text: str) -> str:
-    kind, _tier = EFFECT_CATALOG.get(_norm(effect_text).lower(), ("raw", ""))
+    kind, _tier = get_effect_catalog().get(_norm(effect_text).lower(), ("raw", ""))
     return kind or "raw"
 
 
@@ -0,0 +1,260 @@
+"""
+Compiler and validator for the v5 data pack.
+
+Checks ingredients_v5.json, effect_categories_v5.csv and suppression_rules_v5.json
+and writes the compiled artifact the bot loads (the v5_snapshot format): the
+parsed pack, its derived tables and a CompiledPack with interned effect, kind
+and tier ids, the token table and the rule tables in id form.
+
+Reported problems:
+
+- errors: malformed ingredients (empty main/add texts, codes that do not
+  round-trip through parse_token), block rules with neither then_block nor
+  then_blocked_by_any_of, tiers unknown to the rules, more tokens than /craft
+  buttons can address (MAX_TOKEN_IDS);
+- warnings: effect texts missing from the category catalog (classify_effect_text
+  handles them with its keyword fallback), rule kinds no effect has, catalog
+  effects no ingredient produces.
+
+    python -m alchemy_tools.v5_compile [--data-dir DIR] [--output PATH] [--check] [--strict]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from alchemy_tools.v5_data import V5Data, derived_table, load_v5_data, load_v5_pack_from_sources
+from alchemy_tools.v5_snapshot import write_snapshot
+
+EFFECT_SLOTS = ("main", "add1", "add2", "add3")
+# classify_effect_text expands these kinds into two atoms.
+COMPOSITE_KINDS = {
+    "poison_bleeding": ("poison", "bleeding"),
+    "poison_energy_down": ("poison", "energy_down"),
+}
+# /craft buttons carry token ids as varints of at most two bytes (craft_callbacks).
+MAX_TOKEN_IDS = 1 << 14
+
+
+@dataclass(frozen=True)
+class CompiledPack:
+    effects: Tuple[str, ...]  # effect id -> normalize_text form
+    kinds: Tuple[str, ...]  # kind id -> kind
+    tiers: Tuple[Optional[str], ...]  # tier id -> tier; id 0 is "no tier"
+    effect_kind: Tuple[int, ...]  # effect id -> kind id
+    effect_tier: Tuple[int, ...]  # effect id -> tier id
+    tokens: Tuple[str, ...]  # token id -> "CODE1", sorted
+    token_effects: Tuple[Tuple[int, int], ...]  # token id -> (main effect id, add effect id)
+    exclusive_pairs: Tuple[Tuple[int, int], ...]  # kind ids cancelling each other
+    block_rules: Tuple[Tuple[FrozenSet[int], FrozenSet[int]], ...]  # (if any of, then block), kind ids
+    effect_ids: Dict[str, int] = field(default_factory=dict, compare=False, repr=False)
+    token_ids: Dict[str, int] = field(default_factory=dict, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.effect_ids.update((text, i) for i, text in enumerate(self.effects))
+        self.token_ids.update((token, i) for i, token in enumerate(self.tokens))
+
+
+@dataclass
+class PackReport:
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    def ok(self, strict: bool = False) -> bool:
+        return not self.errors and not (strict and self.warnings)
+
+
+def _effect_kind_and_tier(v5: V5Data, text: str) -> Tuple[str, Optional[str]]:
+    cat = v5.effect_categories.get(text)
+    if cat:
+        return cat.get("kind") or "raw", cat.get("tier")
+    # Same answer as the resolver's keyword fallback.
+    atom = v5.suppression_mod.classify_effect_text(text, v5.effect_categories)[0]
+    return atom.kind, atom.tier
+
+
+def _rule_kinds(cfg: dict) -> Dict[str, List[str]]:
+    """Kind -> where the rules mention it."""
+    out: Dict[str, List[str]] = {}
+
+    def add(kind: Optional[str], where: str) -> None:
+        if kind:
+            out.setdefault(kind, []).append(where)
+
+    for pair in cfg.get("mutual_exclusive_pairs", []):
+        add(pair.get("a"), "mutual_exclusive_pairs")
+        add(pair.get("b"), "mutual_exclusive_pairs")
+    for rule in cfg.get("block_rules", []):
+        for key in ("if_any_of", "then_block", "then_blocked_by_any_of"):
+            for kind in rule.get(key, []):
+                add(kind, f"block_rules.{key}")
+    for rule in cfg.get("composite_suppression", []):
+        add(rule.get("target_kind"), "composite_suppression.target_kind")
+        for req in rule.get("requires_all", []):
+            add(req.get("kind"), "composite_suppression.requires_all")
+            for kind in req.get("kind_any_of", []):
+                add(kind, "composite_suppression.requires_all")
+    return out
+
+
+def _ingredient_effects(v5: V5Data) -> Dict[str, List[str]]:
+    """Normalized effect text -> tokens (or CODE for main effects) producing it."""
+    normalize_text = v5.suppression_mod.normalize_text
+    out: Dict[str, List[str]] = {}
+    for code, ing in v5.ingredient_db.items():
+        for slot in EFFECT_SLOTS:
+            text = normalize_text(ing.get(slot) or "")
+            if text:
+                out.setdefault(text, []).append(code if slot == "main" else f"{code}{slot[-1]}")
+    return out
+
+
+def validate_pack(v5: V5Data) -> PackReport:
+    report = PackReport()
+    mod = v5.suppression_mod
+
+    for code, ing in v5.ingredient_db.items():
+        for idx in (1, 2, 3):
+            try:
+                parsed = mod.parse_token(f"{code}{idx}")
+            except ValueError as exc:
+                parsed = exc
+            if parsed != (code, idx):
+                report.errors.append(f"{code}: token {code}{idx} does not parse back ({parsed})")
+                break
+        for slot in EFFECT_SLOTS:
+            value = ing.get(slot)
+            # Checked on the normalized form: that is what _compile interns.
+            if not isinstance(value, str) or not mod.normalize_text(value):
+                report.errors.append(f"{code}: empty {slot} effect")
+
+    token_count = 3 * len(v5.ingredient_db)
+    if token_count > MAX_TOKEN_IDS:
+        report.errors.append(f"{token_count} tokens, /craft buttons can address at most {MAX_TOKEN_IDS}")
+
+    for i, rule in enumerate(v5.suppression_cfg.get("block_rules", [])):
+        if "then_block" not in rule and "then_blocked_by_any_of" not in rule:
+            report.errors.append(f"block_rules[{i}]: neither then_block nor then_blocked_by_any_of")
+
+    tier_rank = (v5.suppression_cfg.get("poison_antidote_rules") or {}).get("tier_rank") or {}
+    for text, cat in v5.effect_categories.items():
+        tier = cat.get("tier")
+        if tier and tier not in tier_rank:
+            report.errors.append(f"Unknown tier {tier!r} of effect {text!r}")
+
+    produced = _ingredient_effects(v5)
+    for text in sorted(produced.keys() - v5.effect_categories.keys()):
+        kind, _tier = _effect_kind_and_tier(v5, text)
+        report.warnings.append(
+            f"Not in the category catalog (heuristic kind {kind!r}): {text!r} <- {', '.join(produced[text])}"
+        )
+
+    effect_kinds = set()
+    for text in produced.keys() | v5.effect_categories.keys():
+        kind, _tier = _effect_kind_and_tier(v5, text)
+        effect_kinds.add(kind)
+        effect_kinds.update(COMPOSITE_KINDS.get(kind, ()))
+    for kind, where in sorted(_rule_kinds(v5.suppression_cfg).items()):
+        if kind not in effect_kinds:
+            report.warnings.append(f"Rule kind {kind!r} has no effect ({', '.join(sorted(set(where)))})")
+
+    for text in sorted(v5.effect_categories.keys() - produced.keys()):
+        report.warnings.append(f"No ingredient produces catalog effect {text!r}")
+    return report
+
+
+def _block_rule(rule: dict, kinds: Dict[str, int]) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+    """(if any of, then block) kind ids; "X then_blocked_by_any_of Z" is "Z blocks X"."""
+    if "then_block" in rule:
+        blockers, blocked = rule["if_any_of"], rule["then_block"]
+    elif "then_blocked_by_any_of" in rule:
+        blockers, blocked = rule["then_blocked_by_any_of"], rule["if_any_of"]
+    else:
+        raise ValueError(f"Block rule without then_block or then_blocked_by_any_of: {rule!r}")
+    return frozenset(kinds[k] for k in blockers), frozenset(kinds[k] for k in blocked)
+
+
+def _compile(v5: V5Data) -> CompiledPack:
+    normalize_text = v5.suppression_mod.normalize_text
+    effects = sorted(_ingredient_effects(v5).keys() | v5.effect_categories.keys())
+    kinds: Dict[str, int] = {}
+    tiers: Dict[Optional[str], int] = {None: 0}
+    effect_kind, effect_tier = [], []
+    for text in effects:
+        kind, tier = _effect_kind_and_tier(v5, text)
+        effect_kind.append(kinds.setdefault(kind, len(kinds)))
+        effect_tier.append(tiers.setdefault(tier or None, len(tiers)))
+    for kind in _rule_kinds(v5.suppression_cfg):
+        kinds.setdefault(kind, len(kinds))
+
+    effect_ids = {text: i for i, text in enumerate(effects)}
+    tokens = sorted(f"{code}{idx}" for code in v5.ingredient_db for idx in (1, 2, 3))
+    token_effects = []
+    for token in tokens:
+        code, idx = v5.suppression_mod.parse_token(token)
+        ing = v5.ingredient_db[code]
+        ids = []
+        for slot in ("main", f"add{idx}"):
+            effect_id = effect_ids.get(normalize_text(ing.get(slot) or ""))
+            if effect_id is None:
+                # validate_pack reports these; sources loaded without it end up here.
+                raise ValueError(f"{code}: empty {slot} effect (see python -m alchemy_tools.v5_compile --check)")
+            ids.append(effect_id)
+        token_effects.append(tuple(ids))
+
+    cfg = v5.suppression_cfg
+    return CompiledPack(
+        effects=tuple(effects),
+        kinds=tuple(kinds),
+        tiers=tuple(tiers),
+        effect_kind=tuple(effect_kind),
+        effect_tier=tuple(effect_tier),
+        tokens=tuple(tokens),
+        token_effects=tuple(token_effects),
+        exclusive_pairs=tuple((kinds[p["a"]], kinds[p["b"]]) for p in cfg.get("mutual_exclusive_pairs", [])),
+        block_rules=tuple(_block_rule(rule, kinds) for rule in cfg.get("block_rules", [])),
+    )
+
+
+def get_compiled_pack(v5: Optional[V5Data] = None) -> CompiledPack:
+    """Interned id tables of a pack, built once and kept in V5Data.derived."""
+    return derived_table(v5 or load_v5_data(), "compiled", _compile)
+
+
+def compile_pack(
+    data_dir: Optional[Path] = None, output: Optional[Path] = None, strict: bool = False, write: bool = True
+) -> Tuple[PackReport, Optional[Path]]:
+    """Validate the pack sources and, unless they have errors, write the artifact."""
+    v5 = load_v5_pack_from_sources(data_dir)
+    report = validate_pack(v5)
+    if not write or not report.ok(strict):
+        return report, None
+    return report, write_snapshot(v5, output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Validate the v5 data pack and write the compiled artifact.")
+    parser.add_argument("--data-dir", type=Path, default=None, help="pack directory (default: as the bot)")
+    parser.add_argument("--output", type=Path, default=None, help="artifact path (default: next to the pack)")
+    parser.add_argument("--check", action="store_true", help="only validate, write nothing")
+    parser.add_argument("--strict", action="store_true", help="treat warnings as errors")
+    args = parser.parse_args()
+
+    report, path = compile_pack(args.data_dir, args.output, strict=args.strict, write=not args.check)
+    for line in report.errors:
+        print(f"ERROR: {line}")
+    for line in report.warnings:
+        print(f"WARNING: {line}")
+    print(f"{len(report.errors)} error(s), {len(report.warnings)} warning(s)")
+    if path is not None:
+        print(f"Compiled pack written: {path}")
+    if not report.ok(args.strict):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
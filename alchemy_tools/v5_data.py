@@ -1,11 +1,20 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
 import importlib.util
 import json
-import csv
+import logging
+import threading
+
+from alchemy_tools.effect_index import EffectTextIndex
+from alchemy_tools.v5_snapshot import SNAPSHOT_NAME, SOURCE_FILES, read_snapshot
+
+logger = logging.getLogger(__name__)
 
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -37,9 +46,24 @@ class V5Data:
     effect_categories: Dict[str, Dict[str, Any]]
     suppression_cfg: Dict[str, Any]
     suppression_mod: Any
+    # Tables derived from this pack (search indexes, ...), built once per pack;
+    # see derived_table.
+    derived: Dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+    # Increases with every pack swapped in by this process (see reload_v5_data).
+    version: int = field(default=0, compare=False)
 
 
+# The current pack. Readers take the reference without locking; it is only
+# ever replaced as a whole, never mutated.
 _CACHE: Optional[V5Data] = None
+_FINGERPRINT: Optional[Tuple] = None
+_VERSION = 0
+_LOCK = threading.Lock()
+_RELOAD_LOCK = threading.Lock()
+_DERIVED_LOCK = threading.RLock()
+_PINNED: ContextVar[Optional[V5Data]] = ContextVar("v5_pinned", default=None)
+_COMPILED_ONLY = False
+PACK_POLL_INTERVAL = 30.0
 
 
 def _import_effect_suppression_v5(data_dir: Path):
@@ -60,26 +84,137 @@ def _import_effect_suppression_v5(data_dir: Path):
     return module
 
 
-def load_v5_data() -> V5Data:
-    global _CACHE
-    if _CACHE is not None:
-        return _CACHE
-
-    data_dir = _data_dir()
-    mod = _import_effect_suppression_v5(data_dir)
+def load_v5_pack_from_sources(data_dir: Optional[Path] = None, mod: Any = None) -> V5Data:
+    """Parse the v5 pack files (no snapshot, no caching)."""
+    data_dir = data_dir or _data_dir()
+    mod = mod or _import_effect_suppression_v5(data_dir)
 
     cfg = json.loads((data_dir / "suppression_rules_v5.json").read_text(encoding="utf-8"))
     ingredients = json.loads((data_dir / "ingredients_v5.json").read_text(encoding="utf-8"))["ingredients"]
     cats = mod.load_effect_categories(str(data_dir / "effect_categories_v5.csv"))
 
-    _CACHE = V5Data(
+    v5 = V5Data(
         data_dir=data_dir,
         ingredient_db=ingredients,
         effect_categories=cats,
         suppression_cfg=cfg,
         suppression_mod=mod,
     )
-    return _CACHE
+    get_effect_text_index(v5)
+    return v5
+
+
+def _load_v5_pack(data_dir: Path) -> V5Data:
+    # Prefer the binary snapshot (see v5_snapshot) when it matches the sources.
+    # The pack module goes first: pickled tables refer to its functions.
+    mod = _import_effect_suppression_v5(data_dir)
+    snapshot = read_snapshot(data_dir, verify_sources=not _COMPILED_ONLY)
+    if snapshot is None:
+        if _COMPILED_ONLY:
+            raise FileNotFoundError(
+                f"No compiled pack in {data_dir}; run python -m alchemy_tools.v5_compile"
+            )
+        return load_v5_pack_from_sources(data_dir, mod)
+    return V5Data(
+        data_dir=data_dir,
+        ingredient_db=snapshot["ingredient_db"],
+        effect_categories=snapshot["effect_categories"],
+        suppression_cfg=snapshot["suppression_cfg"],
+        suppression_mod=mod,
+        derived=snapshot["derived"],
+    )
+
+
+def require_compiled_pack(enabled: bool = True) -> None:
+    """
+    Load the pack only from the compiled artifact (see v5_compile), even if
+    the sources changed since, and watch only the artifact for reloads.
+    """
+    global _COMPILED_ONLY
+    _COMPILED_ONLY = enabled
+
+
+def pack_fingerprint(data_dir: Path) -> Tuple:
+    """(name, mtime, size) of every file a pack is loaded from; cheap change detection."""
+    out = []
+    for name in (SNAPSHOT_NAME,) if _COMPILED_ONLY else SOURCE_FILES:
+        try:
+            st = (Path(data_dir) / name).stat()
+        except FileNotFoundError:
+            out.append((name, None, None))
+        else:
+            out.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(out)
+
+
+def _install(v5: V5Data, fingerprint: Tuple) -> V5Data:
+    global _CACHE, _FINGERPRINT, _VERSION
+    with _LOCK:
+        _VERSION += 1
+        _CACHE = replace(v5, version=_VERSION)
+        _FINGERPRINT = fingerprint
+        return _CACHE
+
+
+def load_v5_data() -> V5Data:
+    pinned = _PINNED.get()
+    if pinned is not None:
+        return pinned
+    v5 = _CACHE
+    if v5 is not None:
+        return v5
+    with _RELOAD_LOCK:
+        if _CACHE is not None:
+            return _CACHE
+        data_dir = _data_dir()
+        # Stat before reading so an edit during the load is picked up later.
+        fingerprint = pack_fingerprint(data_dir)
+        return _install(_load_v5_pack(data_dir), fingerprint)
+
+
+def reload_v5_data(force: bool = False) -> bool:
+    """
+    Rebuild the pack (and its derived tables) if its files changed since it was
+    loaded, then swap it in. Returns True if a new pack was installed.
+
+    Callers holding the old V5Data (or inside pinned_v5_data) keep using it.
+    """
+    with _RELOAD_LOCK:
+        data_dir = _data_dir()
+        fingerprint = pack_fingerprint(data_dir)
+        current = _CACHE
+        if not force and current is not None and current.data_dir == data_dir and fingerprint == _FINGERPRINT:
+            return False
+        v5 = _load_v5_pack(data_dir)
+        build_derived_tables(v5)
+        v5 = _install(v5, fingerprint)
+    logger.info("Loaded v5 pack version %d from %s", v5.version, data_dir)
+    return True
+
+
+@contextmanager
+def pinned_v5_data(v5: Optional[V5Data] = None) -> Iterator[V5Data]:
+    """
+    Make load_v5_data() return one pack for the duration of the block, so a
+    long search is not split across a reload.
+    """
+    v5 = v5 or load_v5_data()
+    token = _PINNED.set(v5)
+    try:
+        yield v5
+    finally:
+        _PINNED.reset(token)
+
+
+async def watch_v5_pack(interval: float = PACK_POLL_INTERVAL) -> None:
+    """Poll the pack files and reload them when they change (run as a task)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Parsing and index builds run off the event loop.
+            await asyncio.to_thread(reload_v5_data)
+        except Exception:
+            logger.exception("Failed to reload the v5 pack, keeping the current one")
 
 
 def resolve_tokens(tokens: List[str]):
@@ -103,49 +238,113 @@ def get_main_effect_for_code(code: str) -> str:
     return ing.get("main", "") or ""
 
 
-def search_effect_texts(query: str, limit: int = 12) -> List[str]:
+def derived_table(v5: V5Data, name: str, build: Callable[[V5Data], Any]) -> Any:
+    """Return v5.derived[name], building it once per pack."""
+    table = v5.derived.get(name)
+    if table is None:
+        with _DERIVED_LOCK:
+            table = v5.derived.get(name)
+            if table is None:
+                table = v5.derived[name] = build(v5)
+    return table
+
+
+def build_derived_tables(v5: V5Data) -> None:
+    """Build every derived table up front (snapshots, background reloads)."""
+    from alchemy_tools.v5_compile import get_compiled_pack
+    from alchemy_tools.v5_recipe_search import get_token_table
+
+    get_effect_text_index(v5)
+    get_effect_producer_table(v5)
+    get_token_table(v5)
+    get_compiled_pack(v5)
+
+
+def get_effect_text_index(v5: Optional[V5Data] = None) -> EffectTextIndex:
+    return derived_table(
+        v5 or load_v5_data(),
+        "effect_text_index",
+        lambda v5: EffectTextIndex(v5.effect_categories, v5.suppression_mod.normalize_key),
+    )
+
+
+@dataclass(frozen=True)
+class EffectProducers:
+    """Ingredients producing one effect (normalize_text form)."""
+
+    effect: str
+    kind: str
+    # Codes whose main effect it is: every CODE1/2/3 token produces it.
+    main_codes: Tuple[str, ...]
+    # Tokens producing it as their additional effect.
+    add_tokens: Tuple[str, ...]
+
+    def tokens(self) -> List[str]:
+        out = {f"{code}{i}" for code in self.main_codes for i in (1, 2, 3)}
+        out.update(self.add_tokens)
+        return sorted(out)
+
+
+def _build_effect_producers(v5: V5Data) -> Dict[str, EffectProducers]:
+    normalize_text = v5.suppression_mod.normalize_text
+    mains: Dict[str, List[str]] = {}
+    adds: Dict[str, List[str]] = {}
+    for code, ing in v5.ingredient_db.items():
+        main = normalize_text(ing.get("main", ""))
+        if main:
+            mains.setdefault(main, []).append(code)
+        for i in (1, 2, 3):
+            add = normalize_text(ing.get(f"add{i}", ""))
+            if add:
+                adds.setdefault(add, []).append(f"{code}{i}")
+    out = {}
+    for effect in mains.keys() | adds.keys():
+        cat = v5.effect_categories.get(effect) or {}
+        out[effect] = EffectProducers(
+            effect=effect,
+            kind=(cat.get("kind") or "raw").strip(),
+            main_codes=tuple(sorted(mains.get(effect, ()))),
+            add_tokens=tuple(sorted(adds.get(effect, ()))),
+        )
+    return out
+
+
+def get_effect_producer_table(v5: Optional[V5Data] = None) -> Dict[str, EffectProducers]:
+    """Reverse index effect -> producing ingredients, built once per pack."""
+    return derived_table(v5 or load_v5_data(), "effect_producers", _build_effect_producers)
+
+
+def get_effect_producers(effect_text: str, v5: Optional[V5Data] = None) -> Optional[EffectProducers]:
+    v5 = v5 or load_v5_data()
+    return get_effect_producer_table(v5).get(v5.suppression_mod.normalize_text(effect_text))
+
+
+def search_effect_texts(query: str, limit: int = 12, producible_only: bool = False) -> List[str]:
     """
     Search canonical effect texts (v5) for selection UI.
+
+    Substring matches come first, ordered by (position, length); without any,
+    texts within a small edit distance of the query are returned instead.
+    With producible_only, texts no ingredient produces are skipped.
     """
     v5 = load_v5_data()
-    q = v5.suppression_mod.normalize_key(query)
-    if not q:
-        return []
+    index = get_effect_text_index(v5)
+    if not producible_only:
+        return index.search(query, limit=limit) or index.fuzzy_search(query, limit=limit)
+
+    producers = get_effect_producer_table(v5)
+    normalize_text = v5.suppression_mod.normalize_text
 
-    # We don't store the raw list in memory; scan CSV once and cache would be nice,
-    # but 200-300 rows is small.
-    path = v5.data_dir / "effect_categories_v5.csv"
-    scored: List[Tuple[Tuple[int, int], str]] = []
-    with path.open(newline="", encoding="utf-8-sig") as handle:
-        reader = csv.DictReader(handle)
-        for row in reader:
-            text = v5.suppression_mod.normalize_text(row.get("effect_text", ""))
-            if not text:
-                continue
-            tl = v5.suppression_mod.normalize_key(text)
-            pos = tl.find(q)
-            if pos < 0:
-                continue
-            scored.append(((pos, len(text)), text))
-    scored.sort(key=lambda x: (x[0], x[1].lower()))
-    return [t for _s, t in scored[:limit]]
+    def producible(texts: List[str]) -> List[str]:
+        return [t for t in texts if normalize_text(t) in producers][:limit]
+
+    everything = len(index.texts)
+    return producible(index.search(query, limit=everything)) or producible(index.fuzzy_search(query, limit=everything))
 
 
 def tokens_producing_effect(effect_text: str, limit: int = 30) -> List[str]:
     """
     Return selection tokens CODE1/2/3 where either main or add matches effect_text.
     """
-    v5 = load_v5_data()
-    target = v5.suppression_mod.normalize_text(effect_text)
-    out: List[str] = []
-    for code, ing in v5.ingredient_db.items():
-        main = v5.suppression_mod.normalize_text(ing.get("main", ""))
-        if main == target:
-            out.extend([f"{code}1", f"{code}2", f"{code}3"])
-            continue
-        for i in (1, 2, 3):
-            add = v5.suppression_mod.normalize_text(ing.get(f"add{i}", ""))
-            if add == target:
-                out.append(f"{code}{i}")
-    out.sort()
-    return out[:limit]
+    producers = get_effect_producers(effect_text)
+    return producers.tokens()[:limit] if producers else []
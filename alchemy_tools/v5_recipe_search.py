@@ -7,7 +7,7 @@ import itertools
 import random
 import time
 
-from alchemy_tools.v5_data import load_v5_data
+from alchemy_tools.v5_data import derived_table, get_effect_producers, load_v5_data, pinned_v5_data
 
 
 FORMULA_SIZE = 5
@@ -66,9 +66,6 @@ class RecipeCandidate:
     harm: int
 
 
-_TOKENS: Optional[Dict[str, TokenInfo]] = None
-
-
 def _validate_formula_tokens(tokens: Sequence[str]) -> None:
     v5 = load_v5_data()
     if len(tokens) != FORMULA_SIZE:
@@ -82,8 +79,8 @@ def _validate_formula_tokens(tokens: Sequence[str]) -> None:
             raise ValueError(f"Ингредиент {code} использован {n} раз(а) (лимит 2)")
 
 
-def _effect_kind(effect_text: str) -> str:
-    v5 = load_v5_data()
+def _effect_kind(effect_text: str, v5=None) -> str:
+    v5 = v5 or load_v5_data()
     key = v5.suppression_mod.normalize_text(effect_text)
     cat = v5.effect_categories.get(key)
     if not cat:
@@ -102,8 +99,8 @@ def _harm_score(final_effects: List[str]) -> int:
     return harm
 
 
-def _build_tokens() -> Dict[str, TokenInfo]:
-    v5 = load_v5_data()
+def _build_tokens(v5=None) -> Dict[str, TokenInfo]:
+    v5 = v5 or load_v5_data()
     out: Dict[str, TokenInfo] = {}
     for code, ing in v5.ingredient_db.items():
         main = v5.suppression_mod.normalize_text(ing.get("main", ""))
@@ -114,7 +111,7 @@ def _build_tokens() -> Dict[str, TokenInfo]:
             if not add:
                 continue
             token = f"{code}{idx}"
-            kinds = tuple(sorted({_effect_kind(main), _effect_kind(add)}))
+            kinds = tuple(sorted({_effect_kind(main, v5), _effect_kind(add, v5)}))
             out[token] = TokenInfo(
                 token=token,
                 code=code,
@@ -126,11 +123,13 @@ def _build_tokens() -> Dict[str, TokenInfo]:
     return out
 
 
+def get_token_table(v5=None) -> Dict[str, TokenInfo]:
+    """Selection tokens of a pack, built once and kept in V5Data.derived."""
+    return derived_table(v5 or load_v5_data(), "recipe_tokens", _build_tokens)
+
+
 def _all_tokens() -> Dict[str, TokenInfo]:
-    global _TOKENS
-    if _TOKENS is None:
-        _TOKENS = _build_tokens()
-    return _TOKENS
+    return get_token_table()
 
 
 def _token_rank(info: TokenInfo) -> int:
@@ -142,16 +141,13 @@ def _token_rank(info: TokenInfo) -> int:
 
 
 def _seed_tokens(effect_text: str, max_seeds: int) -> List[str]:
-    v5 = load_v5_data()
-    target = v5.suppression_mod.normalize_text(effect_text)
+    producers = get_effect_producers(effect_text)
+    if producers is None:
+        return []
     tokens = _all_tokens()
-    out: List[str] = []
-    for tok, info in tokens.items():
-        if info.main_effect == target:
-            out.append(tok)
-        elif info.add_effect == target:
-            out.append(tok)
-    out = sorted(set(out), key=lambda t: (0 if tokens[t].add_effect == target else 1, t))
+    adds = set(producers.add_tokens)
+    out = [t for t in producers.tokens() if t in tokens]
+    out.sort(key=lambda t: (0 if t in adds else 1, t))
     return out[:max_seeds]
 
 
@@ -256,7 +252,31 @@ def find_best_recipes_for_effect(
     - strict preference: 1 final effect, else 2, else 3, else 4
     - tie-break by harm, then lexicographic tokens
     - search space constrained by a token pool derived from seeds + support-ish tokens
+
+    The whole search runs on the pack current at its start, even if the pack is
+    reloaded meanwhile.
     """
+    with pinned_v5_data():
+        return _find_best_recipes_for_effect(
+            effect_text,
+            pool_size=pool_size,
+            max_seeds=max_seeds,
+            max_results=max_results,
+            time_budget_sec=time_budget_sec,
+            beam_width=beam_width,
+            expand_per_state=expand_per_state,
+        )
+
+
+def _find_best_recipes_for_effect(
+    effect_text: str,
+    pool_size: int,
+    max_seeds: int,
+    max_results: int,
+    time_budget_sec: float,
+    beam_width: int,
+    expand_per_state: int,
+) -> List[RecipeCandidate]:
     v5 = load_v5_data()
     effect_text = v5.suppression_mod.normalize_text(effect_text)
 
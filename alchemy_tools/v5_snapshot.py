@@ -0,0 +1,102 @@
+"""
+Binary snapshot of the loaded v5 data pack.
+
+The snapshot holds the parsed and normalized pack (ingredients, effect
+categories, suppression rules) plus the tables derived from it (effect text
+index, effect producers, recipe token table, compiled id tables) in one file:
+
+    MAGIC | format version (u16) | sha256 of the pack sources | pickle body
+
+It is the compiled pack artifact written by `python -m alchemy_tools.v5_compile`.
+load_v5_data reads it with a single read when the source hash matches and
+falls back to parsing the pack otherwise; the bot loads only the artifact (see
+v5_data.require_compiled_pack). The suppression module itself is code and is
+still imported from the pack.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ALCHV5SN"
+# Bump when the pickled layout or a derived-table builder changes.
+SNAPSHOT_VERSION = 4
+SNAPSHOT_NAME = "v5_pack.snapshot"
+SOURCE_FILES = (
+    "effect_suppression_v5.py",
+    "suppression_rules_v5.json",
+    "ingredients_v5.json",
+    "effect_categories_v5.csv",
+)
+_HEADER = struct.Struct(f"<{len(MAGIC)}sH32s")
+
+
+def snapshot_path(data_dir: Path) -> Path:
+    return Path(data_dir) / SNAPSHOT_NAME
+
+
+def source_hash(data_dir: Path) -> bytes:
+    digest = hashlib.sha256()
+    digest.update(struct.pack("<H", SNAPSHOT_VERSION))
+    for name in SOURCE_FILES:
+        content = (Path(data_dir) / name).read_bytes()
+        digest.update(name.encode("utf-8"))
+        digest.update(struct.pack("<Q", len(content)))
+        digest.update(content)
+    return digest.digest()
+
+
+def write_snapshot(v5, path: Optional[Path] = None) -> Path:
+    """Build every derived table of v5 and write the snapshot next to the pack."""
+    from alchemy_tools.v5_data import build_derived_tables
+
+    build_derived_tables(v5)
+    body = pickle.dumps(
+        {
+            "ingredient_db": v5.ingredient_db,
+            "effect_categories": v5.effect_categories,
+            "suppression_cfg": v5.suppression_cfg,
+            "derived": dict(v5.derived),
+        },
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    path = Path(path or snapshot_path(v5.data_dir))
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, source_hash(v5.data_dir)) + body)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(data_dir: Path, path: Optional[Path] = None, verify_sources: bool = True) -> Optional[dict[str, Any]]:
+    """
+    Return the snapshot contents, or None if missing, unreadable or (with
+    verify_sources) stale.
+    """
+    path = Path(path or snapshot_path(data_dir))
+    try:
+        blob = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    if len(blob) < _HEADER.size:
+        return None
+    magic, version, stored_hash = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    # Compiled-only mode trusts the artifact and does not read the sources at all.
+    if verify_sources and stored_hash != source_hash(data_dir):
+        logger.info("Snapshot %s is stale, loading the v5 pack from source", path)
+        return None
+    try:
+        return pickle.loads(memoryview(blob)[_HEADER.size:])
+    except Exception:
+        logger.exception("Cannot read snapshot %s", path)
+        return None
+
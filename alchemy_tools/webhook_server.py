@@ -0,0 +1,237 @@
+"""
+Webhook deployment mode: an embedded asyncio HTTP server feeding PTB.
+
+Telegram POSTs each update as JSON to the webhook URL; the server checks the
+`X-Telegram-Bot-Api-Secret-Token` header, puts the update on the
+application's update_queue and answers 200 right away. Unlike getUpdates
+polling, any number of replicas can serve the same bot behind a load balancer,
+so rolling deploys do not hit the polling Conflict.
+
+Enabled by main() when WEBHOOK_URL is set:
+
+    WEBHOOK_URL=https://bot.example.org/telegram   public URL registered with Telegram
+    WEBHOOK_SECRET=...                             secret token (A-Z, a-z, 0-9, _ and -)
+    WEBHOOK_LISTEN=0.0.0.0  WEBHOOK_PORT=8443      local address of the server
+    WEBHOOK_MAX_CONNECTIONS=40                     open connections (Telegram and local); more get 503
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1 << 20
+HEADER_TIMEOUT = 30.0
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+@dataclass(frozen=True)
+class WebhookConfig:
+    url: str
+    secret_token: str
+    listen: str = "0.0.0.0"
+    port: int = 8443
+    max_connections: int = 40
+
+    @property
+    def path(self) -> str:
+        return urlsplit(self.url).path or "/"
+
+    @classmethod
+    def from_env(cls) -> Optional["WebhookConfig"]:
+        """Webhook settings from the environment, or None for polling mode."""
+        url = os.getenv("WEBHOOK_URL")
+        if not url:
+            return None
+        secret = os.getenv("WEBHOOK_SECRET")
+        if not secret:
+            raise RuntimeError("WEBHOOK_SECRET не задан: он обязателен в режиме webhook")
+        return cls(
+            url=url,
+            secret_token=secret,
+            listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+            port=int(os.getenv("WEBHOOK_PORT", "8443")),
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+        )
+
+
+class WebhookServer:
+    """Minimal HTTP/1.1 server accepting Telegram updates for one application."""
+
+    def __init__(self, application, config: WebhookConfig) -> None:
+        self.application = application
+        self.config = config
+        self._secret = config.secret_token.encode("utf-8")
+        self._slots = asyncio.Semaphore(config.max_connections)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def port(self) -> int:
+        """Bound port (useful with port 0)."""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve_connection, self.config.listen, self.config.port)
+        logger.info("Webhook server listening on %s:%d%s", self.config.listen, self.port, self.config.path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self._slots.locked():
+            # Over max_connections: refuse right away instead of holding sockets.
+            try:
+                writer.write(_response(503, keep_alive=False))
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+            return
+        async with self._slots:
+            try:
+                await self._serve_requests(reader, writer)
+            finally:
+                writer.close()
+
+    async def _serve_requests(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Telegram keeps connections alive; serve requests until it closes.
+        while True:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), HEADER_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+                return
+            if request is None:
+                return
+            method, target, headers, body = request
+            status = await self._handle(method, target, headers, body)
+            keep_alive = headers.get("connection", "").lower() != "close"
+            writer.write(_response(status, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _version = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_SIZE:
+            # Refuse without reading; the connection is closed afterwards.
+            headers["connection"] = "close"
+            return method, target, headers, None
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    async def _handle(self, method: str, target: str, headers: dict, body: Optional[bytes]) -> int:
+        if urlsplit(target).path != self.config.path:
+            return 404
+        if method != "POST":
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode("utf-8"), self._secret):
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return 403
+        if body is None:
+            return 413
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("update is not a JSON object")
+            update = Update.de_json(payload, self.application.bot)
+        except Exception:
+            logger.warning("Rejected malformed webhook update", exc_info=True)
+            return 400
+        await self.application.update_queue.put(update)
+        return 200
+
+
+def _response(status: int, keep_alive: bool) -> bytes:
+    return (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        f"Content-Length: 0\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode("ascii")
+
+
+async def serve_webhook(application, config: WebhookConfig, stop: Optional[asyncio.Event] = None,
+                        register: bool = True) -> None:
+    """
+    Run the application on the webhook server until `stop` is set, with the
+    same lifecycle hooks as run_polling (post_init, post_stop, post_shutdown).
+
+    register=True (re)registers the webhook with Telegram; it is idempotent, so
+    every replica may do it. The webhook is left in place on shutdown so the
+    other replicas keep receiving updates.
+    """
+    stop = stop or asyncio.Event()
+    await application.initialize()
+    server = WebhookServer(application, config)
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        if register:
+            await application.bot.set_webhook(
+                url=config.url,
+                secret_token=config.secret_token,
+                max_connections=config.max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        await server.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application, config: WebhookConfig) -> None:
+    """Blocking entry point: serve until SIGINT/SIGTERM."""
+
+    async def _main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        await serve_webhook(application, config, stop)
+
+    asyncio.run(_main())
@@ -11,7 +11,8 @@ which resolves either:
 - formula selection tokens: resolve_formula_tokens(["AM1", ...])
 
 Keep a small compatibility surface for the rest of the codebase:
-- MAX_EFFECTS: max number of final effects allowed
+- max_effects() / MAX_EFFECTS: max number of final effects allowed (read from
+  the pack on first use, so importing this module stays cheap)
 - parse_selection_token(token) -> (code, idx)
 - validate_recipe_tokens(tokens) -> None  (5 tokens, no dupes, <=2 per code)
 - suppress_effect_texts(effect_texts, ...) -> SuppressionResult
@@ -43,7 +44,16 @@ def _max_effects() -> int:
         return 4
 
 
-MAX_EFFECTS = _max_effects()
+def max_effects() -> int:
+    # Not cached: the pack may be reloaded at runtime.
+    return _max_effects()
+
+
+def __getattr__(name: str):
+    # MAX_EFFECTS used to be computed at import time, which loaded the v5 pack.
+    if name == "MAX_EFFECTS":
+        return max_effects()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def parse_selection_token(token: str) -> Tuple[str, int]:
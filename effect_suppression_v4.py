@@ -22,6 +22,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from collections import Counter
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import csv
@@ -84,7 +85,16 @@ def _load_effect_catalog() -> Dict[str, Tuple[str, str]]:
     return catalog
 
 
-EFFECT_CATALOG = _load_effect_catalog()
+@lru_cache(maxsize=1)
+def get_effect_catalog() -> Dict[str, Tuple[str, str]]:
+    """effect_text -> (kind, tier), read from the CSV on first use."""
+    return _load_effect_catalog()
+
+
+def __getattr__(name: str):
+    if name == "EFFECT_CATALOG":
+        return get_effect_catalog()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 KIND_TO_TOKEN = {
     "balance": "BALANCE",
@@ -282,7 +292,7 @@ def categorize_effect_text(text: str) -> List[str]:
         return []
     lt = _lower(text)
 
-    catalog_entry = EFFECT_CATALOG.get(lt)
+    catalog_entry = get_effect_catalog().get(lt)
     if catalog_entry:
         kind, tier = catalog_entry
         if kind == "raw" or not kind:
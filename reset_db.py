@@ -1,17 +1,35 @@
-from alchemy_tools.db_setup import setup_database
-from alchemy_tools.db_fill import fill_ingredients_table_v5, user_testing_add_all_ingredients
-import os
+from alchemy_tools.db_setup import build_catalog_database, setup_database
+from alchemy_tools.db_fill import fill_ingredients_table_v5
+from alchemy_tools.recipes import backfill_recipe_digests
+from alchemy_tools.v5_compile import compile_pack
 import logging
+import sys
 logging.basicConfig(level=logging.INFO)
 DB_PATH = "alchemy.db"
+CATALOG_DB_PATH = "catalog.db"
 
 def main():
-    if os.path.exists(DB_PATH):
-        logging.info("DB deleted")
-        os.remove(DB_PATH)
-    setup_database()
-    fill_ingredients_table_v5()
-    user_testing_add_all_ingredients()
+    # The pack is validated and compiled first: with errors nothing is
+    # rebuilt, so the catalog and the bot's artifact stay as they were.
+    report, path = compile_pack()
+    for line in report.errors:
+        logging.error("Pack: %s", line)
+    for line in report.warnings:
+        logging.warning("Pack: %s", line)
+    if path is None:
+        logging.error("Pack has errors, catalog not rebuilt and compiled pack not written")
+        sys.exit(1)
+    logging.info("Compiled pack written: %s", path)
+    # The catalog is rebuilt from the data pack and swapped in; user state in
+    # DB_PATH (recipes, inventories, settings) is kept, and so are ingredient
+    # ids. A running bot picks up the new file within a second
+    # (db_wrapper.CATALOG_CHECK_INTERVAL).
+    build_catalog_database(
+        CATALOG_DB_PATH, lambda path: fill_ingredients_table_v5(db_path=path), user_db_path=DB_PATH
+    )
+    logging.info("Catalog rebuilt: %s", CATALOG_DB_PATH)
+    setup_database(DB_PATH, catalog_path=CATALOG_DB_PATH)
+    backfill_recipe_digests(DB_PATH)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from alchemy_tools.admission import AdmissionController, AdmissionRejected
+
+
+def test_slots_go_to_users_with_the_fewest_running_searches():
+    async def scenario():
+        controller = AdmissionController(slots=1, max_queue=10, per_user=3)
+        started, positions = [], {}
+        release = asyncio.Event()
+
+        async def search(user_id, name):
+            async def notify(position):
+                positions[name] = position
+
+            async with controller.slot(user_id, on_queued=notify):
+                started.append(name)
+                await release.wait()
+
+        tasks = [asyncio.create_task(search(user, name)) for user, name in [(1, "a1"), (1, "a2"), (1, "a3"), (2, "b1")]]
+        await asyncio.sleep(0)
+        assert started == ["a1"] and controller.queued == 3
+        # b1 arrived last but its user holds no slot, so it goes first.
+        assert positions == {"a2": 1, "a3": 2, "b1": 1}
+
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot(1):
+                pass
+        assert exc.value.reason == "user_limit"
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    assert asyncio.run(scenario()) == ["a1", "b1", "a2", "a3"]
+
+
+def test_bounded_queue_and_cancelled_waiters():
+    async def scenario():
+        controller = AdmissionController(slots=1, max_queue=1, per_user=1)
+        release = asyncio.Event()
+
+        async def search(user_id):
+            async with controller.slot(user_id):
+                await release.wait()
+
+        running = asyncio.create_task(search(1))
+        waiting = asyncio.create_task(search(2))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot(3):
+                pass
+        assert exc.value.reason == "queue_full"
+
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert controller.queued == 0
+        release.set()
+        await running
+        async with controller.slot(3):
+            assert controller.queued == 0
+
+    asyncio.run(scenario())
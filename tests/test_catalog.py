@@ -0,0 +1,36 @@
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, effects_tools
+
+
+@pytest.fixture
+def filled_catalog(tmp_path, monkeypatch):
+    db_path = tmp_path / "alchemy.db"
+    db_setup.setup_database(db_path)
+    monkeypatch.setattr(db_fill, "DB_PATH", str(db_path))
+    monkeypatch.setattr(catalog, "DB_PATH", str(db_path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    db_fill.fill_ingredients_table_v5()
+    return db_path
+
+
+def test_catalog_answers_lookups_from_memory(filled_catalog):
+    am_id = effects_tools.get_ingredient_id("AM")
+    # Once loaded, lookups must not touch the database file.
+    filled_catalog.unlink()
+
+    assert effects_tools.get_ingredient_code_by_id(am_id) == "AM"
+    assert effects_tools.get_ingredient_name_by_id(am_id) == "Яд Мантикоры/Яд Бабая"
+    assert effects_tools.get_ingredient_name_by_id(-1) == "Неизвестный ингредиент"
+    assert effects_tools.get_ingredient_code_by_id(-1) is None
+
+    properties = effects_tools.get_properties_by_ingredient_id(am_id)
+    assert [row[3] for row in properties] == [0, 1, 2, 3]
+    assert properties[0][:3] == ("Смертельный Яд", "poison", 4)
+
+    main_property, additional = effects_tools.get_all_properties_by_ingredient_id(am_id)
+    assert main_property[0] == "AM"
+    assert len(additional) == 3
+
+    with pytest.raises(ValueError):
+        effects_tools.get_ingredient_id("NOPE")
@@ -0,0 +1,54 @@
+import pytest
+
+from alchemy_tools import craft_callbacks
+from alchemy_tools.craft_callbacks import CraftCallback, decode_callback, encode_callback
+from alchemy_tools.v5_compile import get_compiled_pack
+
+
+def test_full_formula_round_trips_within_the_limit():
+    compiled = get_compiled_pack()
+    formula = tuple(compiled.token_ids[t] for t in ("AM1", "AM2", compiled.tokens[-1], compiled.tokens[0]))
+    for callback in (
+        CraftCallback(craft_callbacks.OP_EFFECT, formula, page=3, token=compiled.token_ids["AM3"]),
+        CraftCallback(craft_callbacks.OP_INGREDIENT, formula, page=0, token=0),
+        CraftCallback(craft_callbacks.OP_PAGE, formula, page=2),
+        CraftCallback(craft_callbacks.OP_DONE, formula + (1,)),
+        CraftCallback(craft_callbacks.OP_DONE),
+    ):
+        data = encode_callback(callback)
+        assert len(data.encode("utf-8")) <= craft_callbacks.MAX_CALLBACK_DATA
+        assert decode_callback(data) == callback
+    assert craft_callbacks.formula_tokens(formula[:2]) == ["AM1", "AM2"]
+
+
+def test_stale_or_mangled_callbacks_are_rejected():
+    compiled = get_compiled_pack()
+    data = encode_callback(CraftCallback(craft_callbacks.OP_PAGE, (1, 2), page=1))
+    flipped = data[:-1] + ("A" if data[-1] != "A" else "B")
+    assert decode_callback(flipped) is None
+    assert decode_callback(data[:4]) is None
+    assert decode_callback("add_12") is None and decode_callback("cfx" + data[3:]) is None
+    assert decode_callback("cf" + "d" + "!!!") is None
+
+    # A pack with another token table (ids shifted) invalidates old buttons.
+    shifted = compiled.__class__(**{**compiled.__dict__, "tokens": compiled.tokens[1:], "effect_ids": {}, "token_ids": {}})
+    assert decode_callback(data, shifted) is None
+    assert decode_callback(encode_callback(CraftCallback(craft_callbacks.OP_PAGE, (1,)), shifted), shifted).formula == (1,)
+
+
+def test_token_ids_past_one_byte_round_trip():
+    compiled = get_compiled_pack()
+    tokens = tuple(f"T{i:04d}" for i in range(2000))
+    big = compiled.__class__(**{**compiled.__dict__, "tokens": tokens, "effect_ids": {}, "token_ids": {}})
+    formula = (0, 127, 128, 1999, 1500)
+    callback = CraftCallback(craft_callbacks.OP_EFFECT, formula, page=130, token=300)
+    data = encode_callback(callback, big)
+    assert len(data.encode("utf-8")) <= craft_callbacks.MAX_CALLBACK_DATA
+    assert decode_callback(data, big) == callback
+
+    codec = craft_callbacks.callback_codec(big)
+    with pytest.raises(ValueError):
+        codec.encode(CraftCallback(craft_callbacks.OP_EFFECT, formula, token=None))
+    with pytest.raises(ValueError):
+        codec.encode(CraftCallback(craft_callbacks.OP_DONE, (craft_callbacks.MAX_TOKEN_IDS,)))
+    assert craft_callbacks.callback_codec() is craft_callbacks.callback_codec(compiled)
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+import pytest
+
+from alchemy_tools import user_settings
+from alchemy_tools.db_async import DBExecutor
+
+
+def test_db_executor_runs_calls_off_loop_in_order():
+    executor = DBExecutor(name="test-db")
+    seen = []
+
+    def record(value):
+        seen.append((value, threading.current_thread().name))
+        return value * 2
+
+    async def scenario():
+        return await asyncio.gather(*(executor.run(record, i) for i in range(5)))
+
+    try:
+        assert asyncio.run(scenario()) == [0, 2, 4, 6, 8]
+    finally:
+        executor.shutdown()
+    assert [value for value, _ in seen] == list(range(5))
+    assert {thread for _, thread in seen} == {"test-db"}
+
+
+def test_db_executor_propagates_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_settings, "DB_PATH", str(tmp_path / "settings.db"))
+    executor = DBExecutor(name="test-db")
+
+    async def scenario():
+        await executor.run(user_settings.set_max_ingredients, 1, 5)
+        assert await executor.run(user_settings.get_max_ingredients, 1, default=3) == 5
+        await executor.run(user_settings.set_max_ingredients, 1, 4)
+
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(scenario())
+    finally:
+        executor.shutdown()
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from alchemy_tools import db_fill, db_setup
+
+
+def _counts(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("ingredients", "effects", "effects_types", "properties")
+    }
+    conn.close()
+    return counts
+
+
+def test_fill_v5_loads_pack_and_is_idempotent(tmp_path, monkeypatch):
+    db_path = tmp_path / "alchemy.db"
+    monkeypatch.setattr(db_fill, "DB_PATH", str(db_path))
+    db_setup.setup_database(db_path)
+
+    db_fill.fill_ingredients_table_v5()
+    first = _counts(db_path)
+    db_fill.fill_ingredients_table_v5()
+    assert _counts(db_path) == first
+
+    ingredients = json.loads(
+        (Path("alchemy_bot_data_v5") / "ingredients_v5.json").read_text(encoding="utf-8")
+    )["ingredients"]
+    assert first["ingredients"] == len(ingredients)
+    assert first["properties"] == 4 * len(ingredients)
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        """
+        SELECT e.description, et."type", et.value FROM ingredients i
+        JOIN properties p ON p.ingredient_id = i.id AND p.ingredient_order = 0
+        JOIN effects e ON e.id = p.effect_id
+        LEFT JOIN effects_types et ON et.effect_id = e.id
+        WHERE i.code = 'AM'
+        """
+    ).fetchone()
+    conn.close()
+    assert row == ("Смертельный Яд", "poison", 4)
+
+
+def test_fill_legacy_table_groups_continuation_rows(tmp_path, monkeypatch):
+    db_path = tmp_path / "alchemy.db"
+    monkeypatch.setattr(db_fill, "DB_PATH", str(db_path))
+    frame = pd.DataFrame(
+        [
+            [None, "Травы", None, None, None],
+            ["Корень", "Морковь", "Сильный яд", "Бодрость", "KR"],
+            [None, None, None, "Сон", None],
+            ["Порошок", "Соль", "Бодрость", "Сон", "PR"],
+        ],
+        columns=["Наименование", "Мат. эквивалент", "Основной эффект", "Доп. эффекты", "Обозначение"],
+    )
+
+    db_fill.fill_ingredients_table(frame)
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        """
+        SELECT i.code, i.ingredient_type, p.ingredient_order, e.description FROM ingredients i
+        JOIN properties p ON p.ingredient_id = i.id
+        JOIN effects e ON e.id = p.effect_id
+        ORDER BY i.code, p.ingredient_order
+        """
+    ).fetchall()
+    n_effects = conn.execute("SELECT COUNT(*) FROM effects").fetchone()[0]
+    conn.close()
+    assert rows == [
+        ("KR", "Травы", 0, "сильный яд"),
+        ("KR", "Травы", 1, "бодрость"),
+        ("KR", "Травы", 2, "сон"),
+        ("PR", "Травы", 0, "бодрость"),
+        ("PR", "Травы", 1, "сон"),
+    ]
+    assert n_effects == 3
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+from alchemy_tools import db_setup
+from alchemy_tools.effects_tools import EFFECT_SQL_QUERY
+from alchemy_tools.find_ingredients import SELECT_ALL_EFFECTS_BY_USER
+from alchemy_tools.user_ingredients import SQL_SELECT_USER_INGREDIENT_IDS, SQL_USER_INVENTORY_FILTER
+
+
+def _plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    db_path = tmp_path / "alchemy.db"
+    db_setup.setup_database(db_path)
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def test_migrate_sets_user_version_and_is_idempotent(tmp_path):
+    db_path = tmp_path / "alchemy.db"
+    db_setup.setup_database(db_path)
+    db_setup.setup_database(db_path)
+    conn = sqlite3.connect(db_path)
+    assert db_setup.get_schema_version(conn) == db_setup.SCHEMA_VERSION
+    conn.close()
+
+
+def test_migrate_renames_conflicting_legacy_tables(tmp_path):
+    db_path = tmp_path / "alchemy.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE ingredients (id INTEGER PRIMARY KEY, user_id INTEGER, code TEXT, name TEXT)")
+    conn.execute("INSERT INTO ingredients (user_id, code, name) VALUES (1, 'ING01', 'Корень')")
+    conn.commit()
+    conn.close()
+
+    db_setup.setup_database(db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT code FROM ingredients_legacy").fetchall() == [("ING01",)]
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ingredients)")}
+    assert "material_analog" in columns
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "sql, params",
+    [
+        (EFFECT_SQL_QUERY, ("AM", 1)),
+        (SELECT_ALL_EFFECTS_BY_USER.format(user_id=1), ()),
+        (SQL_SELECT_USER_INGREDIENT_IDS, (1,)),
+        ("SELECT i.id FROM ingredients i WHERE i.code = ? AND " + SQL_USER_INVENTORY_FILTER, ("AM", 1, 1)),
+        ("SELECT id, name, ingredient_ids, effects FROM recipes WHERE user_id = ?", (1,)),
+        ("SELECT id FROM effects WHERE description = ?", ("яд",)),
+        (
+            """
+            SELECT e.description, et."type", et.value, props.ingredient_order FROM ingredients AS i
+            join properties props on i.id = props.ingredient_id
+            join effects e on e.id = props.effect_id
+            left join effects_types et on e.id = et.effect_id
+            where i.id = ?
+            """,
+            (1,),
+        ),
+    ],
+)
+def test_bot_queries_use_indexes(migrated, sql, params):
+    plan = _plan(migrated, sql, params)
+    assert plan
+    assert not any(step.startswith("SCAN") for step in plan), plan
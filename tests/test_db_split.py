@@ -0,0 +1,131 @@
+import sqlite3
+
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, db_wrapper, effects_tools, recipes, user_ingredients
+
+
+def _tables(path):
+    conn = sqlite3.connect(path)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return names
+
+
+@pytest.fixture
+def split_db(tmp_path, monkeypatch):
+    user_path = tmp_path / "alchemy.db"
+    catalog_path = tmp_path / "catalog.db"
+    db_setup.build_catalog_database(catalog_path, lambda path: db_fill.fill_ingredients_table_v5(db_path=path))
+    db_setup.setup_database(user_path, catalog_path=catalog_path)
+    for module in (db_wrapper, catalog, effects_tools, recipes):
+        monkeypatch.setattr(module, "DB_PATH", str(user_path))
+    monkeypatch.setattr(db_wrapper, "CATALOG_DB_PATH", str(catalog_path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    return user_path, catalog_path
+
+
+def test_catalog_and_user_state_live_in_separate_files(split_db):
+    user_path, catalog_path = split_db
+    assert not set(db_setup.CATALOG_TABLES) & _tables(user_path)
+    assert not set(db_setup.USER_TABLES) & _tables(catalog_path)
+
+    assert "AM" in catalog.get_catalog().id_by_code
+    assert any(row[4] == "AM" for row in effects_tools.search_effects_by_description("смертельн", user_id=1))
+    user_ingredients.set_custom_inventory(1, ["AM"])
+    assert [row[1] for row in user_ingredients.select_all_ingredients_by_user(1)] == ["AM"]
+    assert recipes.save_recipe(1, "Яд", ["AM1", "KQ2"], "")
+
+
+def test_search_ignores_an_index_in_the_user_database(split_db):
+    user_path, _catalog_path = split_db
+    conn = sqlite3.connect(user_path)
+    conn.execute(effects_tools.SQL_CREATE_EFFECTS_FTS)
+    conn.commit()
+    conn.close()
+
+    assert any(row[4] == "AM" for row in effects_tools.search_effects_by_description("смертельн", user_id=1))
+    assert "effects_fts" not in _tables(user_path)
+
+
+def test_catalog_is_attached_read_only(split_db):
+    conn = db_wrapper.connect_db()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM ingredients")
+    finally:
+        conn.close()
+
+
+def test_catalog_rebuild_keeps_user_state(split_db):
+    user_path, catalog_path = split_db
+    recipes.save_recipe(1, "Яд", ["AM1", "KQ2"], "")
+
+    db_setup.build_catalog_database(catalog_path, lambda path: db_fill.fill_ingredients_table_v5(db_path=path))
+
+    assert len(recipes.get_user_recipes(1)) == 1
+    assert not (catalog_path.parent / "catalog.db.tmp").exists()
+
+
+def test_catalog_rebuild_keeps_ingredient_ids(split_db, monkeypatch):
+    user_path, catalog_path = split_db
+    user_ingredients.set_custom_inventory(1, ["AM"])
+    am_id = catalog.get_catalog().id_by_code["AM"]
+
+    def fill_reordered(path):
+        # A row ahead of the pack's ingredients would shift fresh ids; kept ids follow the codes.
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO ingredients (code, name) VALUES ('ZZ_NEW', 'Новый')")
+        conn.commit()
+        conn.close()
+        db_fill.fill_ingredients_table_v5(db_path=path)
+
+    db_setup.build_catalog_database(catalog_path, fill_reordered)
+
+    rebuilt = catalog.get_catalog()
+    assert rebuilt.id_by_code["AM"] == am_id
+    assert "ZZ_NEW" not in rebuilt.id_by_code  # no properties: not in the pack
+    assert [row[1] for row in user_ingredients.select_all_ingredients_by_user(1)] == ["AM"]
+
+
+def test_split_moves_inventories_to_catalog_ids(tmp_path):
+    user_path = tmp_path / "alchemy.db"
+    catalog_path = tmp_path / "catalog.db"
+    db_setup.setup_database(user_path)
+    conn = sqlite3.connect(user_path)
+    conn.execute("INSERT INTO ingredients (id, code) VALUES (500, 'AM')")
+    conn.execute("INSERT INTO user_ingredients (user_id, ingredient_id) VALUES (1, 500)")
+    conn.commit()
+    conn.close()
+
+    # An empty or missing catalog does not replace the user DB's own tables.
+    db_setup.setup_database(user_path, catalog_path=catalog_path)
+    assert "ingredients" in _tables(user_path)
+
+    db_setup.build_catalog_database(catalog_path, lambda path: db_fill.fill_ingredients_table_v5(db_path=path))
+    db_setup.setup_database(user_path, catalog_path=catalog_path)
+
+    assert not set(db_setup.CATALOG_TABLES) & _tables(user_path)
+    conn = sqlite3.connect(catalog_path)
+    (am_id,) = conn.execute("SELECT id FROM ingredients WHERE code = 'AM'").fetchone()
+    conn.close()
+    conn = sqlite3.connect(user_path)
+    assert conn.execute("SELECT user_id, ingredient_id FROM user_ingredients").fetchall() == [(1, am_id)]
+    conn.close()
+
+
+def test_catalog_swapped_by_another_process_is_seen_after_the_check_interval(split_db, monkeypatch):
+    _user_path, catalog_path = split_db
+    before = catalog.get_catalog()
+    other = catalog_path.parent / "other.db"
+    db_setup.build_catalog_database(other, lambda path: db_fill.fill_ingredients_table_v5(db_path=path))
+    monkeypatch.setattr(db_wrapper, "CATALOG_CHECK_INTERVAL", 3600)
+    db_wrapper.current_catalog_generation()
+
+    # What reset_db.py does from its own process: no refresh here.
+    other.replace(catalog_path)
+    assert catalog.get_catalog() is before
+
+    monkeypatch.setattr(db_wrapper, "CATALOG_CHECK_INTERVAL", 0)
+    assert catalog.get_catalog() is not before
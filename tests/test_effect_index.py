@@ -0,0 +1,48 @@
+from alchemy_tools.effect_index import EffectTextIndex, substring_distance
+from alchemy_tools.v5_data import get_effect_text_index, load_v5_data, search_effect_texts
+
+
+def _linear_search(v5, query, limit=12):
+    normalize_key = v5.suppression_mod.normalize_key
+    q = normalize_key(query)
+    scored = []
+    for text in v5.effect_categories:
+        pos = normalize_key(text).find(q)
+        if pos >= 0:
+            scored.append(((pos, len(text)), text))
+    scored.sort(key=lambda x: (x[0], x[1].lower()))
+    return [t for _s, t in scored[:limit]]
+
+
+def test_index_matches_linear_scan():
+    v5 = load_v5_data()
+    index = get_effect_text_index(v5)
+    for query in ("яд", "Противоядие", "сон", "а", "галюцинации", "ЁЖ", "несуществующий эффект"):
+        assert index.search(query, limit=50) == _linear_search(v5, query, limit=50)
+    assert search_effect_texts("яд") == _linear_search(v5, "яд")
+
+
+def test_fuzzy_search_tolerates_typos():
+    index = EffectTextIndex(["Сильный яд", "Слабое противоядие", "Бодрость"], str.lower)
+    assert index.search("противоядие") == ["Слабое противоядие"]
+    assert index.search("протвоядие") == []
+    assert index.fuzzy_search("протвоядие") == ["Слабое противоядие"]
+    assert index.fuzzy_search("бодросьт", max_distance=2) == ["Бодрость"]
+    assert index.fuzzy_search("совсем другое") == []
+
+
+def test_substring_distance():
+    assert substring_distance("яд", "сильный яд") == (0, 8)
+    assert substring_distance("ят", "сильный яд")[0] == 1
+    assert substring_distance("", "abc") == (0, 0)
+
+
+def test_fuzzy_search_matches_brute_force():
+    v5 = load_v5_data()
+    index = get_effect_text_index(v5)
+    for query, max_distance in (("протвоядие", 1), ("галлюцинацыи", 2), ("сильнй яд", 1), ("санн", 1)):
+        q = v5.suppression_mod.normalize_key(query)
+        expected = sorted(
+            text for text, key in zip(index.texts, index.keys) if substring_distance(q, key)[0] <= max_distance
+        )
+        assert sorted(index.fuzzy_search(query, limit=len(index.texts), max_distance=max_distance)) == expected
@@ -57,6 +57,8 @@ def _setup_db(path):
         )
         """
     )
+    cursor.execute("CREATE TABLE custom_inventories (user_id INTEGER PRIMARY KEY)")
+    cursor.execute("INSERT INTO custom_inventories (user_id) VALUES (1)")
 
     cursor.execute(
         "INSERT INTO ingredients (code, material_analog, ingredient_type, name) VALUES (?,?,?,?)",
@@ -118,3 +120,58 @@ def test_search_effects_by_description(tmp_path, monkeypatch):
 
     rows = effects_tools.search_effects_by_description("скор", user_id=1)
     assert any(row[0] == "ускорение" for row in rows)
+
+
+def test_search_matches_inside_words(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_effects.db"
+    _setup_db(db_path)
+    monkeypatch.setattr(effects_tools, "DB_PATH", str(db_path))
+
+    # "корени" only occurs inside the description "ускорение".
+    assert {row[0] for row in effects_tools.search_effects_by_description("корени", user_id=1)} == {"ускорение"}
+    assert {row[0] for row in effects_tools.search_effects_by_description("ильн", user_id=1)} == {"сильный яд"}
+    assert effects_tools.find_tokens_by_effect_query("корени") == ["ING21", "ING22", "ING23"]
+
+
+def test_search_is_case_insensitive_for_cyrillic(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_effects.db"
+    _setup_db(db_path)
+    monkeypatch.setattr(effects_tools, "DB_PATH", str(db_path))
+
+    rows = effects_tools.search_effects_by_description("СИЛЬН Яд", user_id=1)
+    assert [row[0] for row in rows] == ["сильный яд"]
+    assert effects_tools.find_tokens_by_effect_query("Ускор") == ["ING21", "ING22", "ING23"]
+
+
+def test_search_pages_by_effect(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_effects.db"
+    _setup_db(db_path)
+    monkeypatch.setattr(effects_tools, "DB_PATH", str(db_path))
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE IF EXISTS effects_fts")
+    conn.execute("UPDATE effects_types SET type = 'яд'")
+    conn.commit()
+    conn.close()
+
+    first = effects_tools.search_effects_by_description("яд", user_id=1, limit=1)
+    second = effects_tools.search_effects_by_description("яд", user_id=1, limit=1, offset=1)
+    assert len({row[0] for row in first}) == 1
+    assert {row[0] for row in first + second} == {"сильный яд", "ускорение"}
+    # The better match (term in both description and type) ranks first.
+    assert first[0][0] == "сильный яд"
+
+
+def test_search_cache_follows_inventory(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_effects.db"
+    _setup_db(db_path)
+    monkeypatch.setattr(effects_tools, "DB_PATH", str(db_path))
+
+    assert effects_tools.search_effects_by_description("ускор", user_id=1)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM user_ingredients WHERE user_id = 1 AND ingredient_id = 2")
+    conn.commit()
+    conn.close()
+
+    assert effects_tools.search_effects_by_description("ускор", user_id=1) == []
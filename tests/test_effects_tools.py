@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, db_wrapper, effects_tools
+from alchemy_tools.evaluate_ingredients import calculate_score_by_formula, evaluate_effects
+
+
+@pytest.fixture
+def filled_db(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    for module in (db_fill, db_wrapper, catalog, effects_tools):
+        monkeypatch.setattr(module, "DB_PATH", str(path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    db_fill.fill_ingredients_table_v5()
+    return path
+
+
+def test_formula_rows_match_per_token_lookups(filled_db):
+    formula = ["AM1", "KQ2", "KQ3"]
+    rows = effects_tools.get_effect_rows_by_ingredients_with_codes(formula)
+
+    expected = []
+    for token in formula:
+        expected += effects_tools.get_by_code_order(token[:-1], int(token[-1])).itertuples(index=False)
+    for token in formula:
+        expected += effects_tools.get_by_code_order(token[:-1], 0).itertuples(index=False)
+    assert rows == [tuple(row) for row in expected]
+    assert len(rows) == 2 * len(formula)
+
+    df = effects_tools.get_by_ingredients_with_codes(formula)
+    assert list(df.columns) == effects_tools.EFFECT_ROW_COLUMNS
+    conn = sqlite3.connect(filled_db)
+    try:
+        score = calculate_score_by_formula(formula, cursor=conn.cursor())
+    finally:
+        conn.close()
+    assert evaluate_effects(df) == evaluate_effects(rows) == score
+
+
+def test_formula_rows_empty_formula(filled_db):
+    assert effects_tools.get_effect_rows_by_ingredients_with_codes([]) == []
+
+
+def test_batch_ingredient_lookup_and_resolution(filled_db):
+    from alchemy_tools.effects_resolution import resolve_potion_effects
+
+    cat = catalog.get_catalog()
+    am, kq = cat.id_by_code["AM"], cat.id_by_code["KQ"]
+    assert effects_tools.get_ingredient_codes_and_names([kq, am, -1]) == [
+        ("KQ", cat.name_by_id[kq]),
+        ("AM", cat.name_by_id[am]),
+        (None, effects_tools.UNKNOWN_INGREDIENT_NAME),
+    ]
+
+    assert resolve_potion_effects([(am, 0), (kq, 1)])["tokens"] == ["AM1", "KQ2"]
+    with pytest.raises(ValueError, match="Unknown ingredient_id"):
+        resolve_potion_effects([(am, 0), (-1, 0)])
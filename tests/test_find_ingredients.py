@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, db_wrapper, effects_tools, find_ingredients
+
+
+@pytest.fixture
+def filled_db(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    for module in (db_fill, db_wrapper, catalog, effects_tools):
+        monkeypatch.setattr(module, "DB_PATH", str(path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    db_fill.fill_ingredients_table_v5()
+    return path
+
+
+def test_one_step_scores_tuples_and_dataframes_alike(filled_db):
+    conn = db_wrapper.connect_db()
+    try:
+        rows = conn.execute(effects_tools.SELECT_ALL_EFFECTS).fetchall()
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows, columns=find_ingredients.ALL_EFFECTS_COLUMNS)
+
+    scored = find_ingredients.potential_candidates_with_max_score_one_step(rows, ["AM1"], only_max_score=False)
+    assert scored == find_ingredients.potential_candidates_with_max_score_one_step(df, ["AM1"], only_max_score=False)
+    assert [score for _token, score in scored] == sorted((score for _token, score in scored), reverse=True)
+    assert "AM1" not in {token for token, _score in scored}
+
+    best = find_ingredients.potential_candidates_with_max_score_one_step(rows, ["AM1"])
+    assert best and {score for _token, score in best} == {scored[0][1]}
+
+
+def test_several_steps_returns_valid_formulas(filled_db):
+    formulas = find_ingredients.potential_candidates_with_max_score_several_steps(["AM1"], steps=0)
+    assert formulas
+    for formula in formulas:
+        assert "AM1" in formula and len(formula) == 2
+
+
+def test_bot_import_does_not_load_pandas():
+    code = "import sys, alchemy_tools.main; sys.exit('pandas' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
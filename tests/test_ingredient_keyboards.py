@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, db_wrapper, effects_tools, ingredient_keyboards, user_ingredients
+from alchemy_tools.craft_callbacks import OP_DONE, OP_INGREDIENT, OP_PAGE, decode_callback, formula_tokens, token_id
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    for module in (db_fill, db_wrapper, catalog, effects_tools):
+        monkeypatch.setattr(module, "DB_PATH", str(path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    db_fill.fill_ingredients_table_v5()
+    monkeypatch.setattr(ingredient_keyboards, "_PAGES", OrderedDict())
+    return path
+
+
+def _keyboard(user_id, formula=(), exhausted=frozenset(), page=0):
+    return ingredient_keyboards.ingredient_page(
+        ingredient_keyboards.user_ingredient_items(user_id), formula, exhausted, page
+    )
+
+
+def _callbacks(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def _decoded(markup, op):
+    return [cb for cb in map(decode_callback, _callbacks(markup)) if cb is not None and cb.op == op]
+
+
+def _picked_codes(markup):
+    return [formula_tokens([cb.token])[0][:-1] for cb in _decoded(markup, OP_INGREDIENT)]
+
+
+def test_pages_cover_the_inventory_and_are_shared(db_path):
+    ingredients = catalog.get_catalog().ingredients
+    first = _keyboard(1)
+    pages = [first]
+    while len(pages) in [cb.page for cb in _decoded(pages[-1], OP_PAGE)]:
+        pages.append(_keyboard(1, page=len(pages)))
+    assert [code for page in pages for code in _picked_codes(page)] == [row[1] for row in ingredients]
+    assert len(pages) == -(-len(ingredients) // ingredient_keyboards.INGREDIENTS_PAGE_SIZE)
+    assert all(_callbacks(page)[-2] == "reset" and _decoded(page, OP_DONE) for page in pages)
+
+    # Same inventory state -> the very same cached button list; pages are clamped.
+    assert ingredient_keyboards.user_ingredient_items(2) is ingredient_keyboards.user_ingredient_items(1)
+    assert _callbacks(_keyboard(2, page=99)) == _callbacks(pages[-1])
+    assert ingredient_keyboards.user_ingredient_items(1) == ingredient_keyboards.ingredient_items(ingredients)
+
+
+def test_exhausted_ingredients_and_inventory_changes(db_path):
+    am = catalog.get_catalog().id_by_code["AM"]
+    formula = (token_id("AM1"), token_id("AM2"))
+    keyboard = _keyboard(1, formula, frozenset({am}))
+    assert "AM" not in _picked_codes(keyboard)
+    # Every button carries the partial formula.
+    assert {cb.formula for op in (OP_INGREDIENT, OP_DONE) for cb in _decoded(keyboard, op)} == {formula}
+
+    before = ingredient_keyboards.user_ingredient_items(1)
+    user_ingredients.set_custom_inventory(1, ["AM"])
+    assert ingredient_keyboards.user_ingredient_items(1) is not before
+    after = _keyboard(1)
+    assert _picked_codes(after) == ["AM"] and len(_callbacks(after)) == 3
+
+
+def test_ingredient_list_pages_show_the_whole_inventory(db_path):
+    ingredients = catalog.get_catalog().ingredients
+    pages = [ingredient_keyboards.ingredient_list_page(1)]
+    while f"inglist_{len(pages)}" in _callbacks(pages[-1][1] or ingredient_keyboards.InlineKeyboardMarkup([])):
+        pages.append(ingredient_keyboards.ingredient_list_page(1, len(pages)))
+    assert len(pages) > 1
+    assert all(len(text) <= 4096 for text, _nav in pages)
+    joined = "\n".join(text for text, _nav in pages)
+    for _id, code, _type, _material, name in ingredients:
+        assert f"{code}: {name}\n" in joined
+    assert ingredient_keyboards.ingredient_list_page(2) is pages[0]
+
+    user_ingredients.set_custom_inventory(1, ["AM"])
+    text, nav = ingredient_keyboards.ingredient_list_page(1, page=5)
+    assert nav is None and text.startswith("Ваши ингредиенты:\nAM: ")
@@ -0,0 +1,118 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from alchemy_tools import db_setup, recipes
+
+TOKENS = ["AM1", "KQ2", "FN2", "FS3", "BA3"]
+# Another order of TOKENS resolving to the same final effects.
+REORDERED = ["AM1", "KQ2", "BA3", "FN2", "FS3"]
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    monkeypatch.setattr(recipes, "DB_PATH", str(path))
+    return path
+
+
+# Same tokens, different final effects: the resolver is order-sensitive.
+ORDER_SENSITIVE = (["SPN3", "BA2", "PL1"], ["BA2", "SPN3", "PL1"])
+
+
+def test_key_ignores_order_and_digest_follows_effects():
+    assert recipes.recipe_key(TOKENS) == recipes.recipe_key(list(reversed(TOKENS)))
+    assert recipes.recipe_digest(TOKENS) == recipes.recipe_digest(REORDERED)
+    first, second = ORDER_SENSITIVE
+    assert recipes.recipe_key(first) == recipes.recipe_key(second)
+    assert recipes.recipe_digest(first) != recipes.recipe_digest(second)
+
+
+def test_save_recipe_deduplicates_by_key_and_digest(db_path):
+    assert not recipes.recipe_exists(TOKENS, user_id=1)
+    assert recipes.save_recipe(1, "first", TOKENS, "text")
+    assert recipes.recipe_exists(REORDERED, user_id=1)
+    assert not recipes.recipe_exists(TOKENS, user_id=2)
+
+    assert not recipes.save_recipe(1, "again", REORDERED, "text")
+    assert len(recipes.get_user_recipes(1)) == 1
+
+
+def test_orderings_with_different_effects_are_both_kept(db_path):
+    first, second = ORDER_SENSITIVE
+    assert recipes.save_recipe(1, "first", first, "")
+    assert not recipes.recipe_exists(second, user_id=1)
+    assert recipes.save_recipe(1, "second", second, "")
+    assert len(recipes.get_user_recipes(1)) == 2
+
+
+def test_migration_backfills_keys_for_existing_recipes(tmp_path):
+    path = tmp_path / "alchemy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE recipes (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT, ingredient_ids TEXT, effects TEXT)")
+    for name in ("a", "b"):
+        conn.execute(
+            "INSERT INTO recipes (user_id, name, ingredient_ids, effects) VALUES (1, ?, ?, 'text')",
+            (name, json.dumps(TOKENS)),
+        )
+    conn.commit()
+    conn.close()
+
+    db_setup.setup_database(path)
+    assert recipes.backfill_recipe_digests(path) == 1
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT name, tokens_key, effects_digest FROM recipes").fetchall()
+    plan = [row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT 1 FROM recipes WHERE user_id = ? AND tokens_key = ? AND effects_digest = ? LIMIT 1",
+        (1, "k", "d"),
+    )]
+    conn.close()
+    assert rows == [("a", recipes.recipe_key(TOKENS), recipes.recipe_digest(TOKENS))]
+    assert plan == ["SEARCH recipes USING COVERING INDEX uq_recipes_user_key_digest (user_id=? AND tokens_key=? AND effects_digest=?)"]
+
+
+def test_list_user_recipes_paginates_by_id(db_path):
+    formulas = [
+        ["AM1", "KQ2", "FN2", "FS3", "BA3"],
+        ["AM2", "KQ2", "FN2", "FS3", "BA3"],
+        ["AM3", "KQ2", "FN2", "FS3", "BA3"],
+    ]
+    for i, tokens in enumerate(formulas):
+        recipes.save_recipe(1, f"r{i}", tokens, "text")
+
+    page, after_id = recipes.list_user_recipes(1, limit=2)
+    assert [row[1] for row in page] == ["r0", "r1"]
+    page, after_id = recipes.list_user_recipes(1, after_id=after_id, limit=2)
+    assert [row[1] for row in page] == ["r2"]
+    assert after_id is None
+
+
+def test_export_import_roundtrip(db_path):
+    recipes.save_recipe(1, "first", TOKENS, "text")
+    buffer = io.StringIO()
+    assert recipes.export_recipes_jsonl(1, buffer) == 1
+
+    lines = buffer.getvalue().splitlines()
+    assert recipes.import_recipes_jsonl(2, lines) == (1, 0)
+    assert recipes.import_recipes_jsonl(2, lines) == (0, 1)
+    assert recipes.recipe_exists(TOKENS, user_id=2)
+
+    bad = ['{"name": "broken"}', "[1, 2]", json.dumps({"tokens": TOKENS[:4] + ["ZZ1"]}), json.dumps({"tokens": TOKENS, "name": ["x"]})]
+    with pytest.raises(ValueError) as excinfo:
+        recipes.import_recipes_jsonl(3, lines + bad)
+    assert [line.split(":")[0] for line in str(excinfo.value).splitlines()] == [f"Строка {n}" for n in (2, 3, 4, 5)]
+    assert "ZZ1" in str(excinfo.value)
+    assert recipes.list_user_recipes(3) == ([], None)
+
+
+def test_export_skips_unreadable_rows(db_path):
+    recipes.save_recipe(1, "first", TOKENS, "text")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO recipes (user_id, name, ingredient_ids, effects) VALUES (1, 'broken', 'AM1,KQ2', '')")
+    buffer = io.StringIO()
+    assert recipes.export_recipes_jsonl(1, buffer) == 1
+    assert json.loads(buffer.getvalue())["name"] == "first"
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sqlite3
+from pathlib import Path
+
+from alchemy_tools import db_fill, db_setup, search_pool
+from alchemy_tools.find_ingredients import potential_candidates_with_max_score_several_steps
+from alchemy_tools.v5_recipe_search import find_best_recipes_for_effect
+
+EFFECT = "Мстительность, агрессия"
+
+
+def test_search_runs_in_a_worker_process():
+    async def scenario(pool):
+        await pool.start()
+        loop = asyncio.get_running_loop()
+        worker_pid = await loop.run_in_executor(pool._get_executor(), os.getpid)
+        results = await pool.run(EFFECT, time_budget_sec=0.2, max_seeds=4)
+        return worker_pid, results
+
+    pool = search_pool.SearchPool(workers=1)
+    try:
+        worker_pid, results = asyncio.run(scenario(pool))
+    finally:
+        pool.shutdown()
+    assert worker_pid != os.getpid()
+    assert results == find_best_recipes_for_effect(EFFECT, time_budget_sec=0.2, max_seeds=4)
+
+
+def test_formula_search_runs_in_a_worker_process(tmp_path, monkeypatch):
+    db_setup.setup_database(tmp_path / "alchemy.db")
+    db_fill.fill_ingredients_table_v5(db_path=tmp_path / "alchemy.db")
+    # Workers are spawned in the current directory and open ./alchemy.db there.
+    monkeypatch.setenv("ALCHEMY_DATA_DIR", str(Path("alchemy_bot_data_v5").resolve()))
+    monkeypatch.chdir(tmp_path)
+
+    pool = search_pool.SearchPool(workers=1)
+    try:
+        formulas = asyncio.run(pool.run_formula(["AM1"], steps=0))
+    finally:
+        pool.shutdown()
+    conn = sqlite3.connect("alchemy.db")
+    try:
+        expected = potential_candidates_with_max_score_several_steps(["AM1"], cursor=conn.cursor(), steps=0)
+    finally:
+        conn.close()
+    assert formulas and sorted(map(sorted, formulas)) == sorted(map(sorted, expected))
+
+
+def test_zero_workers_search_in_a_thread(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        search_pool, "find_best_recipes_for_effect", lambda text, **kwargs: calls.append((text, kwargs)) or []
+    )
+    pool = search_pool.SearchPool(workers=0)
+    assert asyncio.run(pool.run("x", max_results=1)) == []
+    assert calls == [("x", {"max_results": 1})]
+    monkeypatch.setenv("ALCHEMY_SEARCH_WORKERS", "0")
+    assert search_pool.default_worker_count() == 0
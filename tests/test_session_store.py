@@ -0,0 +1,112 @@
+import asyncio
+import sqlite3
+
+import pytest
+from telegram.ext import ApplicationBuilder
+
+from alchemy_tools import db_setup, db_wrapper, session_store
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    monkeypatch.setattr(session_store, "DB_PATH", str(path))
+    monkeypatch.setattr(db_wrapper, "CATALOG_DB_PATH", str(tmp_path / "catalog.db"))
+    return path
+
+
+def _stored(path):
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute("SELECT user_id, updated_at FROM user_sessions"))
+    conn.close()
+    return rows
+
+
+def test_sessions_are_batched_and_rehydrated_lazily(db_path):
+    async def scenario():
+        persistence = session_store.SQLitePersistence()
+        await persistence.update_user_data(1, {"selected_tokens": ["AM1"]})
+        await persistence.update_user_data(2, {"current_ingredient": 7})
+        assert _stored(db_path) == {}
+        await persistence.flush()
+        first = _stored(db_path)
+        assert set(first) == {1, 2}
+
+        # Unchanged data is not written again.
+        await persistence.update_user_data(1, {"selected_tokens": ["AM1"]})
+        await persistence.flush()
+        assert _stored(db_path) == first
+
+        # A fresh process loads nothing up front and the session on demand.
+        restarted = session_store.SQLitePersistence()
+        assert await restarted.get_user_data() == {}
+        user_data = {}
+        await restarted.refresh_user_data(1, user_data)
+        assert user_data == {"selected_tokens": ["AM1"]}
+
+        # A newer copy written by another process replaces the local one.
+        await persistence.update_user_data(1, {"selected_tokens": ["AM1", "KQ2"]})
+        await persistence.flush()
+        await restarted.refresh_user_data(1, user_data)
+        assert user_data == {"selected_tokens": ["AM1", "KQ2"]}
+
+        await restarted.drop_user_data(2)
+        assert set(_stored(db_path)) == {1}
+
+    asyncio.run(scenario())
+
+
+def test_idle_sessions_are_evicted_from_memory_only(db_path):
+    async def scenario():
+        persistence = session_store.SQLitePersistence(idle_ttl=0, retention=3600)
+        application = ApplicationBuilder().token("123:TEST").persistence(persistence).build()
+        persistence._application = application
+
+        user_data = application.user_data[5]
+        await persistence.refresh_user_data(5, user_data)
+        user_data["selected_tokens"] = ["AM1"]
+        application.mark_data_for_update_persistence(user_ids=5)
+
+        assert await persistence.evict_idle() == 1
+        assert 5 not in application.user_data
+        await application.update_persistence()
+        assert set(_stored(db_path)) == {5}
+
+        fresh = application.user_data[5]
+        await persistence.refresh_user_data(5, fresh)
+        assert fresh == {"selected_tokens": ["AM1"]}
+
+    asyncio.run(scenario())
+
+
+def test_expire_sessions_removes_old_rows(db_path):
+    session_store.save_sessions([(1, b"x", 10.0), (2, b"y", 1000.0)])
+    assert session_store.expire_sessions(500.0) == 1
+    assert set(_stored(db_path)) == {2}
+
+
+def test_newer_sessions_are_found_by_version_not_clock(db_path, monkeypatch):
+    async def scenario():
+        writer = session_store.SQLitePersistence()
+        reader = session_store.SQLitePersistence()
+        clock = [1000.0, 10.0]
+        monkeypatch.setattr(session_store.time, "time", lambda: clock.pop(0) if len(clock) > 1 else clock[0])
+
+        await writer.update_user_data(1, {"selected_tokens": ["AM1"]})
+        await writer.flush()
+        user_data = {}
+        await reader.refresh_user_data(1, user_data)
+        assert user_data == {"selected_tokens": ["AM1"]}
+
+        # Written with an earlier wall-clock time, still the newer copy.
+        await writer.update_user_data(1, {"selected_tokens": ["KQ2"]})
+        await writer.flush()
+        await reader.refresh_user_data(1, user_data)
+        assert user_data == {"selected_tokens": ["KQ2"]}
+
+        # A current copy is not unpickled again.
+        monkeypatch.setattr(session_store.pickle, "loads", lambda blob: pytest.fail("reloaded"))
+        await reader.refresh_user_data(1, user_data)
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import sqlite3
+import subprocess
+import sys
+
+from alchemy_tools import catalog, startup_profile, v5_data
+
+
+def test_bot_import_does_not_load_data_packs():
+    code = (
+        "import sys, alchemy_tools.main, effect_suppression_v4, alchemy_tools.v5_data as v5;"
+        "sys.exit(v5._CACHE is not None or effect_suppression_v4.get_effect_catalog.cache_info().currsize)"
+    )
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_lazy_constants_keep_their_values():
+    import effect_suppression
+    import effect_suppression_v4
+
+    assert effect_suppression.MAX_EFFECTS == effect_suppression.max_effects() == 4
+    assert effect_suppression_v4.EFFECT_CATALOG is effect_suppression_v4.get_effect_catalog()
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   effect_suppression\n"
+        "import time:      3000 |       3120 | alchemy_tools.main\n"
+    )
+    timings = startup_profile.parse_importtime(stderr)
+    assert timings == [
+        startup_profile.ImportTiming("effect_suppression", 120, 120),
+        startup_profile.ImportTiming("alchemy_tools.main", 3000, 3120),
+    ]
+    report = startup_profile.format_report(timings, [("get_catalog", 0.002)])
+    assert "3.1 ms total" in report and "get_catalog" in report
+
+
+def test_init_profile_leaves_the_real_database_alone(tmp_path, monkeypatch):
+    monkeypatch.setenv("ALCHEMY_DATA_DIR", str(v5_data.load_v5_data().data_dir))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    monkeypatch.chdir(tmp_path)
+    sqlite3.connect(tmp_path / "alchemy.db").close()
+    before = (tmp_path / "alchemy.db").read_bytes()
+
+    steps = [name for name, _seconds in startup_profile.profile_init()]
+
+    assert "ensure_db_tables" in steps
+    assert (tmp_path / "alchemy.db").read_bytes() == before
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["alchemy.db"]
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from alchemy_tools import catalog, db_fill, db_setup, db_wrapper, effects_tools, user_ingredients
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "alchemy.db"
+    db_setup.setup_database(path)
+    for module in (db_fill, db_wrapper, catalog, effects_tools):
+        monkeypatch.setattr(module, "DB_PATH", str(path))
+    monkeypatch.setattr(catalog, "_CATALOG", None)
+    db_fill.fill_ingredients_table_v5()
+    return path
+
+
+def _row_count(path, user_id):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM user_ingredients WHERE user_id = ?", (user_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_default_inventory_is_implicit(db_path):
+    ingredients = user_ingredients.select_all_ingredients_by_user(42)
+    assert len(ingredients) == len(catalog.get_catalog().ingredients)
+    assert user_ingredients.check_is_already_added(42, "AM")
+    assert not user_ingredients.has_custom_inventory(42)
+    assert _row_count(db_path, 42) == 0
+
+    rows = effects_tools.search_effects_by_description("Смертельн", user_id=42)
+    assert any(row[4] == "AM" for row in rows)
+
+
+def test_custom_inventory_limits_lookups(db_path):
+    user_ingredients.set_custom_inventory(7, ["AM"])
+    assert user_ingredients.has_custom_inventory(7)
+    assert [row[1] for row in user_ingredients.select_all_ingredients_by_user(7)] == ["AM"]
+    assert not user_ingredients.check_is_already_added(7, "KQ")
+    assert {row[4] for row in effects_tools.search_effects_by_description("Смертельн", user_id=7)} == {"AM"}
+
+    user_ingredients.reset_inventory(7)
+    assert not user_ingredients.has_custom_inventory(7)
+    assert _row_count(db_path, 7) == 0
+
+    with pytest.raises(ValueError):
+        user_ingredients.set_custom_inventory(7, ["NOPE"])
+
+
+def test_empty_custom_inventory_is_not_the_default(db_path):
+    default_version = user_ingredients.get_inventory_version(7)
+    user_ingredients.set_custom_inventory(7, [])
+    assert user_ingredients.has_custom_inventory(7)
+    assert user_ingredients.select_all_ingredients_by_user(7) == []
+    assert not user_ingredients.check_is_already_added(7, "AM")
+    assert effects_tools.search_effects_by_description("Смертельн", user_id=7) == []
+    assert user_ingredients.get_inventory_version(7) != default_version
+
+    user_ingredients.reset_inventory(7)
+    assert user_ingredients.get_inventory_version(7) == default_version
+    assert len(user_ingredients.select_all_ingredients_by_user(7)) == len(catalog.get_catalog().ingredients)
+
+
+def test_migration_collapses_full_catalog_inventories(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO user_ingredients (user_id, ingredient_id) SELECT 1, id FROM ingredients")
+    conn.execute("INSERT INTO user_ingredients (user_id, ingredient_id) SELECT 2, MIN(id) FROM ingredients")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    db_setup.setup_database(db_path)
+
+    assert _row_count(db_path, 1) == 0
+    assert _row_count(db_path, 2) == 1
+    assert not user_ingredients.has_custom_inventory(1)
+    assert user_ingredients.has_custom_inventory(2)
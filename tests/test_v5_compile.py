@@ -0,0 +1,114 @@
+import json
+import shutil
+
+import pytest
+
+from alchemy_tools import v5_compile, v5_data, v5_snapshot
+
+
+@pytest.fixture
+def pack_dir(tmp_path, monkeypatch):
+    source = v5_data.load_v5_data().data_dir
+    target = tmp_path / "pack"
+    target.mkdir()
+    for name in v5_snapshot.SOURCE_FILES:
+        shutil.copy(source / name, target / name)
+    monkeypatch.setenv("ALCHEMY_DATA_DIR", str(target))
+    monkeypatch.setattr(v5_data, "_CACHE", None)
+    monkeypatch.setattr(v5_data, "_FINGERPRINT", None)
+    monkeypatch.setattr(v5_data, "_COMPILED_ONLY", False)
+    return target
+
+
+def test_compiled_tables_round_trip():
+    v5 = v5_data.load_v5_data()
+    compiled = v5_compile.get_compiled_pack(v5)
+    normalize_text = v5.suppression_mod.normalize_text
+
+    assert len(compiled.tokens) == 3 * len(v5.ingredient_db) <= v5_compile.MAX_TOKEN_IDS
+    for token, (main_id, add_id) in zip(compiled.tokens, compiled.token_effects):
+        code, idx = v5.suppression_mod.parse_token(token)
+        assert compiled.effects[main_id] == normalize_text(v5.ingredient_db[code]["main"])
+        assert compiled.effects[add_id] == normalize_text(v5.ingredient_db[code][f"add{idx}"])
+        assert compiled.token_ids[token] == compiled.tokens.index(token)
+
+    effect_id = compiled.effect_ids["Смертельный Яд"]
+    assert compiled.kinds[compiled.effect_kind[effect_id]] == v5.effect_categories["Смертельный Яд"]["kind"]
+    assert compiled.tiers[compiled.effect_tier[effect_id]] == v5.effect_categories["Смертельный Яд"]["tier"]
+    truth, lie = compiled.kinds.index("truth"), compiled.kinds.index("lie")
+    assert (truth, lie) in compiled.exclusive_pairs
+
+
+def test_validator_reports_fallback_effects_and_unused_rule_kinds(pack_dir, monkeypatch):
+    report = v5_compile.validate_pack(v5_data.load_v5_pack_from_sources(pack_dir))
+    assert report.ok() and not report.ok(strict=True)
+
+    ingredients_path = pack_dir / "ingredients_v5.json"
+    pack = json.loads(ingredients_path.read_text(encoding="utf-8"))
+    code = sorted(pack["ingredients"])[0]
+    pack["ingredients"][code]["add1"] = "Слабый яд для ксилофонов"
+    pack["ingredients"][code]["add2"] = ""
+    ingredients_path.write_text(json.dumps(pack, ensure_ascii=False), encoding="utf-8")
+
+    report = v5_compile.validate_pack(v5_data.load_v5_pack_from_sources(pack_dir))
+    assert report.errors == [f"{code}: empty add2 effect"]
+    assert any("'Слабый яд для ксилофонов'" in w and "'poison'" in w and f"{code}1" in w for w in report.warnings)
+    assert any("Rule kind 'nature_craving' has no effect" in w for w in report.warnings)
+
+    assert v5_compile.compile_pack(pack_dir) == (report, None)
+    assert not (pack_dir / v5_snapshot.SNAPSHOT_NAME).exists()
+
+    monkeypatch.setattr(v5_compile, "MAX_TOKEN_IDS", 3)
+    report = v5_compile.validate_pack(v5_data.load_v5_pack_from_sources(pack_dir))
+    assert f"{3 * len(pack['ingredients'])} tokens, /craft buttons can address at most 3" in report.errors
+    with pytest.raises(ValueError, match=f"{code}: empty add2 effect"):
+        v5_compile.get_compiled_pack(v5_data.load_v5_pack_from_sources(pack_dir))
+
+
+def test_bot_loads_only_the_compiled_pack(pack_dir, monkeypatch):
+    v5_data.require_compiled_pack()
+    with pytest.raises(FileNotFoundError):
+        v5_data.load_v5_data()
+
+    report, path = v5_compile.compile_pack(pack_dir)
+    assert path == pack_dir / v5_snapshot.SNAPSHOT_NAME
+    compiled = v5_data.load_v5_data()
+    assert "compiled" in compiled.derived
+
+    # Edited sources are not picked up until they are compiled again.
+    rules = pack_dir / "suppression_rules_v5.json"
+    rules.write_text(rules.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    assert v5_data.reload_v5_data() is False
+    v5_compile.compile_pack(pack_dir)
+    assert v5_data.reload_v5_data() is True
+
+
+def test_compiled_block_rules_match_the_source_resolver():
+    v5 = v5_data.load_v5_data()
+    compiled = v5_compile.get_compiled_pack(v5)
+    mod = v5.suppression_mod
+    texts = {}
+    for text, cat in v5.effect_categories.items():
+        texts.setdefault(cat.get("kind"), text)
+
+    def compiled_kinds(kinds):
+        ids = {compiled.kinds.index(kind) for kind in kinds}
+        for blockers, blocked in compiled.block_rules:
+            if ids & blockers:
+                ids -= blocked
+        return {compiled.kinds[i] for i in ids}
+
+    def source_kinds(kinds):
+        result = mod.resolve_effect_texts([texts[kind] for kind in kinds], v5.suppression_cfg, v5.effect_categories)
+        return {mod.classify_effect_text(text, v5.effect_categories)[0].kind for text in result.final_effects}
+
+    # gender_toxin uses the then_blocked_by_any_of form of a block rule.
+    assert any(not rule.get("then_block") for rule in v5.suppression_cfg["block_rules"])
+    for kinds in (
+        {"gender_toxin", "sobriety"},
+        {"gender_toxin", "cant_sleep"},
+        {"gender_toxin", "truth"},
+        {"temptation_resistance", "kleptomania"},
+    ):
+        assert compiled_kinds(kinds) == source_kinds(kinds)
+    assert "gender_toxin" not in compiled_kinds({"gender_toxin", "sobriety"})
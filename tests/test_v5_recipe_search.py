@@ -58,3 +58,50 @@ def test_v5_find_best_recipes_prefers_single_effect(monkeypatch, tmp_path: Path)
     assert results[0].effect_count == 1
     assert "REQUIRED" in results[0].final_effects
 
+
+
+def _scan_producers(v5, effect_text):
+    normalize_text = v5.suppression_mod.normalize_text
+    target = normalize_text(effect_text)
+    out = set()
+    for code, ing in v5.ingredient_db.items():
+        if normalize_text(ing.get("main", "")) == target:
+            out.update(f"{code}{i}" for i in (1, 2, 3))
+        for i in (1, 2, 3):
+            if normalize_text(ing.get(f"add{i}", "")) == target:
+                out.add(f"{code}{i}")
+    return sorted(out)
+
+
+def test_effect_producers_match_a_full_scan():
+    v5 = v5_data_mod.load_v5_data()
+    effects = {ing[key] for ing in v5.ingredient_db.values() for key in ("main", "add1", "add2", "add3")}
+    for effect in effects:
+        assert v5_data_mod.tokens_producing_effect(effect, limit=1000) == _scan_producers(v5, effect)
+
+    producers = v5_data_mod.get_effect_producers("Смертельный Яд")
+    assert producers.main_codes == ("AM",) and producers.kind
+    assert v5_data_mod.get_effect_producers("нет такого эффекта") is None
+
+    seeds = v5_recipe_search._seed_tokens("Смертельный Яд", max_seeds=10)
+    # Tokens producing the effect as their add come first.
+    assert seeds[0] in producers.add_tokens
+    assert sorted(seeds) == producers.tokens()
+
+
+def test_search_effect_texts_can_skip_unproducible_effects(monkeypatch):
+    real = v5_data_mod.load_v5_data()
+    cats = dict(real.effect_categories)
+    cats["Смертельный яд для ксилофонов"] = {"kind": "raw", "tier": None, "tags": []}
+    patched = v5_data_mod.V5Data(
+        data_dir=real.data_dir,
+        ingredient_db=real.ingredient_db,
+        effect_categories=cats,
+        suppression_cfg=real.suppression_cfg,
+        suppression_mod=real.suppression_mod,
+    )
+    monkeypatch.setattr(v5_data_mod, "_CACHE", patched)
+
+    assert "Смертельный яд для ксилофонов" in v5_data_mod.search_effect_texts("ксилофон")
+    assert v5_data_mod.search_effect_texts("ксилофон", producible_only=True) == []
+    assert "Смертельный яд" in v5_data_mod.search_effect_texts("смертельный яд", producible_only=True)
@@ -0,0 +1,63 @@
+import shutil
+import threading
+
+import pytest
+
+from alchemy_tools import v5_data, v5_snapshot
+
+
+@pytest.fixture
+def pack_dir(tmp_path, monkeypatch):
+    source = v5_data.load_v5_data().data_dir
+    target = tmp_path / "pack"
+    target.mkdir()
+    for name in v5_snapshot.SOURCE_FILES:
+        shutil.copy(source / name, target / name)
+    monkeypatch.setenv("ALCHEMY_DATA_DIR", str(target))
+    monkeypatch.setattr(v5_data, "_CACHE", None)
+    monkeypatch.setattr(v5_data, "_FINGERPRINT", None)
+    return target
+
+
+def _touch(pack_dir):
+    rules = pack_dir / "suppression_rules_v5.json"
+    rules.write_text(rules.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+
+
+def test_reload_swaps_pack_only_when_files_change(pack_dir):
+    old = v5_data.load_v5_data()
+    assert old.data_dir == pack_dir
+    assert v5_data.reload_v5_data() is False
+    assert v5_data.load_v5_data() is old
+
+    _touch(pack_dir)
+    with v5_data.pinned_v5_data() as pinned:
+        assert v5_data.reload_v5_data() is True
+        # In-flight work keeps the pack it started with.
+        assert v5_data.load_v5_data() is pinned is old
+
+    new = v5_data.load_v5_data()
+    assert new is not old and new.version > old.version
+    # Derived tables are built before the swap and not shared with the old pack.
+    assert set(new.derived) >= {"effect_text_index", "recipe_tokens"}
+    assert new.derived is not old.derived
+    assert v5_data.search_effect_texts("яд") == v5_data.get_effect_text_index(old).search("яд")
+
+
+def test_concurrent_first_load_builds_the_pack_once(pack_dir, monkeypatch):
+    calls = []
+    load = v5_data._load_v5_pack
+
+    def counting_load(data_dir):
+        calls.append(data_dir)
+        return load(data_dir)
+
+    monkeypatch.setattr(v5_data, "_load_v5_pack", counting_load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(v5_data.load_v5_data())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(v5 is results[0] for v5 in results)
@@ -0,0 +1,44 @@
+import shutil
+
+import pytest
+
+from alchemy_tools import v5_data, v5_snapshot
+from alchemy_tools.v5_recipe_search import get_token_table
+
+
+@pytest.fixture
+def pack_dir(tmp_path, monkeypatch):
+    source = v5_data.load_v5_data().data_dir
+    target = tmp_path / "pack"
+    target.mkdir()
+    for name in v5_snapshot.SOURCE_FILES:
+        shutil.copy(source / name, target / name)
+    monkeypatch.setenv("ALCHEMY_DATA_DIR", str(target))
+    monkeypatch.setattr(v5_data, "_CACHE", None)
+    return target
+
+
+def test_snapshot_round_trip(pack_dir):
+    source = v5_data.load_v5_pack_from_sources(pack_dir)
+    path = v5_snapshot.write_snapshot(source)
+    assert path == pack_dir / v5_snapshot.SNAPSHOT_NAME
+
+    loaded = v5_data.load_v5_data()
+    assert loaded.ingredient_db == source.ingredient_db
+    assert loaded.effect_categories == source.effect_categories
+    assert loaded.suppression_cfg == source.suppression_cfg
+    # Derived tables come from the snapshot instead of being rebuilt.
+    assert set(loaded.derived) >= {"effect_text_index", "recipe_tokens"}
+    assert get_token_table(loaded) == get_token_table(source)
+    assert v5_data.search_effect_texts("яд") == v5_data.get_effect_text_index(source).search("яд")
+
+
+def test_stale_or_broken_snapshot_falls_back_to_sources(pack_dir):
+    v5_snapshot.write_snapshot(v5_data.load_v5_pack_from_sources(pack_dir))
+    rules = pack_dir / "suppression_rules_v5.json"
+    rules.write_text(rules.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    assert v5_snapshot.read_snapshot(pack_dir) is None
+    assert "recipe_tokens" not in v5_data.load_v5_data().derived
+
+    (pack_dir / v5_snapshot.SNAPSHOT_NAME).write_bytes(b"garbage")
+    assert v5_snapshot.read_snapshot(pack_dir) is None
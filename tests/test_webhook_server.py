@@ -0,0 +1,146 @@
+import asyncio
+import json
+import socket
+from urllib.parse import parse_qs
+
+import httpx
+from telegram.ext import ApplicationBuilder, CommandHandler
+
+from alchemy_tools.webhook_server import SECRET_HEADER, WebhookConfig, WebhookServer, serve_webhook
+
+BOT = {"id": 1, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "U"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+async def _fake_telegram(calls):
+    """Bot API stand-in answering getMe, setWebhook and sendMessage."""
+
+    async def serve(reader, writer):
+        request_line = await reader.readline()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        method = request_line.split()[1].decode().rsplit("/", 1)[-1]
+        params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        calls.append((method, params))
+        result = {"getMe": BOT, "setWebhook": True}.get(
+            method, {"message_id": 2, "date": 0, "chat": {"id": 5, "type": "private"}, "text": params.get("text")}
+        )
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(serve, "127.0.0.1", 0)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.02)
+
+
+def test_webhook_updates_reach_handlers_only_with_the_secret():
+    async def scenario():
+        calls = []
+        api = await _fake_telegram(calls)
+        api_port = api.sockets[0].getsockname()[1]
+
+        async def start(update, context):
+            await update.message.reply_text("pong")
+
+        application = (
+            ApplicationBuilder()
+            .token("123:TEST")
+            .base_url(f"http://127.0.0.1:{api_port}/bot")
+            .updater(None)
+            .build()
+        )
+        application.add_handler(CommandHandler("start", start))
+        config = WebhookConfig(
+            url="https://bot.example.org/hook", secret_token="s3cret", listen="127.0.0.1", port=_free_port()
+        )
+        stop = asyncio.Event()
+        task = asyncio.create_task(serve_webhook(application, config, stop))
+        url = f"http://127.0.0.1:{config.port}/hook"
+        try:
+            async with httpx.AsyncClient() as client:
+                for _ in range(100):
+                    try:
+                        response = await client.post(url, json=UPDATE, headers={SECRET_HEADER: "wrong"})
+                        break
+                    except httpx.ConnectError:
+                        await asyncio.sleep(0.05)
+                assert response.status_code == 403
+                assert (await client.get(url)).status_code == 405
+                assert (await client.post(url + "x", json=UPDATE)).status_code == 404
+                for body in (b"null", b"[1]", b"{", b'{"update_id": 2, "message": 5}'):
+                    response = await client.post(url, content=body, headers={SECRET_HEADER: "s3cret"})
+                    assert response.status_code == 400, body
+
+                response = await client.post(url, json=UPDATE, headers={SECRET_HEADER: "s3cret"})
+                assert response.status_code == 200
+                await _wait_for(lambda: any(method == "sendMessage" for method, _ in calls))
+        finally:
+            stop.set()
+            await task
+            api.close()
+
+        webhook = dict(calls)["setWebhook"]
+        assert webhook["url"] == config.url and webhook["secret_token"] == "s3cret"
+        assert [params["text"] for method, params in calls if method == "sendMessage"] == ["pong"]
+
+    asyncio.run(scenario())
+
+
+def test_webhook_config_from_env(monkeypatch):
+    monkeypatch.delenv("WEBHOOK_URL", raising=False)
+    assert WebhookConfig.from_env() is None
+    monkeypatch.setenv("WEBHOOK_URL", "https://bot.example.org/tg/hook")
+    monkeypatch.setenv("WEBHOOK_SECRET", "abc")
+    monkeypatch.setenv("WEBHOOK_MAX_CONNECTIONS", "10")
+    config = WebhookConfig.from_env()
+    assert (config.path, config.port, config.max_connections) == ("/tg/hook", 8443, 10)
+
+
+def test_connections_over_the_limit_are_refused():
+    async def scenario():
+        config = WebhookConfig(url="https://bot.example.org/hook", secret_token="s", listen="127.0.0.1", port=0,
+                               max_connections=1)
+        server = WebhookServer(None, config)
+        await server.start()
+        try:
+            _, first = await asyncio.open_connection("127.0.0.1", server.port)
+            await _wait_for(server._slots.locked)
+            reader, second = await asyncio.open_connection("127.0.0.1", server.port)
+            assert (await reader.readline()).startswith(b"HTTP/1.1 503")
+            second.close()
+            first.close()
+            await _wait_for(lambda: not server._slots.locked())
+        finally:
+            await server.stop()
+
+    asyncio.run(scenario())